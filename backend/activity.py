@@ -0,0 +1,184 @@
+# backend/activity.py
+"""
+Incrementally maintained lead_activity summary (counts, last touch, reply status).
+
+Every Message INSERT upserts its lead's row inside the same transaction, so the
+dashboard reads one row per lead instead of scanning threads. Drafts and ingested
+notes are not touches and are ignored. Backfill / repair with:
+
+    python activity.py --rebuild
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Sequence
+
+from sqlalchemy import case, event, func, select
+from sqlalchemy.engine import Connection
+
+from database import Lead, LeadActivity, Message
+
+ACTIVITY = LeadActivity.__table__
+IGNORED_STATUSES = ("draft",)
+IGNORED_CHANNELS = ("note",)
+
+
+def counts_as_touch(direction: str, channel: str, status: str) -> bool:
+    return status not in IGNORED_STATUSES and channel not in IGNORED_CHANNELS
+
+
+def _later(col, value):
+    """Greatest of a nullable timestamp column and a bound value."""
+    return case((col.is_(None), value), (col < value, value), else_=col)
+
+
+def _insert(conn: Connection):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(ACTIVITY)
+
+
+def record(conn: Connection, lead_id: int, direction: str, channel: str, created_at) -> None:
+    """Fold one message into its lead's summary with a single upsert (safe under concurrency)."""
+    inbound = direction == "inbound"
+    stmt = _insert(conn).values(
+        lead_id=lead_id,
+        inbound_count=1 if inbound else 0,
+        outbound_count=0 if inbound else 1,
+        last_touch_at=created_at,
+        last_channel=channel,
+        last_direction=direction,
+        last_inbound_at=created_at if inbound else None,
+        last_outbound_at=None if inbound else created_at,
+    )
+    c = ACTIVITY.c
+    newer = c.last_touch_at.is_(None) | (c.last_touch_at <= created_at)
+    last_col = c.last_inbound_at if inbound else c.last_outbound_at
+    set_ = {
+        "inbound_count": c.inbound_count + (1 if inbound else 0),
+        "outbound_count": c.outbound_count + (0 if inbound else 1),
+        "last_touch_at": _later(c.last_touch_at, created_at),
+        "last_channel": case((newer, channel), else_=c.last_channel),
+        "last_direction": case((newer, direction), else_=c.last_direction),
+        last_col.name: _later(last_col, created_at),
+    }
+    conn.execute(stmt.on_conflict_do_update(index_elements=[c.lead_id], set_=set_))
+
+
+@event.listens_for(Message, "after_insert")
+def _on_message_insert(mapper, connection, target: Message) -> None:
+    if counts_as_touch(target.direction, target.channel, target.status or ""):
+        record(connection, target.lead_id, target.direction, target.channel, target.created_at)
+
+
+# ── Backfill ──────────────────────────────────────────────────────────────────
+def rebuild(conn: Connection, lead_ids: Optional[Sequence[int]] = None) -> int:
+    """
+    Recompute summary rows from the messages table: all of them, or only `lead_ids`
+    (e.g. after messages moved between leads). Returns the number of rows written.
+    """
+    m = Message.__table__
+    touch = m.c.status.notin_(IGNORED_STATUSES) & m.c.channel.notin_(IGNORED_CHANNELS)
+    if lead_ids is not None:
+        touch = touch & m.c.lead_id.in_(lead_ids)
+
+    latest = (
+        select(m.c.lead_id, m.c.channel, m.c.direction,
+               func.row_number().over(partition_by=m.c.lead_id,
+                                      order_by=(m.c.created_at.desc(), m.c.id.desc())).label("rn"))
+        .where(touch)
+        .subquery()
+    )
+    agg = (
+        select(
+            m.c.lead_id,
+            func.sum(case((m.c.direction == "inbound", 1), else_=0)).label("inbound_count"),
+            func.sum(case((m.c.direction == "inbound", 0), else_=1)).label("outbound_count"),
+            func.max(m.c.created_at).label("last_touch_at"),
+            func.max(case((m.c.direction == "inbound", m.c.created_at))).label("last_inbound_at"),
+            func.max(case((m.c.direction == "inbound", None), else_=m.c.created_at)).label("last_outbound_at"),
+        )
+        .where(touch)
+        .group_by(m.c.lead_id)
+        .subquery()
+    )
+    rows = (
+        select(agg.c.lead_id, agg.c.inbound_count, agg.c.outbound_count, agg.c.last_touch_at,
+               latest.c.channel, latest.c.direction, agg.c.last_inbound_at, agg.c.last_outbound_at)
+        .join(latest, (latest.c.lead_id == agg.c.lead_id) & (latest.c.rn == 1))
+    )
+    scope = ACTIVITY.delete() if lead_ids is None else ACTIVITY.delete().where(ACTIVITY.c.lead_id.in_(lead_ids))
+    conn.execute(scope)
+    result = conn.execute(ACTIVITY.insert().from_select(
+        ["lead_id", "inbound_count", "outbound_count", "last_touch_at",
+         "last_channel", "last_direction", "last_inbound_at", "last_outbound_at"],
+        rows,
+    ))
+    if lead_ids is not None:
+        return result.rowcount
+    return conn.execute(select(func.count()).select_from(ACTIVITY)).scalar_one()
+
+
+def ensure(engine) -> None:
+    """Create the table if missing and backfill it (existing DBs predate the summary)."""
+    from sqlalchemy import inspect
+
+    insp = inspect(engine)
+    if insp.has_table(ACTIVITY.name) or not insp.has_table(Message.__tablename__):
+        return  # up to date, or a fresh DB whose tables init_db() will create together
+    ACTIVITY.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        n = rebuild(conn)
+    print(f"📊 lead_activity created and backfilled for {n} leads")
+
+
+# ── Aggregates ────────────────────────────────────────────────────────────────
+def stats(conn: Connection) -> Dict[str, Any]:
+    c = ACTIVITY.c
+    leads = conn.execute(select(
+        func.count(),
+        func.sum(case((Lead.enriched == "success", 1), else_=0)),
+    ).select_from(Lead)).one()
+    act = conn.execute(select(
+        func.count(),
+        func.coalesce(func.sum(c.inbound_count), 0),
+        func.coalesce(func.sum(c.outbound_count), 0),
+        func.sum(case((c.outbound_count > 0, 1), else_=0)),
+        func.sum(case(((c.last_outbound_at.isnot(None)) & (c.last_inbound_at >= c.last_outbound_at), 1), else_=0)),
+        func.sum(case(((c.last_outbound_at.isnot(None))
+                       & (c.last_inbound_at.is_(None) | (c.last_inbound_at < c.last_outbound_at)), 1), else_=0)),
+        func.max(c.last_touch_at),
+    )).one()
+    by_channel = dict(conn.execute(
+        select(c.last_channel, func.count()).group_by(c.last_channel)
+    ).all())
+    return {
+        "leads": leads[0],
+        "enriched": leads[1] or 0,
+        "active_leads": act[0],
+        "contacted": act[3] or 0,
+        "replied": act[4] or 0,
+        "awaiting_reply": act[5] or 0,
+        "messages": {"inbound": int(act[1]), "outbound": int(act[2])},
+        "last_channel": by_channel,
+        "last_touch_at": act[6].isoformat() if hasattr(act[6], "isoformat") else act[6],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine
+
+    ap = argparse.ArgumentParser(description="Backfill / repair the lead_activity summary table")
+    ap.add_argument("--rebuild", action="store_true", help="recompute all rows from messages")
+    args = ap.parse_args()
+    if args.rebuild:
+        ACTIVITY.create(engine, checkfirst=True)
+        with engine.begin() as conn:
+            n = rebuild(conn)
+        print(f"✅ lead_activity rebuilt for {n} leads")
+    else:
+        ap.print_help()
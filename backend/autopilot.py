@@ -0,0 +1,371 @@
+# backend/autopilot.py
+"""
+Autopilot follow-ups: the per-lead analysis behind POST /api/leads/{id}/followups/run,
+and a sweep that runs it over every lead due for a follow-up.
+
+A lead is due when something happened since autopilot last looked at it
+(lead_scores.signals_at) and either the prospect wrote last or our last touch
+has gone unanswered for SWEEP_DUE_AFTER_HOURS. Threads quiet for longer than
+SWEEP_MAX_AGE_DAYS are left alone.
+
+A sweep (nightly cron: `python autopilot.py --sweep`, or POST /api/followups/sweep)
+walks due leads in lead-id order, SWEEP_BATCH at a time:
+
+- one query picks the batch, one loads the leads, one windowed query their
+  last SWEEP_THREAD_LIMIT messages (no per-lead queries)
+- SWEEP_CONCURRENCY leads are analyzed at once; LLM calls run at batch priority
+- the drafts are upserted in bulk (drafts.py). Signals/scores and the checkpoint
+  (sweep_runs.last_lead_id) are written in the same transaction
+
+An interrupted sweep resumes from its checkpoint with the same cut-off. The
+batch that was in flight is redone; its drafts replace, never duplicate, the old ones.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Engine
+
+import body_store
+import drafts
+import llm_scheduler
+import metrics
+import scoring
+import shared_state
+from database import Lead, LeadActivity, LeadScore, Message, SweepRun, engine as default_engine
+from personalization import personalization_service
+from settings import settings
+
+SWEEP_BATCH = settings.sweep_batch
+SWEEP_CONCURRENCY = settings.sweep_concurrency
+SWEEP_DUE_AFTER_HOURS = settings.sweep_due_after_hours
+SWEEP_MAX_AGE_DAYS = settings.sweep_max_age_days
+SWEEP_THREAD_LIMIT = settings.sweep_thread_limit
+CALENDLY_URL = settings.calendly_url or settings.next_public_calendly_url
+
+PROFILE_FIELDS = ("name", "company", "job_title", "location", "industry", "company_size")
+LEADS = Lead.__table__
+MESSAGES = Message.__table__
+ACTIVITY = LeadActivity.__table__
+SCORES = LeadScore.__table__
+RUNS = SweepRun.__table__
+SWEEP_LOCK = "autopilot:sweep"
+SWEEP_LOCK_TTL_SEC = 600  # refreshed after every batch; a dead sweeper frees it after this
+
+SWEEP_LEADS = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_sweep_leads_total", "Leads processed by autopilot sweeps", ("outcome",),
+))
+SWEEP_BATCH_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "solisa_sweep_batch_seconds", "Duration of one autopilot sweep batch", (),
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120),
+))
+
+
+def ctx_key(lead_id: int) -> str:
+    """Shared-state key of a lead's latest ingested follow-up context."""
+    return f"followup_ctx:{lead_id}"
+
+
+def lead_profile(lead: Any) -> Dict[str, Any]:
+    """The lead fields personalization sees (ORM object or row mapping)."""
+    get = lead.get if isinstance(lead, dict) else (lambda f: getattr(lead, f, None))
+    return {f: get(f) for f in PROFILE_FIELDS}
+
+
+def thread_text(messages: Iterable[Any]) -> str:
+    """Messages (oldest first, objects or rows with direction/channel/subject/body) as prompt context."""
+    lines = []
+    for m in messages:
+        who = "Prospect" if m.direction == "inbound" else "Agent"
+        subj = f" subj={m.subject}" if getattr(m, "subject", None) else ""
+        lines.append(f"[{who} {m.channel.upper()}{subj}] {m.body}")
+    return "\n".join(lines)
+
+
+# ── Analysis ──────────────────────────────────────────────────────────────────
+@dataclass
+class Analysis:
+    lead_id: int
+    intent: str
+    objections: List[str]
+    context: str
+    sms: str
+    email_subject: str
+    email_body: str
+    plan: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def reasoning(self) -> str:
+        return f"Detected intent='{self.intent}' with objections={self.objections}. Drafting next-best actions."
+
+    def draft_rows(self, now: datetime) -> List[Dict[str, Any]]:
+        """The lead's new current drafts, as rows for drafts.upsert_many."""
+        return [
+            {"lead_id": self.lead_id, "direction": "outbound", "channel": "sms", "subject": None,
+             "body": self.sms, "status": "draft", "created_at": now},
+            {"lead_id": self.lead_id, "direction": "outbound", "channel": "email", "subject": self.email_subject,
+             "body": self.email_body, "status": "draft", "created_at": now},
+        ]
+
+
+async def analyze(lead_id: int, profile: Dict[str, Any], context: str,
+                  priority: str = llm_scheduler.AUTOPILOT) -> Analysis:
+    """Draft the next touch for one lead and read intent/objections from its context."""
+    with llm_scheduler.context(priority):
+        drafts = await personalization_service.generate_messages(profile)
+
+    email_body = drafts["email"]["body"]
+    if CALENDLY_URL and CALENDLY_URL not in email_body:
+        email_body = email_body.rstrip() + f"\n\nBook a time: {CALENDLY_URL}\n"
+
+    intent, objections = scoring.detect_signals(context)
+    email_meta = {"channel": "email", "calendly": CALENDLY_URL} if CALENDLY_URL else {"channel": "email"}
+    plan = [
+        {"action": "sms", "when": "now", "body": drafts["sms"], "meta": {"channel": "sms"}},
+        {"action": "email", "when": "now", "subject": drafts["email"]["subject"], "body": email_body,
+         "meta": email_meta},
+        {"action": "task", "when": "in_2h", "body": "Prep ROI one-pager and claims SLA, tailored to objections.",
+         "meta": {"assignee": "agent", "priority": "high"}},
+    ]
+    return Analysis(lead_id=lead_id, intent=intent, objections=objections, context=context,
+                    sms=drafts["sms"], email_subject=drafts["email"]["subject"], email_body=email_body, plan=plan)
+
+
+# ── Sweep: selection + prefetch ───────────────────────────────────────────────
+def due_condition(cutoff: datetime):
+    a, s = ACTIVITY.c, SCORES.c
+    return (
+        (a.last_touch_at >= cutoff - timedelta(days=SWEEP_MAX_AGE_DAYS))
+        & ((a.last_direction == "inbound") | (a.last_touch_at <= cutoff - timedelta(hours=SWEEP_DUE_AFTER_HOURS)))
+        & (s.signals_at.is_(None) | (s.signals_at < a.last_touch_at))
+    )
+
+
+def _due_query(cutoff: datetime):
+    """Due leads as one query over lead_activity (last_touch_at is indexed) + lead_scores."""
+    return (
+        select(ACTIVITY.c.lead_id)
+        .select_from(ACTIVITY.outerjoin(SCORES, SCORES.c.lead_id == ACTIVITY.c.lead_id))
+        .where(due_condition(cutoff))
+    )
+
+
+def count_due(conn, cutoff: Optional[datetime] = None) -> int:
+    q = _due_query(cutoff or datetime.utcnow()).subquery()
+    return conn.execute(select(func.count()).select_from(q)).scalar_one()
+
+
+def _threads(conn, lead_ids: Sequence[int], limit: int) -> Dict[int, List[Any]]:
+    """The last `limit` timeline messages of every lead in one windowed query, oldest first."""
+    c = MESSAGES.c
+    ranked = (
+        select(c.lead_id, c.direction, c.channel, c.subject, c.body, c.body_hash, c.created_at, c.id,
+               func.row_number().over(partition_by=c.lead_id,
+                                      order_by=(c.created_at.desc(), c.id.desc())).label("rn"))
+        .where(c.lead_id.in_(lead_ids))
+        .subquery()
+    )
+    rk = ranked.c
+    rows = conn.execute(
+        select(rk.lead_id, rk.direction, rk.channel, rk.subject,
+               body_store.text_of(rk.body, rk.body_hash).label("body"), rk.created_at, rk.id)
+        .where(rk.rn <= limit).order_by(rk.lead_id, rk.created_at, rk.id)
+    ).all()
+    out: Dict[int, List[Any]] = {}
+    for r in rows:
+        out.setdefault(r.lead_id, []).append(r)
+    return out
+
+
+def _load_batch(engine: Engine, cutoff: datetime, after_id: int, batch: int,
+                thread_limit: int) -> Tuple[int, List[Tuple[int, Dict[str, Any], str]]]:
+    """(last due lead id of the batch, [(lead_id, profile, context)]); (after_id, []) when none are left."""
+    with engine.connect() as conn:
+        ids = list(conn.execute(
+            _due_query(cutoff).where(ACTIVITY.c.lead_id > after_id).order_by(ACTIVITY.c.lead_id).limit(batch)
+        ).scalars())
+        if not ids:
+            return after_id, []
+        leads = {r.id: r._mapping for r in conn.execute(
+            select(LEADS.c.id, *(LEADS.c[f] for f in PROFILE_FIELDS)).where(LEADS.c.id.in_(ids))
+        ).all()}
+        threads = _threads(conn, ids, thread_limit)
+    ingested = shared_state.state.get_many(ctx_key(i) for i in ids)
+    out = []
+    for lead_id in ids:
+        if lead_id not in leads:
+            continue  # deleted since the due query ran
+        context = (ingested.get(ctx_key(lead_id)) or thread_text(threads.get(lead_id, ()))
+                   or "(no prior context)")
+        out.append((lead_id, lead_profile(dict(leads[lead_id])), context))
+    return ids[-1], out
+
+
+def _save_batch(engine: Engine, run_id: int, last_id: int, results: List[Analysis], failed: int) -> None:
+    """Drafts, signals + scores and the checkpoint, all in one transaction."""
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        rows = [row for a in results for row in a.draft_rows(now)]
+        drafts.upsert_many(conn, rows)
+        scoring.record_signals_many(conn, [(a.lead_id, a.intent, a.objections) for a in results])
+        conn.execute(update(RUNS).where(RUNS.c.id == run_id).values(
+            last_lead_id=last_id,
+            processed=RUNS.c.processed + len(results) + failed,
+            drafted=RUNS.c.drafted + len(rows),
+            failed=RUNS.c.failed + failed,
+            updated_at=now,
+        ))
+
+
+# ── Sweep: run ────────────────────────────────────────────────────────────────
+def _open_run(engine: Engine, resume: bool) -> Dict[str, Any]:
+    """The unfinished run to continue (if `resume`) or a new one."""
+    with engine.begin() as conn:
+        if resume:
+            row = conn.execute(
+                select(RUNS).where(RUNS.c.status != "done").order_by(RUNS.c.id.desc()).limit(1)
+            ).first()
+            if row is not None:
+                conn.execute(update(RUNS).where(RUNS.c.id == row.id).values(status="running", error=None))
+                return dict(row._mapping)
+        now = datetime.utcnow()
+        run_id = conn.execute(RUNS.insert().values(
+            status="running", cutoff=now, last_lead_id=0, processed=0, drafted=0, failed=0,
+            started_at=now, updated_at=now,
+        )).inserted_primary_key[0]
+        return {"id": run_id, "cutoff": now, "last_lead_id": 0}
+
+
+def _finish_run(engine: Engine, run_id: int, status: str, error: Optional[str] = None) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(update(RUNS).where(RUNS.c.id == run_id).values(
+            status=status, error=error, updated_at=now, finished_at=now if status == "done" else None,
+        ))
+        return dict(conn.execute(select(RUNS).where(RUNS.c.id == run_id)).one()._mapping)
+
+
+async def sweep(engine: Engine = default_engine, resume: bool = True, max_leads: Optional[int] = None,
+                batch: int = SWEEP_BATCH, concurrency: int = SWEEP_CONCURRENCY,
+                thread_limit: int = SWEEP_THREAD_LIMIT, stop: Optional[asyncio.Event] = None) -> Dict[str, Any]:
+    """
+    Run (or resume) a sweep. Returns the sweep_runs row. `max_leads` / `stop` end it
+    early after a whole batch; the run is then "stopped" (or "failed") and resumable.
+    """
+    if not shared_state.state.set(SWEEP_LOCK, datetime.utcnow().isoformat(), ttl=SWEEP_LOCK_TTL_SEC, nx=True):
+        raise RuntimeError("another autopilot sweep is running")
+    try:
+        run = await asyncio.to_thread(_open_run, engine, resume)
+    except BaseException:
+        shared_state.state.delete(SWEEP_LOCK)
+        raise
+    run_id, cutoff, last_id = run["id"], run["cutoff"], run["last_lead_id"]
+    print(f"🧹 Autopilot sweep #{run_id} {'resumed after lead ' + str(last_id) if last_id else 'started'}")
+    gate = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def one(lead_id: int, profile: Dict[str, Any], context: str) -> Optional[Analysis]:
+        async with gate:
+            try:
+                return await analyze(lead_id, profile, context, priority=llm_scheduler.BATCH)
+            except Exception as e:
+                print(f"⚠️ sweep: lead {lead_id} failed: {e}")
+                return None
+
+    try:
+        while (stop is None or not stop.is_set()) and (max_leads is None or done < max_leads):
+            t0 = time.perf_counter()
+            size = batch if max_leads is None else min(batch, max_leads - done)
+            batch_last, items = await asyncio.to_thread(_load_batch, engine, cutoff, last_id, size, thread_limit)
+            if batch_last == last_id:
+                return await asyncio.to_thread(_finish_run, engine, run_id, "done")
+            analyses = await asyncio.gather(*(one(*item) for item in items))
+            results = [a for a in analyses if a is not None]
+            failed = len(analyses) - len(results)
+            last_id = batch_last
+            await asyncio.to_thread(_save_batch, engine, run_id, last_id, results, failed)
+            shared_state.state.set(SWEEP_LOCK, datetime.utcnow().isoformat(), ttl=SWEEP_LOCK_TTL_SEC)
+            SWEEP_LEADS.inc("drafted", amount=len(results))
+            SWEEP_LEADS.inc("failed", amount=failed)
+            SWEEP_BATCH_SECONDS.observe(value=time.perf_counter() - t0)
+            done += len(items)
+        return await asyncio.to_thread(_finish_run, engine, run_id, "stopped")
+    except BaseException as e:
+        await asyncio.shield(asyncio.to_thread(_finish_run, engine, run_id, "failed", repr(e)))
+        raise
+    finally:
+        shared_state.state.delete(SWEEP_LOCK)
+
+
+def latest_run(conn) -> Optional[Dict[str, Any]]:
+    row = conn.execute(select(RUNS).order_by(RUNS.c.id.desc()).limit(1)).first()
+    return dict(row._mapping) if row is not None else None
+
+
+class Sweeper:
+    """Runs one sweep at a time as a background task of this worker (POST /api/followups/sweep)."""
+
+    def __init__(self, engine: Engine = default_engine):
+        self.engine = engine
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, resume: bool = True, max_leads: Optional[int] = None) -> bool:
+        """False if a sweep is already running in this worker."""
+        if self.running:
+            return False
+        self._stop = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(
+            self._run(resume, max_leads), name="autopilot-sweep")
+        return True
+
+    async def _run(self, resume: bool, max_leads: Optional[int]) -> None:
+        try:
+            result = await sweep(self.engine, resume=resume, max_leads=max_leads, stop=self._stop)
+            print(f"✅ Autopilot sweep #{result['id']} {result['status']}: {result['processed']} leads, "
+                  f"{result['drafted']} drafts, {result['failed']} failed")
+        except Exception as e:
+            print(f"⚠️ Autopilot sweep failed: {e}")
+
+    async def stop(self) -> None:
+        """Finish the batch in flight, then stop; the run resumes from its checkpoint next time."""
+        if not self.running:
+            return
+        self._stop.set()
+        await asyncio.wait([self._task])
+
+
+sweeper = Sweeper()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import init_db
+
+    ap = argparse.ArgumentParser(description="Autopilot follow-up sweep over all due leads")
+    ap.add_argument("--sweep", action="store_true", help="run (or resume) a sweep")
+    ap.add_argument("--fresh", action="store_true", help="start a new run instead of resuming an unfinished one")
+    ap.add_argument("--max-leads", type=int, default=None)
+    ap.add_argument("--due", action="store_true", help="only count leads due now")
+    args = ap.parse_args()
+    init_db()
+    if args.due:
+        with default_engine.connect() as conn:
+            print(f"{count_due(conn)} leads due for follow-up")
+    elif args.sweep:
+        result = asyncio.run(sweep(resume=not args.fresh, max_leads=args.max_leads))
+        print(f"✅ sweep #{result['id']} {result['status']}: {result['processed']} leads, "
+              f"{result['drafted']} drafts, {result['failed']} failed")
+    else:
+        ap.print_help()
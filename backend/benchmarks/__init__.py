@@ -0,0 +1 @@
+# backend/benchmarks — reproducible load/latency benchmarks (see run.py)
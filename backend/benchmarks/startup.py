@@ -0,0 +1,110 @@
+# backend/benchmarks/startup.py
+"""
+Cold-start benchmark: how long until a fresh worker can serve.
+
+Each run is a fresh interpreter (nothing cached in sys.modules) that measures
+  import   - `import main` (module graph only; no DB or network work)
+  startup  - the app lifespan (table checks, pool warm-up, background tasks)
+  first    - the first GET /api/leads after startup
+and reports the median over --runs, plus the slowest packages according to
+`python -X importtime`.
+
+    cd backend
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --budget-ms 1500     # exit 1 when import+startup is over budget
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+
+async def go():
+    import httpx
+    async with main.app.router.lifespan_context(main.app):
+        t2 = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            r = await client.get("/api/leads")
+        t3 = time.perf_counter()
+    return t2, t3, r.status_code
+
+t2, t3, status = asyncio.run(go())
+print("STARTUP_RESULT " + json.dumps({
+    "import": (t1 - t0) * 1000, "startup": (t2 - t1) * 1000, "first": (t3 - t2) * 1000, "status": status,
+}))
+"""
+
+
+def _env(db_url: str) -> Dict[str, str]:
+    env = dict(os.environ, DATABASE_URL=db_url)
+    env.setdefault("LLM_PROVIDER", "mock")
+    return env
+
+
+def probe(db_url: str) -> Dict[str, float]:
+    out = subprocess.run([sys.executable, "-c", _PROBE], cwd=BACKEND_DIR, env=_env(db_url),
+                         capture_output=True, text=True, check=True).stdout
+    line = next(l for l in out.splitlines() if l.startswith("STARTUP_RESULT "))
+    return json.loads(line.split(" ", 1)[1])
+
+
+def import_profile(db_url: str, top: int = 10) -> List[Tuple[str, float]]:
+    """Cumulative import time (ms) of the slowest packages pulled in by `main`."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                         env=_env(db_url), capture_output=True, text=True, check=True).stderr
+    totals: Dict[str, float] = {}
+    for line in err.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| +(\S+)", line)
+        if m and m.group(2) != "main":
+            # a package's outermost entry carries its whole cumulative cost
+            name = m.group(2).split(".")[0]
+            totals[name] = max(totals.get(name, 0.0), int(m.group(1)) / 1000.0)
+    return sorted(totals.items(), key=lambda kv: -kv[1])[:top]
+
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Solisa API cold-start benchmark")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--db", default="", help="SQLAlchemy URL (default: a temp SQLite file)")
+    ap.add_argument("--budget-ms", type=float, default=0.0, help="fail if median import+startup exceeds this")
+    ap.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = args.db or f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        probe(db_url)  # first run creates the schema and compiles bytecode; not counted
+        runs = [probe(db_url) for _ in range(args.runs)]
+        profile = import_profile(db_url, args.top)
+
+    med = {k: statistics.median(r[k] for r in runs) for k in ("import", "startup", "first")}
+    print(f"import  p50={med['import']:>8.1f}ms")
+    print(f"startup p50={med['startup']:>8.1f}ms")
+    print(f"first   p50={med['first']:>8.1f}ms  (GET /api/leads -> {runs[-1]['status']})")
+    print("slowest imports:")
+    for name, ms in profile:
+        print(f"  {name:<24} {ms:>8.1f}ms")
+
+    total = med["import"] + med["startup"]
+    if args.budget_ms and total > args.budget_ms:
+        print(f"❌ import+startup {total:.0f}ms is over the {args.budget_ms:.0f}ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,23 @@
+# backend/benchmarks/stubs.py
+"""
+Point the app's LLM clients at the local mock provider (see mock_llm.py).
+
+The real PersonalizationService code path (prompts, parsing, metrics) still runs;
+only the network round-trip is replaced by a seeded, latency-configurable stand-in.
+"""
+
+from __future__ import annotations
+
+from mock_llm import MockAsyncOpenAI, MockLLM, MockLLMConfig, MockOpenAI
+
+
+def install(config: MockLLMConfig) -> MockLLM:
+    """Must run after importing main. Returns the shared MockLLM (for its stats)."""
+    import followup_agent
+    from personalization import personalization_service
+
+    llm = MockLLM(config)
+    personalization_service.client = MockAsyncOpenAI(llm)
+    personalization_service.has_api_key = True
+    followup_agent.client = MockOpenAI(llm)
+    return llm
@@ -0,0 +1,287 @@
+# backend/body_store.py
+"""
+Content-addressed storage for message bodies (opt-in: BODY_STORE_ENABLED=true).
+
+Outbound text repeats a lot: mock templates, identical drafts, the same sequence
+step sent to many leads. With the store on, a body of BODY_STORE_MIN_BYTES or more
+is saved once in message_bodies under its hash, and the messages row keeps only the
+reference (`body_hash`, `body = ''`). Shorter bodies stay inline: the reference
+would cost about as much.
+
+- SQLite: bodies above BODY_STORE_COMPRESS_BYTES are zlib-compressed. Postgres keeps
+  plain text, which TOAST already compresses above ~2 KB, so search stays in SQL
+- reading is transparent: ORM `Message.body` is resolved on load and after flush;
+  core queries select `text_of(c.body, c.body_hash)`. Full-text search indexes the
+  resolved text (search.py)
+- `python body_store.py --migrate` converts existing rows in resumable chunks,
+  `--gc` drops bodies no message references any more, `--stats` reports sizes
+
+Turning the store off only stops new writes; stored bodies keep being read.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import Text, bindparam, case, delete, event, exists, func, inspect, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import column_property
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql.functions import FunctionElement
+
+from database import Message, MessageBody
+from settings import settings
+
+BODY_STORE_ENABLED = settings.body_store_enabled
+BODY_STORE_MIN_BYTES = settings.body_store_min_bytes
+BODY_STORE_COMPRESS_BYTES = settings.body_store_compress_bytes
+
+MESSAGES = Message.__table__
+BODIES = MessageBody.__table__
+
+GC_GRACE = timedelta(days=1)     # unreferenced bodies younger than this are kept (a writer may be mid-transaction)
+TOUCH_AFTER = timedelta(hours=1)  # reusing an older body refreshes its seen_at, so gc never races a writer
+
+
+def body_hash(body: str) -> str:
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]
+
+
+def _insert(conn: Connection, table):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+# ── Reading ───────────────────────────────────────────────────────────────────
+class _inflate(FunctionElement):
+    """inflate(body_z): SQLite function registered by database.py; Postgres never compresses."""
+    type = Text()
+    inherit_cache = True
+
+
+@compiles(_inflate)
+def _inflate_default(element, compiler, **kw):
+    return "NULL"
+
+
+@compiles(_inflate, "sqlite")
+def _inflate_sqlite(element, compiler, **kw):
+    return f"inflate({compiler.process(element.clauses, **kw)})"
+
+
+def text_of(body, hash_):
+    """SQL expression for a message's text, given its body and body_hash columns."""
+    b = BODIES.c
+    stored = select(func.coalesce(b.body, _inflate(b.body_z))).where(b.hash == hash_).scalar_subquery()
+    return case((hash_.is_(None), body), else_=stored)
+
+
+def columns(table, names: Sequence[str]) -> List[Any]:
+    """`table.c[name] for name in names`, with "body" resolved (labelled "body")."""
+    return [text_of(table.c.body, table.c.body_hash).label("body") if n == "body" else table.c[n] for n in names]
+
+
+# ── Writing ───────────────────────────────────────────────────────────────────
+def _row(body: str, h: str, compress: bool, now: datetime) -> Dict[str, Any]:
+    data = body.encode("utf-8")
+    if compress and len(data) > BODY_STORE_COMPRESS_BYTES:
+        return {"hash": h, "size": len(data), "body": None, "body_z": zlib.compress(data), "seen_at": now}
+    return {"hash": h, "size": len(data), "body": body, "body_z": None, "seen_at": now}
+
+
+def put_many(conn: Connection, bodies: Iterable[str]) -> Dict[str, str]:
+    """Store each distinct body once. Returns {body: hash}."""
+    hashes = {b: body_hash(b) for b in bodies}
+    if not hashes:
+        return hashes
+    now = datetime.utcnow()
+    compress = conn.dialect.name == "sqlite"
+    stmt = _insert(conn, BODIES)
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[BODIES.c.hash],
+            set_={"seen_at": stmt.excluded.seen_at},
+            where=BODIES.c.seen_at < now - TOUCH_AFTER,
+        ),
+        [_row(b, h, compress, now) for b, h in hashes.items()],
+    )
+    return hashes
+
+
+def _storable(body: Optional[str]) -> bool:
+    return body is not None and len(body.encode("utf-8")) >= BODY_STORE_MIN_BYTES
+
+
+def externalize(conn: Connection, rows: Sequence[Dict[str, Any]], body_key: str = "body",
+                hash_key: str = "body_hash") -> Sequence[Dict[str, Any]]:
+    """
+    For core inserts/updates of messages: move qualifying bodies into the store,
+    in place (`body` -> '', `body_hash` set). Every row gets the hash key, so
+    executemany sees uniform parameters.
+    """
+    for row in rows:
+        row[hash_key] = None
+    if not BODY_STORE_ENABLED:
+        return rows
+    hashes = put_many(conn, {r[body_key] for r in rows if _storable(r[body_key])})
+    for row in rows:
+        h = hashes.get(row[body_key])
+        if h is not None:
+            row[body_key], row[hash_key] = "", h
+    return rows
+
+
+# ── ORM ───────────────────────────────────────────────────────────────────────
+# Message.body holds the text on loaded and flushed instances; only the row is ''
+Message.stored_body = column_property(text_of(MESSAGES.c.body, MESSAGES.c.body_hash), deferred=False)
+
+
+@event.listens_for(Message, "load")
+def _on_load(target, context):
+    if target.body_hash is not None:
+        set_committed_value(target, "body", target.stored_body)
+
+
+@event.listens_for(Message, "refresh")
+def _on_refresh(target, context, attrs):
+    if target.body_hash is not None and (attrs is None or "body" in attrs or "stored_body" in attrs):
+        set_committed_value(target, "body", target.stored_body)
+
+
+@event.listens_for(Message, "before_insert")
+@event.listens_for(Message, "before_update")
+def _before_write(mapper, connection, target):
+    hist = inspect(target).attrs.body.history
+    if target.id is not None and not hist.has_changes():
+        return  # an update that leaves the text alone
+    body = target.body
+    if BODY_STORE_ENABLED and _storable(body):
+        target.body_hash = put_many(connection, [body])[body]
+        target.body = ""
+        target._flushed_body = body
+    elif target.body_hash is not None:
+        target.body_hash = None  # new inline text replaces a stored one
+
+
+@event.listens_for(Message, "after_insert")
+@event.listens_for(Message, "after_update")
+def _after_write(mapper, connection, target):
+    body = target.__dict__.pop("_flushed_body", None)
+    if body is not None:
+        set_committed_value(target, "body", body)
+        set_committed_value(target, "stored_body", body)
+
+
+# ── Maintenance ───────────────────────────────────────────────────────────────
+def migrate(engine: Engine, chunk: int = 2000) -> int:
+    """Move inline bodies of existing messages into the store. Resumable; returns rows converted."""
+    c = MESSAGES.c
+    last_id, moved = 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(c.id, c.body).where(c.body_hash.is_(None), c.id > last_id).order_by(c.id).limit(chunk)
+            ).all()
+            if not rows:
+                return moved
+            last_id = rows[-1].id
+            todo = [r for r in rows if _storable(r.body)]
+            hashes = put_many(conn, {r.body for r in todo})
+            if todo:
+                conn.execute(
+                    update(MESSAGES).where(c.id == bindparam("mid")).values(body="", body_hash=bindparam("h")),
+                    [{"mid": r.id, "h": hashes[r.body]} for r in todo],
+                )
+            moved += len(todo)
+
+
+def gc(engine: Engine) -> int:
+    """Delete bodies no message references (older than GC_GRACE). Returns how many."""
+    b = BODIES.c
+    with engine.begin() as conn:
+        return conn.execute(
+            delete(BODIES).where(
+                b.seen_at < datetime.utcnow() - GC_GRACE,
+                ~exists().where(MESSAGES.c.body_hash == b.hash),
+            )
+        ).rowcount
+
+
+def stats(conn: Connection) -> Dict[str, Any]:
+    c, b = MESSAGES.c, BODIES.c
+    inline = conn.execute(select(func.count(), func.coalesce(func.sum(func.length(c.body)), 0))
+                          .where(c.body_hash.is_(None))).one()
+    refs = conn.execute(select(func.count()).where(c.body_hash.isnot(None))).scalar_one()
+    logical = conn.execute(
+        select(func.coalesce(func.sum(b.size), 0)).select_from(MESSAGES.join(BODIES, b.hash == c.body_hash))
+    ).scalar_one()
+    bodies = conn.execute(select(
+        func.count(),
+        func.coalesce(func.sum(b.size), 0),
+        func.coalesce(func.sum(func.coalesce(func.length(b.body_z), func.length(b.body))), 0),
+        func.count(b.body_z),
+    )).one()
+    return {
+        "enabled": BODY_STORE_ENABLED,
+        "inline_messages": inline[0],
+        "inline_chars": int(inline[1]),
+        "stored_messages": refs,
+        "stored_text_bytes": int(logical),   # what the stored messages would take inline
+        "distinct_bodies": bodies[0],
+        "distinct_bytes": int(bodies[1]),
+        "compressed_bodies": bodies[3],
+        "on_disk_bytes": int(bodies[2]),     # compressed size where compressed (before row/TOAST overhead)
+        "dedup_ratio": round(logical / bodies[2], 2) if bodies[2] else None,
+    }
+
+
+def ensure(engine: Engine) -> None:
+    """
+    Add message_bodies and messages.body_hash to databases that predate the store
+    (fresh ones get them from init_db()). Runs before the other ensure steps: every
+    read of a message body goes through message_bodies.
+    """
+    from sqlalchemy import text
+
+    insp = inspect(engine)
+    if not insp.has_table(MESSAGES.name):
+        return
+    BODIES.create(engine, checkfirst=True)
+    if any(col["name"] == "body_hash" for col in insp.get_columns(MESSAGES.name)):
+        return
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE messages ADD COLUMN body_hash VARCHAR(32)"))
+        conn.execute(text("CREATE INDEX ix_messages_body_hash ON messages (body_hash)"))
+    print("📦 messages.body_hash added (content-addressed bodies)")
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from database import engine, init_db
+
+    ap = argparse.ArgumentParser(description="Content-addressed message body storage")
+    ap.add_argument("--migrate", action="store_true", help="move existing inline bodies into the store")
+    ap.add_argument("--gc", action="store_true", help="delete bodies no message references")
+    ap.add_argument("--stats", action="store_true", help="print storage statistics")
+    args = ap.parse_args()
+    ensure(engine)
+    init_db()
+    if args.migrate:
+        n = migrate(engine)
+        print(f"{n} message bodies moved to message_bodies")
+        if engine.dialect.name == "sqlite":
+            print("run VACUUM to return the freed pages to the filesystem")
+    if args.gc:
+        print(f"{gc(engine)} unreferenced bodies deleted")
+    if args.stats or not (args.migrate or args.gc):
+        with engine.connect() as conn:
+            print(json.dumps(stats(conn), indent=2))
@@ -0,0 +1,247 @@
+# backend/copy_reuse.py
+"""
+Reuse generated copy across look-alike leads (opt-in: COPY_REUSE_ENABLED=true).
+
+Leads with the same title, industry and company size get nearly identical copy,
+yet each one paid for three completions. This keeps a local nearest-neighbour index
+over what the model saw, minus the fields that get swapped (name, company):
+
+- vectors: hashed word + character-trigram counts of the context string, DIM
+  buckets, TF-IDF weighted and L2-normalised, in one NumPy matrix. A lookup is one
+  matrix-vector product. IDF drifts as entries arrive, so stored rows are
+  re-weighted once REWEIGHT_AFTER of them were added since the last pass
+- entries: the last COPY_REUSE_MAX_ENTRIES generations per space (ring buffer): a
+  space is the model plus the prompt template keys (prompts.cache_space), so a
+  template edit or version bump starts from an empty space
+- a lead within COPY_REUSE_THRESHOLD cosine similarity of an entry gets that
+  entry's copy with name and company swapped, instead of an LLM call
+
+Quality guards reject an adaptation when the target lacks a field the copy relied
+on (company), when any of the source lead's details survive the swap (last name,
+company, email, a different location), or when a length limit breaks. Rejections
+fall through to the LLM and are counted by reason (GET /api/ops/copy-reuse,
+solisa_copy_reuse_total).
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import zlib
+from collections import Counter as _Tally
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from settings import settings
+
+COPY_REUSE_ENABLED = settings.copy_reuse_enabled
+COPY_REUSE_THRESHOLD = settings.copy_reuse_threshold
+COPY_REUSE_MAX_ENTRIES = settings.copy_reuse_max_entries
+
+DIM = 1024             # hashed feature buckets
+REWEIGHT_AFTER = 0.25  # re-apply IDF to all rows after this fraction of them changed
+LIMITS = {"sms": 160, "linkedin": 200}  # the prompts' length caps
+
+REUSE = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_copy_reuse_total", "Look-alike copy lookups by outcome (hit | miss | rejected)", ("outcome",),
+))
+GUARD = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_copy_reuse_rejected_total", "Adaptations rejected by a quality guard", ("reason",),
+))
+SIMILARITY = metrics.REGISTRY.register(metrics.Histogram(
+    "solisa_copy_reuse_similarity", "Best cosine similarity per lookup", (),
+    buckets=(0.5, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0),
+))
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+# ── Vectors ───────────────────────────────────────────────────────────────────
+def features(context: str) -> np.ndarray:
+    """Hashed term counts: words plus character trigrams (robust to "VP Sales" / "VP, Sales")."""
+    text = context.lower()
+    grams = [f"w:{w}" for w in _WORD.findall(text)]
+    squashed = " ".join(_WORD.findall(text))
+    grams += [f"c:{squashed[i:i + 3]}" for i in range(len(squashed) - 2)]
+    vec = np.zeros(DIM, dtype=np.float32)
+    np.add.at(vec, [zlib.crc32(g.encode("utf-8")) % DIM for g in grams], 1.0)
+    return vec
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.where(norms == 0, 1.0, norms)
+
+
+# ── Adaptation ────────────────────────────────────────────────────────────────
+def _first(name: Optional[str]) -> str:
+    return name.split()[0] if name else "there"
+
+
+def _swap(text: str, old: str, new: str) -> str:
+    return re.sub(rf"(?<!\w){re.escape(old)}(?!\w)", lambda _: new, text)
+
+
+def _contains(text: str, needle: str) -> bool:
+    return re.search(rf"(?<!\w){re.escape(needle)}(?!\w)", text, re.IGNORECASE) is not None
+
+
+@dataclass
+class Entry:
+    lead: Dict[str, Any]
+    messages: Dict[str, Any]  # generate_messages() shape: sms, email{subject, body}, linkedin
+
+
+def adapt(entry: Entry, lead: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """(messages for `lead`, None), or (None, reason) when a quality guard rejects it."""
+    src = entry.lead
+    if src.get("company") and not lead.get("company"):
+        return None, "missing_company"
+    swaps = []
+    if src.get("name"):
+        swaps += [(src["name"], lead.get("name") or "there"), (_first(src["name"]), _first(lead.get("name")))]
+    if src.get("company"):
+        swaps.append((src["company"], lead["company"]))
+
+    def apply(text: str) -> str:
+        for old, new in swaps:
+            if old != new:
+                text = _swap(text, old, new)
+        return text
+
+    out = {
+        "sms": apply(entry.messages["sms"]),
+        "email": {k: apply(v) for k, v in entry.messages["email"].items()},
+        "linkedin": apply(entry.messages["linkedin"]),
+    }
+
+    # nothing of the source lead may survive (the target's own values are masked first)
+    leftovers = [v for v in ((src.get("name") or "").split() + [src.get("company"), src.get("email")]) if v]
+    if src.get("location") and src.get("location") != lead.get("location"):
+        leftovers.append(src["location"])
+    mine = [v for v in ((lead.get("name") or "").split() + [lead.get("company"), lead.get("email"),
+                                                             lead.get("location")]) if v]
+    for text in (out["sms"], out["email"]["subject"], out["email"]["body"], out["linkedin"]):
+        for v in mine:
+            text = _swap(text, v, "\x00")
+        if any(_contains(text, v) for v in leftovers if v not in mine):
+            return None, "source_detail_left"
+    for artifact, limit in LIMITS.items():
+        if len(out[artifact]) > limit >= len(entry.messages[artifact]):
+            return None, f"{artifact}_too_long"
+    return out, None
+
+
+# ── Index ─────────────────────────────────────────────────────────────────────
+@dataclass
+class _Space:
+    """One space's entries. Rows [:len(entries)] of the matrices are in use."""
+    tf: np.ndarray = field(default_factory=lambda: np.zeros((0, DIM), dtype=np.float32))    # raw counts
+    vecs: np.ndarray = field(default_factory=lambda: np.zeros((0, DIM), dtype=np.float32))  # TF-IDF, unit length
+    df: np.ndarray = field(default_factory=lambda: np.zeros(DIM, dtype=np.float64))
+    entries: List[Entry] = field(default_factory=list)
+    next: int = 0   # ring position once full
+    dirty: int = 0  # rows written since the last re-weighting
+
+    def idf(self) -> np.ndarray:
+        return (np.log((1.0 + len(self.entries)) / (1.0 + self.df)) + 1.0).astype(np.float32)
+
+    def grow(self, capacity: int) -> None:
+        rows = min(capacity, max(64, 2 * len(self.tf)))
+        for name in ("tf", "vecs"):
+            grown = np.zeros((rows, DIM), dtype=np.float32)
+            grown[:len(getattr(self, name))] = getattr(self, name)
+            setattr(self, name, grown)
+
+
+class CopyIndex:
+    """Bounded TF-IDF nearest-neighbour index of generated copy, one space per model + prompt versions."""
+
+    def __init__(self, capacity: int = COPY_REUSE_MAX_ENTRIES, threshold: float = COPY_REUSE_THRESHOLD):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._spaces: Dict[str, _Space] = {}
+        self.outcomes: _Tally = _Tally()
+        self.rejected: _Tally = _Tally()
+        self._hit_similarity = 0.0
+
+    def lookup(self, lead: Dict[str, Any], context: str, space_key: str) -> Optional[Dict[str, Any]]:
+        """Adapted copy of the most similar entry, or None (miss / rejected)."""
+        q = features(context)
+        best, entry = 0.0, None
+        with self._lock:
+            space = self._spaces.get(space_key)
+            if space is not None and space.entries:
+                sims = space.vecs[:len(space.entries)] @ _normalize(q * space.idf())
+                i = int(np.argmax(sims))
+                best, entry = float(sims[i]), space.entries[i]
+        SIMILARITY.observe(value=best)
+        if entry is None or best < self.threshold:
+            self._count("miss")
+            return None
+        messages, reason = adapt(entry, lead)
+        if messages is None:
+            GUARD.inc(reason)
+            self.rejected[reason] += 1
+            self._count("rejected")
+            return None
+        self._hit_similarity += best
+        self._count("hit")
+        return dict(messages, reused={"similarity": round(best, 4)})
+
+    def _count(self, outcome: str) -> None:
+        REUSE.inc(outcome)
+        self.outcomes[outcome] += 1
+
+    def add(self, lead: Dict[str, Any], context: str, space_key: str, messages: Dict[str, Any]) -> None:
+        tf = features(context)
+        entry = Entry(lead=dict(lead), messages={"sms": messages["sms"], "email": dict(messages["email"]),
+                                                 "linkedin": messages["linkedin"]})
+        with self._lock:
+            space = self._spaces.setdefault(space_key, _Space())
+            n = len(space.entries)
+            if n < self.capacity:
+                if n == len(space.tf):
+                    space.grow(self.capacity)
+                space.entries.append(entry)
+                i = n
+            else:  # full: overwrite the oldest
+                i = space.next
+                space.df -= space.tf[i] > 0
+                space.entries[i] = entry
+                space.next = (i + 1) % self.capacity
+            space.tf[i] = tf
+            space.df += tf > 0
+            space.dirty += 1
+            size = len(space.entries)
+            if space.dirty >= REWEIGHT_AFTER * size:
+                space.vecs[:size] = _normalize(space.tf[:size] * space.idf())
+                space.dirty = 0
+            else:
+                space.vecs[i] = _normalize(tf * space.idf())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spaces.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = sum(self.outcomes.values())
+        hits = self.outcomes["hit"]
+        return {
+            "enabled": COPY_REUSE_ENABLED,
+            "threshold": self.threshold,
+            "entries": {key: len(s.entries) for key, s in self._spaces.items()},
+            "lookups": lookups,
+            "hits": hits,
+            "misses": self.outcomes["miss"],
+            "rejected": dict(self.rejected),
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "avg_hit_similarity": round(self._hit_similarity / hits, 4) if hits else None,
+        }
+
+
+index = CopyIndex()
@@ -1,36 +1,61 @@
 # backend/database.py
-import os
+import zlib
 from datetime import datetime
 from typing import Generator, Optional
 
-from dotenv import load_dotenv
 from sqlalchemy import (
     create_engine,
+    event,
     Column,
     Integer,
     String,
     DateTime,
+    Float,
     ForeignKey,
+    Index,
+    LargeBinary,
     Text,
+    UniqueConstraint,
+    text,
 )
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session
 
-# Load env (DATABASE_URL, etc.)
-load_dotenv()
+import metrics
+import profiling
+import search
+from settings import settings
+
+# Postgres recommended; SQLite fallback for local dev
+DATABASE_URL = settings.database_url
+# read replicas (comma-separated URLs); db_router.py sends read-only handlers there
+DATABASE_REPLICA_URLS = [u.strip() for u in settings.database_replica_urls.split(",") if u.strip()]
+
+
+def _sqlite_functions(dbapi_conn, _record):
+    # zlib-compressed message_bodies rows (body_store.py) stay readable from SQL:
+    # the search triggers and views call inflate(). Postgres keeps plain text there.
+    dbapi_conn.create_function("inflate", 1, lambda b: None if b is None else zlib.decompress(b).decode("utf-8"),
+                               deterministic=True)
+
+
+def make_engine(url: str, **kw):
+    if url.startswith("sqlite"):
+        eng = create_engine(url, connect_args={"check_same_thread": False}, **kw)
+        event.listen(eng, "connect", _sqlite_functions)
+    else:
+        eng = create_engine(url, **kw)
+    metrics.instrument_engine(eng)
+    profiling.instrument_engine(eng)
+    return eng
 
-DATABASE_URL = os.getenv(
-    "DATABASE_URL",
-    "sqlite:///./aegis.db",  # fallback for local dev if Postgres not set
-)
 
 # Engine + Session
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-else:
-    engine = create_engine(DATABASE_URL)
+engine = make_engine(DATABASE_URL)
+replica_engines = [make_engine(url, pool_pre_ping=True) for url in DATABASE_REPLICA_URLS]
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+search.install(Base.metadata)  # FTS tables/triggers (SQLite) or tsvector+GIN (Postgres)
 
 
 # --------------------------
@@ -57,6 +82,11 @@ class Lead(Base):
     enriched = Column(String, default="pending")  # pending, success, failed
     enriched_at = Column(DateTime, nullable=True)
 
+    # Plain counter, +1 in SQL on every UPDATE that does not set it (no optimistic
+    # locking: concurrent updates both apply); lead_cache.py ETags
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=text("version + 1"))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
     # Relationships
     messages = relationship("Message", back_populates="lead", cascade="all, delete-orphan")
 
@@ -76,18 +106,26 @@ class Lead(Base):
             "industry": self.industry,
             "enriched": self.enriched,
             "enriched_at": self.enriched_at.isoformat() if self.enriched_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # at most one current draft per lead + channel; drafts.py upserts into it and
+        # moves the text it replaces to message_draft_versions
+        Index("uq_messages_current_draft", "lead_id", "channel", unique=True,
+              sqlite_where=text("status = 'draft'"), postgresql_where=text("status = 'draft'")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), index=True, nullable=False)
     direction = Column(String, nullable=False)  # "outbound" | "inbound"
     channel = Column(String, nullable=False)    # "sms" | "email"
     subject = Column(String, nullable=True)     # emails only
-    body = Column(Text, nullable=False)
+    body = Column(Text, nullable=False)           # '' when the text lives in message_bodies
+    body_hash = Column(String(32), nullable=True, index=True)  # -> message_bodies.hash (body_store.py)
     provider_sid = Column(String, nullable=True)  # external id if any
     status = Column(String, default="queued")     # queued | sent | delivered | received | failed
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -108,6 +146,219 @@ class Message(Base):
         }
 
 
+class LeadActivity(Base):
+    """Denormalized per-lead message summary, maintained by activity.py on every Message insert."""
+    __tablename__ = "lead_activity"
+
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), primary_key=True)
+    inbound_count = Column(Integer, nullable=False, default=0)
+    outbound_count = Column(Integer, nullable=False, default=0)
+    last_touch_at = Column(DateTime, nullable=True, index=True)
+    last_channel = Column(String, nullable=True)
+    last_direction = Column(String, nullable=True)
+    last_inbound_at = Column(DateTime, nullable=True)
+    last_outbound_at = Column(DateTime, nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "inbound_count": self.inbound_count or 0,
+            "outbound_count": self.outbound_count or 0,
+            "last_touch_at": self.last_touch_at.isoformat() if self.last_touch_at else None,
+            "last_channel": self.last_channel,
+            "last_direction": self.last_direction,
+            "reply_status": reply_status(self.last_inbound_at, self.last_outbound_at),
+        }
+
+
+def reply_status(last_inbound_at: Optional[datetime], last_outbound_at: Optional[datetime]) -> str:
+    if last_outbound_at is None:
+        return "inbound_only" if last_inbound_at else "none"
+    if last_inbound_at is not None and last_inbound_at >= last_outbound_at:
+        return "replied"
+    return "awaiting_reply"
+
+
+class LeadScore(Base):
+    """Stored outreach priority (see scoring.py) plus the autopilot signals that feed it."""
+    __tablename__ = "lead_scores"
+
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=True, index=True)   # 0-100, NULL until first scored
+    intent = Column(String, nullable=True)            # ready_to_switch | considering | just_browsing | unknown
+    objections = Column(String, nullable=True)        # comma-separated, e.g. "price,claims"
+    signals_at = Column(DateTime, nullable=True)
+    scored_at = Column(DateTime, nullable=True)
+
+
+class LeadBlockKey(Base):
+    """Blocking index for near-duplicate detection: a few normalized keys per lead (see dedupe.py)."""
+    __tablename__ = "lead_block_keys"
+
+    key = Column(String, primary_key=True)   # "e:<email>" | "n:<name>" | "p:<phone>" | "d:<domain>:<surname>"
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
+class LeadDuplicate(Base):
+    """A likely duplicate pair found by the dedupe scan; `lead_id` is the older lead."""
+    __tablename__ = "lead_duplicates"
+    __table_args__ = (UniqueConstraint("lead_id", "duplicate_id"),)
+
+    id = Column(Integer, primary_key=True)
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False, index=True)
+    duplicate_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False, index=True)
+    score = Column(Float, nullable=False)
+    reasons = Column(String, nullable=True)        # comma-separated, e.g. "name,domain,email_alias"
+    status = Column(String, default="open")        # open | dismissed
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "lead_id": self.lead_id,
+            "duplicate_id": self.duplicate_id,
+            "score": self.score,
+            "reasons": self.reasons.split(",") if self.reasons else [],
+            "status": self.status,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class SweepRun(Base):
+    """One autopilot sweep over due leads, with its resume checkpoint (see autopilot.py)."""
+    __tablename__ = "sweep_runs"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String, nullable=False, default="running")  # running | done | stopped | failed
+    cutoff = Column(DateTime, nullable=False)        # "now" of the run; fixed across resumes
+    last_lead_id = Column(Integer, nullable=False, default=0)  # checkpoint: leads <= this are done
+    processed = Column(Integer, nullable=False, default=0)
+    drafted = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "cutoff": self.cutoff.isoformat() if self.cutoff else None,
+            "last_lead_id": self.last_lead_id,
+            "processed": self.processed,
+            "drafted": self.drafted,
+            "failed": self.failed,
+            "error": self.error,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class MessageDraftVersion(Base):
+    """A draft text that was replaced by a newer one (see drafts.py). One row per distinct text."""
+    __tablename__ = "message_draft_versions"
+    __table_args__ = (UniqueConstraint("lead_id", "channel", "content_hash"),)
+
+    id = Column(Integer, primary_key=True)
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False, index=True)
+    channel = Column(String, nullable=False)
+    content_hash = Column(String, nullable=False)
+    subject = Column(String, nullable=True)
+    body_z = Column(LargeBinary, nullable=False)  # zlib-compressed body
+    created_at = Column(DateTime, nullable=True)  # when this text was first drafted
+    superseded_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MessageBody(Base):
+    """Content-addressed message text (see body_store.py): each distinct body stored once."""
+    __tablename__ = "message_bodies"
+
+    hash = Column(String(32), primary_key=True)
+    size = Column(Integer, nullable=False)         # UTF-8 bytes of the text
+    body = Column(Text, nullable=True)             # plain text, or
+    body_z = Column(LargeBinary, nullable=True)    # zlib-compressed (SQLite, above BODY_STORE_COMPRESS_BYTES)
+    seen_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # last stored / reused; gc keeps recent ones
+
+
+class GenerationBatch(Base):
+    """One offline Batch API job: exported request file -> provider batch -> ingested drafts (see llm_batch.py)."""
+    __tablename__ = "generation_batches"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String, nullable=False, default="exported")  # exported | submitted | completed | ingested | failed
+    model = Column(String, nullable=False)
+    provider_batch_id = Column(String, nullable=True)
+    input_file_id = Column(String, nullable=True)
+    output_file_id = Column(String, nullable=True)
+    error_file_id = Column(String, nullable=True)
+    lead_count = Column(Integer, nullable=False, default=0)
+    request_count = Column(Integer, nullable=False, default=0)
+    drafted = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "model": self.model,
+            "provider_batch_id": self.provider_batch_id,
+            "lead_count": self.lead_count,
+            "request_count": self.request_count,
+            "drafted": self.drafted,
+            "failed": self.failed,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+        }
+
+
+class GenerationBatchItem(Base):
+    """One request line of a GenerationBatch; `status` makes ingesting its result idempotent."""
+    __tablename__ = "generation_batch_items"
+
+    batch_id = Column(Integer, ForeignKey("generation_batches.id", ondelete="CASCADE"), primary_key=True)
+    custom_id = Column(String, primary_key=True)  # "<lead_id>:<artifact>"
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False, index=True)
+    artifact = Column(String, nullable=False)     # "sms" | "email"
+    status = Column(String, nullable=False, default="pending")  # pending | drafted | failed
+    message_id = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
+
+
+class MessageArchiveIndex(Base):
+    """One compressed member (one lead's rows) inside a cold-storage segment file; see archive.py."""
+    __tablename__ = "message_archive_index"
+
+    id = Column(Integer, primary_key=True)
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False, index=True)
+    segment = Column(String, nullable=False)     # file name relative to ARCHIVE_DIR
+    offset = Column(Integer, nullable=False)     # byte offset of the member in the segment
+    length = Column(Integer, nullable=False)     # compressed byte length
+    codec = Column(String, nullable=False)       # "gzip" | "zstd"
+    count = Column(Integer, nullable=False)
+    first_at = Column(DateTime, nullable=True)
+    last_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class InboundDedup(Base):
+    """
+    Provider message ids already ingested (Twilio MessageSid, email Message-ID).
+    Kept out of `messages` so the uniqueness check does not depend on how that table is laid out.
+    """
+    __tablename__ = "inbound_dedup"
+
+    key = Column(String, primary_key=True)           # "<provider>:<provider id>"
+    message_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 # --------------------------
 # Session helpers
 # --------------------------
@@ -0,0 +1,133 @@
+# backend/db_router.py
+"""
+Read-replica routing (opt-in: DATABASE_REPLICA_URLS).
+
+Heavy read endpoints (lead list, threads, exports) otherwise compete with webhook
+writes on the primary. Handlers that only read take `get_read_db` instead of
+`get_db` (main.py):
+
+- the session is bound to the next replica (round robin) and refuses to flush
+- read-your-writes: a client whose request committed on the primary reads from the
+  primary for REPLICA_STICKY_SEC afterwards, which covers normal replication lag.
+  The client is the X-Tenant-Id header, else the remote address; the mark is kept
+  in shared_state, so every worker sees it
+- a replica that fails to connect is skipped for REPLICA_RETRY_SEC; with none
+  left, reads go to the primary
+
+Locally, two SQLite files stand in for primary and replica (copy the primary file).
+"""
+
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import metrics
+import shared_state
+from database import SessionLocal, engine, replica_engines
+from settings import settings
+
+REPLICA_STICKY_SEC = settings.replica_sticky_sec
+REPLICA_RETRY_SEC = settings.replica_retry_sec
+
+CLIENT = "db_router.client"    # Session.info: who the request is for (set by main.get_db)
+REPLICA = "db_router.replica"  # Session.info: bound to a replica, read-only
+
+ROUTED = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_db_read_sessions_total", "Read-only sessions by target (replica | primary | sticky)", ("target",),
+))
+
+
+def client_key(request) -> str:
+    tenant = (request.headers.get("x-tenant-id") or "").strip()
+    if tenant:
+        return f"tenant:{tenant}"
+    return f"addr:{request.client.host if request.client else '-'}"
+
+
+def _sticky_key(client: str) -> str:
+    return f"replica:sticky:{client}"
+
+
+class Router:
+    def __init__(self, primary: Engine, replicas: List[Engine]):
+        self.primary = primary
+        self.replicas = replicas
+        self._turn = itertools.count()
+        self._down: Dict[int, float] = {}  # replica index -> monotonic time to retry it
+        self._lock = threading.Lock()
+        for i, eng in enumerate(replicas):
+            event.listen(eng, "handle_error", self._on_error(i))
+
+    def _on_error(self, i: int):
+        def handler(ctx):
+            if ctx.is_disconnect or ctx.connection is None:  # could not connect, or lost the connection
+                with self._lock:
+                    self._down[i] = time.monotonic() + REPLICA_RETRY_SEC
+                print(f"⚠️ read replica {i} failed, skipped for {REPLICA_RETRY_SEC:g}s: {ctx.original_exception}")
+        return handler
+
+    def _pick(self) -> Optional[Engine]:
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                i = next(self._turn) % len(self.replicas)
+                if self._down.get(i, 0.0) <= now:
+                    return self.replicas[i]
+        return None
+
+    def engine_for(self, client: Optional[str]) -> Engine:
+        """Where a read-only request of `client` should go."""
+        if not self.replicas:
+            return self.primary
+        if client and shared_state.state.get(_sticky_key(client)):
+            ROUTED.inc("sticky")
+            return self.primary
+        eng = self._pick()
+        ROUTED.inc("primary" if eng is None else "replica")
+        return eng or self.primary
+
+    def session(self, client: Optional[str]) -> Session:
+        bind = self.engine_for(client)
+        db = SessionLocal(bind=bind)
+        db.info[CLIENT] = client
+        if bind is not self.primary:
+            db.info[REPLICA] = True
+        return db
+
+    def wrote(self, client: str) -> None:
+        if self.replicas:
+            shared_state.state.set(_sticky_key(client), 1, ttl=REPLICA_STICKY_SEC)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            down = {i for i, t in self._down.items() if t > now}
+        return {
+            "replicas": [{"url": eng.url.render_as_string(hide_password=True), "healthy": i not in down}
+                         for i, eng in enumerate(self.replicas)],
+            "sticky_sec": REPLICA_STICKY_SEC,
+        }
+
+
+router = Router(engine, replica_engines)
+
+
+# ── Session hooks ─────────────────────────────────────────────────────────────
+@event.listens_for(Session, "before_flush")
+def _read_only(session, flush_context, instances):
+    if session.info.get(REPLICA) and (session.new or session.dirty or session.deleted):
+        raise RuntimeError("read-only replica session: use get_db for handlers that write")
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    client = session.info.get(CLIENT)
+    if client and not session.info.get(REPLICA):
+        router.wrote(client)
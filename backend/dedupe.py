@@ -0,0 +1,482 @@
+# backend/dedupe.py
+"""
+Near-duplicate lead detection and merging.
+
+Exact email matches are not enough: "Jane Doe / jane.doe@acme.com" and
+"Jane Doe / jdoe@acme.com" are the same person. Comparing every lead with every
+other lead is O(n²), so each lead gets a few blocking keys, stored in
+lead_block_keys, and only leads that share a key are compared:
+
+  e:<normalized email>        lower-cased, "+tag" dropped, gmail dots ignored
+  n:<normalized name>         accents/punctuation stripped, tokens sorted
+  p:<last 10 phone digits>    placeholder numbers (DEDUPE_IGNORE_PHONES) skipped
+  d:<domain>:<surname>        company domains only, not gmail.com & co.
+
+Inside a block, pairs are scored 0-1 from name similarity (Jaro-Winkler,
+initials), same company domain, whether one email's local part is an alias of the
+other's name (jdoe, jane.doe, doej, ...) and same phone. At DEDUPE_THRESHOLD a
+pair counts as a duplicate:
+
+- capture-time `check()`: a handful of indexed key lookups, typically ~1 ms
+- `scan()`: batch job over the whole table, writes pairs to lead_duplicates
+- `merge()`: moves messages (live and archived) to the surviving lead and deletes the others
+
+    python dedupe.py --scan
+    python dedupe.py --reindex        # after bulk imports that bypass the ORM
+"""
+
+from __future__ import annotations
+
+import itertools
+import re
+import time
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, func, or_, select, update
+from sqlalchemy.engine import Connection, Engine
+
+import activity
+import drafts
+import metrics
+import scoring
+from database import Lead, LeadBlockKey, LeadDuplicate, LeadScore, Message, MessageArchiveIndex
+from settings import settings
+
+DEDUPE_THRESHOLD = settings.dedupe_threshold
+DEDUPE_MAX_BLOCK = settings.dedupe_max_block
+DEDUPE_IGNORE_PHONES = settings.dedupe_ignore_phones
+
+KEYS = LeadBlockKey.__table__
+PAIRS = LeadDuplicate.__table__
+LEADS = Lead.__table__
+
+FREE_EMAIL_DOMAINS = frozenset({
+    "gmail.com", "googlemail.com", "yahoo.com", "hotmail.com", "outlook.com", "live.com",
+    "icloud.com", "me.com", "aol.com", "proton.me", "protonmail.com", "gmx.com", "mail.com",
+})
+NAME_NOISE = frozenset({"mr", "mrs", "ms", "dr", "jr", "sr", "ii", "iii", "phd"})
+# pair score = weighted evidence, capped at 1
+W_NAME, W_DOMAIN, W_LOCAL, W_PHONE = 0.45, 0.2, 0.2, 0.3
+# fields copied onto the surviving lead when it has none
+MERGE_FILL = ("company", "job_title", "location", "linkedin_url", "company_size", "industry")
+
+DEDUPE_CHECK_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "solisa_dedupe_check_seconds", "Capture-time near-duplicate lookup", (),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+))
+DEDUPE_MERGED = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_dedupe_merged_leads_total", "Leads merged into another lead", (),
+))
+
+
+# ── Normalization ─────────────────────────────────────────────────────────────
+def _fold(text: str) -> str:
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+
+
+def name_tokens(name: Optional[str]) -> Tuple[str, ...]:
+    return tuple(t for t in re.findall(r"[a-z0-9]+", _fold(name or "")) if t not in NAME_NOISE)
+
+
+def split_email(email: Optional[str]) -> Tuple[str, str]:
+    local, _, domain = (email or "").strip().lower().rpartition("@")
+    local = local.split("+", 1)[0]
+    if domain in ("gmail.com", "googlemail.com"):
+        local, domain = local.replace(".", ""), "gmail.com"
+    return local, domain
+
+
+def _phone_digits(phone: Optional[str]) -> str:
+    return re.sub(r"\D", "", phone or "")[-10:]
+
+
+IGNORED_PHONES = frozenset(_phone_digits(p) for p in DEDUPE_IGNORE_PHONES.split(",") if p.strip())
+
+
+def phone_key(phone: Optional[str]) -> Optional[str]:
+    digits = _phone_digits(phone)
+    if len(digits) < 7 or digits in IGNORED_PHONES:
+        return None
+    return digits
+
+
+class Fingerprint:
+    """The normalized parts of one lead that blocking and scoring look at."""
+
+    __slots__ = ("lead_id", "tokens", "local", "local_alnum", "domain", "phone")
+
+    def __init__(self, lead_id: Optional[int], name: Optional[str], email: Optional[str], phone: Optional[str]):
+        self.lead_id = lead_id
+        self.tokens = name_tokens(name)
+        self.local, self.domain = split_email(email)
+        self.local_alnum = re.sub(r"[^a-z0-9]", "", self.local)
+        self.phone = phone_key(phone)
+
+    @property
+    def surname(self) -> Optional[str]:
+        alpha = [t for t in self.tokens if not t.isdigit()]
+        return alpha[-1] if alpha else None
+
+    def keys(self) -> List[str]:
+        keys = []
+        if self.local and self.domain:
+            keys.append(f"e:{self.local}@{self.domain}")
+        if self.tokens:
+            keys.append("n:" + " ".join(sorted(self.tokens)))
+        if self.phone:
+            keys.append(f"p:{self.phone}")
+        if self.domain and self.domain not in FREE_EMAIL_DOMAINS and self.surname:
+            keys.append(f"d:{self.domain}:{self.surname}")
+        return keys
+
+
+# ── Similarity ────────────────────────────────────────────────────────────────
+def jaro_winkler(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    window = max(0, max(len(a), len(b)) // 2 - 1)
+    used = [False] * len(b)
+    matches_a = []
+    for i, ch in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not used[j] and b[j] == ch:
+                used[j] = True
+                matches_a.append(ch)
+                break
+    m = len(matches_a)
+    if not m:
+        return 0.0
+    matches_b = [b[j] for j in range(len(b)) if used[j]]
+    transpositions = sum(x != y for x, y in zip(matches_a, matches_b)) / 2
+    jaro = (m / len(a) + m / len(b) + (m - transpositions) / m) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def name_similarity(a: Sequence[str], b: Sequence[str]) -> float:
+    if not a or not b:
+        return 0.0
+    if sorted(a) == sorted(b):
+        return 1.0
+    if {t for t in a if t.isdigit()} != {t for t in b if t.isdigit()}:
+        return 0.0  # "Lead 12" vs "Lead 13"
+    a = [t for t in a if not t.isdigit()] or list(a)
+    b = [t for t in b if not t.isdigit()] or list(b)
+    if len(a) == 1 or len(b) == 1:
+        return 0.8 * jaro_winkler(" ".join(a), " ".join(b))
+    last = jaro_winkler(a[-1], b[-1])
+    if last < 0.9:
+        return 0.0
+    fa, fb = a[0], b[0]
+    if fa == fb:
+        first = 1.0
+    elif (len(fa) == 1 or len(fb) == 1) and fa[0] == fb[0]:
+        first = 0.85  # "J Doe" vs "Jane Doe"
+    else:
+        first = jaro_winkler(fa, fb)
+    return first * last
+
+
+def alias_match(local: str, tokens: Sequence[str]) -> float:
+    """
+    How well an email local part (letters/digits only) reads as a spelling of
+    `tokens` (jane doe -> jdoe, janedoe, doej).
+    """
+    alpha = [t for t in tokens if not t.isdigit()]
+    if not alpha or not local:
+        return 0.0
+    first, last = alpha[0], alpha[-1]
+    if len(alpha) > 1 and local in (first + last, first[0] + last, first + last[0], last + first, last + first[0]):
+        return 1.0
+    if local in (first, last):
+        return 0.8
+    return 0.0
+
+
+def similarity(a: Fingerprint, b: Fingerprint, threshold: float = 0.0) -> Tuple[float, List[str]]:
+    """
+    Pair score in [0, 1] and the evidence behind it. With `threshold`, a pair that
+    cannot reach it even with matching emails returns early (score without the email part).
+    """
+    if a.local and a.local == b.local and a.domain == b.domain:
+        return 1.0, ["email"]
+    reasons = []
+    name = name_similarity(a.tokens, b.tokens)
+    score = W_NAME * name
+    if name >= 0.8:
+        reasons.append("name")
+    if a.domain and a.domain == b.domain and a.domain not in FREE_EMAIL_DOMAINS:
+        score += W_DOMAIN
+        reasons.append("domain")
+    if a.phone and a.phone == b.phone:
+        score += W_PHONE
+        reasons.append("phone")
+    if score + W_LOCAL < threshold:
+        return round(score, 4), reasons  # the email comparison (the costly part) cannot change the verdict
+    alias = max(alias_match(a.local_alnum, b.tokens), alias_match(b.local_alnum, a.tokens))
+    local = alias if alias == 1.0 else max(alias, jaro_winkler(a.local, b.local))
+    score += W_LOCAL * local
+    if alias >= 0.8:
+        reasons.append("email_alias")
+    elif local >= 0.9:
+        reasons.append("email_similar")
+    return min(1.0, round(score, 4)), reasons
+
+
+# ── Blocking index ────────────────────────────────────────────────────────────
+def index_leads(conn: Connection, rows: Iterable[Tuple[int, Optional[str], Optional[str], Optional[str]]]) -> int:
+    """(Re)write block keys for (id, name, email, phone) rows. Returns keys written."""
+    rows = list(rows)
+    if not rows:
+        return 0
+    conn.execute(KEYS.delete().where(KEYS.c.lead_id.in_([r[0] for r in rows])))
+    keys = [{"key": k, "lead_id": r[0]} for r in rows for k in Fingerprint(*r).keys()]
+    if keys:
+        conn.execute(KEYS.insert(), keys)
+    return len(keys)
+
+
+def index_missing(conn: Connection, chunk: int = 20000) -> int:
+    """Index leads that have no keys yet (bulk inserts bypass the ORM hook). Returns leads indexed."""
+    total = 0
+    while True:
+        rows = conn.execute(
+            select(LEADS.c.id, LEADS.c.name, LEADS.c.email, LEADS.c.phone)
+            .where(~select(KEYS.c.lead_id).where(KEYS.c.lead_id == LEADS.c.id).exists())
+            .limit(chunk)
+        ).all()
+        if not rows:
+            return total
+        index_leads(conn, rows)
+        total += len(rows)
+
+
+@event.listens_for(Lead, "after_insert")
+def _on_lead_insert(mapper, connection, target: Lead) -> None:
+    index_leads(connection, [(target.id, target.name, target.email, target.phone)])
+
+
+@event.listens_for(Lead, "after_update")
+def _on_lead_update(mapper, connection, target: Lead) -> None:
+    from sqlalchemy import inspect
+
+    state = inspect(target)
+    if any(state.attrs[f].history.has_changes() for f in ("name", "email", "phone")):
+        index_leads(connection, [(target.id, target.name, target.email, target.phone)])
+
+
+def ensure(engine: Engine) -> None:
+    """Create the index if missing and backfill it (existing DBs predate it)."""
+    from sqlalchemy import inspect
+
+    insp = inspect(engine)
+    if insp.has_table(KEYS.name) or not insp.has_table(LEADS.name):
+        return
+    KEYS.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        n = index_missing(conn)
+    print(f"🔎 lead_block_keys created and backfilled for {n} leads")
+
+
+# ── Capture-time check ────────────────────────────────────────────────────────
+def check(conn: Connection, name: Optional[str], email: Optional[str], phone: Optional[str],
+          threshold: float = DEDUPE_THRESHOLD, exclude: Optional[int] = None, limit: int = 5) -> List[Dict[str, Any]]:
+    """Existing leads that look like the same person, best first."""
+    t0 = time.perf_counter()
+    probe = Fingerprint(None, name, email, phone)
+    ids = set()
+    for key in probe.keys():
+        ids.update(conn.execute(
+            select(KEYS.c.lead_id).where(KEYS.c.key == key)
+            .order_by(KEYS.c.lead_id.desc()).limit(DEDUPE_MAX_BLOCK)
+        ).scalars())
+    ids.discard(exclude)
+    matches = []
+    if ids:
+        rows = conn.execute(
+            select(LEADS.c.id, LEADS.c.name, LEADS.c.email, LEADS.c.phone).where(LEADS.c.id.in_(ids))
+        ).all()
+        for row in rows:
+            score, reasons = similarity(probe, Fingerprint(*row), threshold)
+            if score >= threshold:
+                matches.append({"lead_id": row[0], "name": row[1], "email": row[2],
+                                "score": score, "reasons": reasons})
+    matches.sort(key=lambda m: -m["score"])
+    DEDUPE_CHECK_SECONDS.observe(value=time.perf_counter() - t0)
+    return matches[:limit]
+
+
+# ── Batch scan ────────────────────────────────────────────────────────────────
+def _upsert(conn: Connection):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(PAIRS)
+
+
+def scan(engine: Engine, threshold: float = DEDUPE_THRESHOLD, max_block: int = DEDUPE_MAX_BLOCK,
+         fetch: int = 20000) -> Dict[str, Any]:
+    """
+    Score every pair that shares a blocking key and record pairs at `threshold` in
+    lead_duplicates. Dismissed pairs stay dismissed. Blocks larger than `max_block`
+    (e.g. a very common name) are skipped and reported instead of compared O(k²).
+    """
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        indexed = index_missing(conn)
+
+    sizes = select(KEYS.c.key, func.count().label("n")).group_by(KEYS.c.key).having(func.count() > 1).subquery()
+    fingerprints: Dict[int, Fingerprint] = {}
+    seen = set()  # pairs sharing several keys are scored once
+    found: Dict[Tuple[int, int], Tuple[float, List[str]]] = {}
+    blocks = 0
+    with engine.connect() as conn:
+        oversized = conn.execute(
+            select(sizes.c.key, sizes.c.n).where(sizes.c.n > max_block).order_by(sizes.c.n.desc())
+        ).all()
+        rows = conn.execute(
+            select(KEYS.c.key, LEADS.c.id, LEADS.c.name, LEADS.c.email, LEADS.c.phone)
+            .join(LEADS, LEADS.c.id == KEYS.c.lead_id)
+            .join(sizes, sizes.c.key == KEYS.c.key)
+            .where(sizes.c.n <= max_block)
+            .order_by(KEYS.c.key, LEADS.c.id)
+            .execution_options(yield_per=fetch)
+        )
+        for _, members in itertools.groupby(rows, key=lambda r: r[0]):
+            block = []
+            for r in members:
+                fp = fingerprints.get(r[1])
+                if fp is None:
+                    fp = fingerprints[r[1]] = Fingerprint(r[1], r[2], r[3], r[4])
+                block.append(fp)
+            blocks += 1
+            for a, b in itertools.combinations(block, 2):
+                pair = (a.lead_id, b.lead_id)  # ordered: rows come sorted by id
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                score, reasons = similarity(a, b, threshold)
+                if score >= threshold:
+                    found[pair] = (score, reasons)
+    compared = len(seen)
+
+    pairs = [{"lead_id": a, "duplicate_id": b, "score": s, "reasons": ",".join(r), "status": "open",
+              "created_at": datetime.utcnow()}
+             for (a, b), (s, r) in found.items()]
+    with engine.begin() as conn:
+        for i in range(0, len(pairs), fetch):
+            stmt = _upsert(conn)
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=[PAIRS.c.lead_id, PAIRS.c.duplicate_id],
+                set_={"score": stmt.excluded.score, "reasons": stmt.excluded.reasons},
+            ), pairs[i:i + fetch])
+    return {
+        "indexed": indexed,
+        "blocks": blocks,
+        "compared": compared,
+        "duplicates": len(pairs),
+        "oversized_blocks": [{"key": k, "leads": n} for k, n in oversized[:20]],
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def dismiss(conn: Connection, pair_id: int) -> bool:
+    return conn.execute(update(PAIRS).where(PAIRS.c.id == pair_id).values(status="dismissed")).rowcount > 0
+
+
+# ── Merge ─────────────────────────────────────────────────────────────────────
+def merge(conn: Connection, survivor_id: int, duplicate_ids: Sequence[int]) -> Dict[str, Any]:
+    """
+    Fold `duplicate_ids` into `survivor_id` inside the caller's transaction: messages
+    and archived segments are re-parented, empty profile fields are filled in, and
+    activity summary / score are recomputed. The duplicate leads are then deleted.
+    Callers invalidate lead_cache for all of them after committing.
+    """
+    dups = sorted({int(d) for d in duplicate_ids} - {survivor_id})
+    if not dups:
+        raise ValueError("no leads to merge")
+    cols = [LEADS.c.id, LEADS.c.enriched, LEADS.c.enriched_at] + [LEADS.c[f] for f in MERGE_FILL]
+    rows = {r[0]: r for r in conn.execute(select(*cols).where(LEADS.c.id.in_([survivor_id, *dups]))).all()}
+    missing = [i for i in [survivor_id, *dups] if i not in rows]
+    if missing:
+        raise LookupError(f"leads not found: {missing}")
+
+    # profile: keep the survivor's values, fill gaps from the duplicates (newest first)
+    survivor = rows[survivor_id]
+    fill: Dict[str, Any] = {}
+    for d in sorted(dups, reverse=True):
+        for i, f in enumerate(MERGE_FILL, start=3):
+            if survivor[i] is None and f not in fill and rows[d][i] is not None:
+                fill[f] = rows[d][i]
+        if survivor[1] != "success" and rows[d][1] == "success" and "enriched" not in fill:
+            fill["enriched"], fill["enriched_at"] = "success", rows[d][2]
+    if fill:
+        conn.execute(update(LEADS).where(LEADS.c.id == survivor_id)
+                     .values(**fill, version=LEADS.c.version + 1, updated_at=datetime.utcnow()))
+
+    drafts.reparent(conn, survivor_id, dups)  # one current draft per channel survives
+    m = Message.__table__
+    moved = conn.execute(update(m).where(m.c.lead_id.in_(dups)).values(lead_id=survivor_id)).rowcount
+    archive = MessageArchiveIndex.__table__
+    conn.execute(update(archive).where(archive.c.lead_id.in_(dups)).values(lead_id=survivor_id))
+
+    # autopilot signals: the most recent read of any of the merged leads wins
+    sc = LeadScore.__table__
+    latest = conn.execute(
+        select(sc.c.lead_id, sc.c.intent, sc.c.objections)
+        .where(sc.c.lead_id.in_([survivor_id, *dups]), sc.c.signals_at.isnot(None))
+        .order_by(sc.c.signals_at.desc()).limit(1)
+    ).first()
+
+    # rows keyed by the duplicates (SQLite does not enforce ON DELETE CASCADE)
+    conn.execute(PAIRS.delete().where(or_(PAIRS.c.lead_id.in_(dups), PAIRS.c.duplicate_id.in_(dups))))
+    conn.execute(KEYS.delete().where(KEYS.c.lead_id.in_(dups)))
+    conn.execute(sc.delete().where(sc.c.lead_id.in_(dups)))
+    conn.execute(activity.ACTIVITY.delete().where(activity.ACTIVITY.c.lead_id.in_(dups)))
+    conn.execute(LEADS.delete().where(LEADS.c.id.in_(dups)))
+
+    activity.rebuild(conn, [survivor_id])
+    if latest is not None and latest[0] != survivor_id:
+        score = scoring.record_signals(conn, survivor_id, latest[1] or "unknown",
+                                       [o for o in (latest[2] or "").split(",") if o])
+    else:
+        score = scoring.score_leads(conn, [survivor_id]).get(survivor_id)
+    DEDUPE_MERGED.inc(amount=len(dups))
+    return {"lead_id": survivor_id, "merged": dups, "messages_moved": moved,
+            "filled": sorted(fill), "score": score}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine
+
+    ap = argparse.ArgumentParser(description="Near-duplicate lead detection")
+    ap.add_argument("--scan", action="store_true", help="find duplicate pairs across all leads")
+    ap.add_argument("--reindex", action="store_true", help="rebuild the blocking index from scratch")
+    ap.add_argument("--threshold", type=float, default=DEDUPE_THRESHOLD)
+    args = ap.parse_args()
+    if args.reindex:
+        KEYS.create(engine, checkfirst=True)
+        with engine.begin() as conn:
+            conn.execute(KEYS.delete())
+            n = index_missing(conn)
+        print(f"✅ blocking index rebuilt for {n} leads")
+    if args.scan:
+        PAIRS.create(engine, checkfirst=True)
+        result = scan(engine, threshold=args.threshold)
+        print(f"✅ {result['duplicates']} duplicate pairs from {result['compared']} comparisons "
+              f"in {result['blocks']} blocks ({result['seconds']}s)")
+        for block in result["oversized_blocks"]:
+            print(f"   skipped block {block['key']!r} ({block['leads']} leads)")
+    if not (args.scan or args.reindex):
+        ap.print_help()
@@ -0,0 +1,271 @@
+# backend/drafts.py
+"""
+One current draft per lead and channel.
+
+Autopilot (the followups/run button, the nightly sweep) and offline batches used to
+append new 'draft' messages on every run, so threads and the messages table grew
+with each click even when the text was identical. Drafts now go through
+`upsert_many`:
+
+- the current draft of a lead + channel is the one `messages` row with
+  status='draft'; the partial unique index uq_messages_current_draft enforces it
+  (advisory locks do, on a partitioned table: partitions.py), and thread queries
+  need no extra filter
+- the same text again (same content hash) writes nothing
+- a new text updates that row in place. The text it replaces goes to
+  message_draft_versions: zlib-compressed, once per distinct text, at most
+  DRAFT_HISTORY_LIMIT per lead + channel
+
+Databases that already collected duplicate drafts are compacted once at startup
+(or with `python drafts.py --compact`) before the index is created.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.engine import Connection, Engine
+
+import body_store
+import metrics
+import partitions
+from database import Message, MessageDraftVersion
+from settings import settings
+
+DRAFT_HISTORY_LIMIT = settings.draft_history_limit
+MESSAGES = Message.__table__
+VERSIONS = MessageDraftVersion.__table__
+DRAFT_COLUMNS = ("id", "lead_id", "channel", "subject", "body", "created_at")
+CURRENT_DRAFT_INDEX = next(ix for ix in MESSAGES.indexes if ix.name == "uq_messages_current_draft")
+
+DRAFT_WRITES = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_draft_writes_total", "Draft upserts by outcome (inserted | replaced | unchanged)", ("outcome",),
+))
+
+
+def content_hash(subject: Optional[str], body: str) -> str:
+    return hashlib.sha256(f"{subject or ''}\x00{body}".encode("utf-8")).hexdigest()[:32]
+
+
+def _insert(conn: Connection, table):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+# ── History ───────────────────────────────────────────────────────────────────
+def _keep_versions(conn: Connection, rows: Sequence[Any], lead_id: Optional[int] = None) -> None:
+    """Store replaced drafts (rows with lead_id/channel/subject/body/created_at), newest timestamp wins."""
+    if not rows:
+        return
+    now = datetime.utcnow()
+    # one row per key: a multi-row ON CONFLICT may not touch the same row twice (Postgres)
+    values = {}
+    for r in rows:
+        h = content_hash(r.subject, r.body)
+        values[(lead_id or r.lead_id, r.channel, h)] = {
+            "lead_id": lead_id or r.lead_id, "channel": r.channel, "content_hash": h, "subject": r.subject,
+            "body_z": zlib.compress(r.body.encode("utf-8")), "created_at": r.created_at, "superseded_at": now,
+        }
+    stmt = _insert(conn, VERSIONS)
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[VERSIONS.c.lead_id, VERSIONS.c.channel, VERSIONS.c.content_hash],
+            set_={"superseded_at": stmt.excluded.superseded_at},
+        ),
+        list(values.values()),
+    )
+    _prune(conn, {k[0] for k in values})
+
+
+def _prune(conn: Connection, lead_ids) -> None:
+    """Drop all but the DRAFT_HISTORY_LIMIT newest versions per lead + channel."""
+    c = VERSIONS.c
+    ranked = (
+        select(c.id, func.row_number().over(partition_by=(c.lead_id, c.channel),
+                                            order_by=(c.superseded_at.desc(), c.id.desc())).label("rn"))
+        .where(c.lead_id.in_(list(lead_ids)))
+        .subquery()
+    )
+    conn.execute(delete(VERSIONS).where(c.id.in_(select(ranked.c.id).where(ranked.c.rn > DRAFT_HISTORY_LIMIT))))
+
+
+def history(conn: Connection, lead_id: int, channel: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Replaced drafts of a lead, newest first."""
+    c = VERSIONS.c
+    q = select(VERSIONS).where(c.lead_id == lead_id).order_by(c.superseded_at.desc(), c.id.desc())
+    if channel:
+        q = q.where(c.channel == channel)
+    return [{
+        "channel": r.channel,
+        "subject": r.subject,
+        "body": zlib.decompress(r.body_z).decode("utf-8"),
+        "content_hash": r.content_hash,
+        "created_at": r.created_at.isoformat() if r.created_at else None,
+        "superseded_at": r.superseded_at.isoformat() if r.superseded_at else None,
+    } for r in conn.execute(q).all()]
+
+
+# ── Upsert ────────────────────────────────────────────────────────────────────
+def upsert_many(conn: Connection, rows: Sequence[Dict[str, Any]]) -> List[int]:
+    """
+    Make each row (lead_id, channel, subject, body, created_at; direction/status
+    are implied) the current draft of its lead + channel. Returns the message ids,
+    in order. If a lead + channel repeats within `rows`, the last one wins.
+    """
+    latest: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    for row in rows:
+        latest[(row["lead_id"], row["channel"])] = row
+    if not latest:
+        return []
+    partitioned = partitions.is_partitioned(conn)
+    if partitioned:
+        # no unique index across partitions: one writer per lead + channel at a time
+        partitions.lock_keys(conn, [f"draft:{lead_id}:{channel}" for lead_id, channel in latest])
+    c = MESSAGES.c
+    current = {(r.lead_id, r.channel): r for r in conn.execute(
+        select(*body_store.columns(MESSAGES, DRAFT_COLUMNS))
+        .where(c.lead_id.in_({k[0] for k in latest}), c.status == "draft")
+    ).all()}
+
+    ids: Dict[Tuple[int, str], int] = {}
+    inserts, updates, replaced = [], [], []
+    for key, row in latest.items():
+        cur = current.get(key)
+        if cur is None:
+            inserts.append((key, row))
+        elif content_hash(cur.subject, cur.body) == content_hash(row.get("subject"), row["body"]):
+            ids[key] = cur.id
+        else:
+            ids[key] = cur.id
+            replaced.append(cur)
+            updates.append({"mid": cur.id, "s": row.get("subject"), "b": row["body"], "t": row["created_at"]})
+
+    _keep_versions(conn, replaced)
+    if updates:
+        conn.execute(
+            update(MESSAGES).where(c.id == bindparam("mid"))
+            .values(subject=bindparam("s"), body=bindparam("b"), body_hash=bindparam("h"), created_at=bindparam("t")),
+            body_store.externalize(conn, updates, body_key="b", hash_key="h"),
+        )
+    if inserts:
+        if partitioned:
+            stmt = MESSAGES.insert().returning(c.id, sort_by_parameter_order=True)
+        else:
+            # ON CONFLICT: a concurrent run created the draft first; ours replaces its text
+            stmt = _insert(conn, MESSAGES)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[c.lead_id, c.channel], index_where=c.status == "draft",
+                set_={"subject": stmt.excluded.subject, "body": stmt.excluded.body,
+                      "body_hash": stmt.excluded.body_hash, "created_at": stmt.excluded.created_at},
+            ).returning(c.id, sort_by_parameter_order=True)
+        new_ids = conn.execute(stmt, body_store.externalize(conn, [
+            {"lead_id": key[0], "channel": key[1], "direction": "outbound", "subject": row.get("subject"),
+             "body": row["body"], "status": "draft", "created_at": row["created_at"]}
+            for key, row in inserts
+        ])).scalars().all()
+        ids.update(zip((key for key, _ in inserts), new_ids))
+
+    DRAFT_WRITES.inc("inserted", amount=len(inserts))
+    DRAFT_WRITES.inc("replaced", amount=len(updates))
+    DRAFT_WRITES.inc("unchanged", amount=len(latest) - len(inserts) - len(updates))
+    return [ids[(row["lead_id"], row["channel"])] for row in rows]
+
+
+def reparent(conn: Connection, survivor_id: int, lead_ids: Sequence[int]) -> None:
+    """
+    Before `lead_ids` are merged into `survivor_id` (dedupe.merge): per channel keep
+    the survivor's current draft (else the newest of theirs) and move the others,
+    and their histories, into the survivor's history.
+    """
+    c = MESSAGES.c
+    rows = conn.execute(
+        select(*body_store.columns(MESSAGES, DRAFT_COLUMNS))
+        .where(c.lead_id.in_([survivor_id, *lead_ids]), c.status == "draft")
+        .order_by((c.lead_id == survivor_id).desc(), c.created_at.desc(), c.id.desc())
+    ).all()
+    kept, extra = set(), []
+    for r in rows:
+        if r.channel in kept:
+            extra.append(r)
+        kept.add(r.channel)
+    _keep_versions(conn, extra, lead_id=survivor_id)
+    if extra:
+        conn.execute(delete(MESSAGES).where(c.id.in_([r.id for r in extra])))
+
+    v = VERSIONS.c
+    old = conn.execute(select(VERSIONS).where(v.lead_id.in_(list(lead_ids)))).all()
+    if old:
+        stmt = _insert(conn, VERSIONS)
+        values = {(r.channel, r.content_hash): {
+            "lead_id": survivor_id, "channel": r.channel, "content_hash": r.content_hash, "subject": r.subject,
+            "body_z": r.body_z, "created_at": r.created_at, "superseded_at": r.superseded_at,
+        } for r in old}
+        conn.execute(stmt.on_conflict_do_nothing(index_elements=[v.lead_id, v.channel, v.content_hash]),
+                     list(values.values()))
+        conn.execute(delete(VERSIONS).where(v.lead_id.in_(list(lead_ids))))
+        _prune(conn, [survivor_id])
+
+
+# ── Legacy compaction ─────────────────────────────────────────────────────────
+def compact(engine: Engine, chunk: int = 5000) -> int:
+    """Move all but the newest draft per lead + channel into history. Returns rows moved."""
+    c = MESSAGES.c
+    ranked = (
+        select(*body_store.columns(MESSAGES, DRAFT_COLUMNS),
+               func.row_number().over(partition_by=(c.lead_id, c.channel),
+                                      order_by=(c.created_at.desc(), c.id.desc())).label("rn"))
+        .where(c.status == "draft")
+        .subquery()
+    )
+    moved = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(select(ranked).where(ranked.c.rn > 1).limit(chunk)).all()
+            if not rows:
+                return moved
+            # oldest first, so the newest replaced text ends up with the latest superseded_at
+            _keep_versions(conn, sorted(rows, key=lambda r: (r.created_at or datetime.min, r.id)))
+            conn.execute(delete(MESSAGES).where(c.id.in_([r.id for r in rows])))
+            moved += len(rows)
+
+
+def ensure(engine: Engine) -> None:
+    """Compact legacy duplicate drafts and create the current-draft index (existing DBs predate it)."""
+    from sqlalchemy import inspect
+
+    insp = inspect(engine)
+    if not insp.has_table(MESSAGES.name):
+        return  # fresh DB: init_db() creates the table with its index
+    with engine.connect() as conn:
+        if partitions.is_partitioned(conn):
+            return  # partitions.py keeps a non-unique stand-in; upsert_many locks instead
+    if any(ix["name"] == CURRENT_DRAFT_INDEX.name for ix in insp.get_indexes(MESSAGES.name)):
+        return
+    VERSIONS.create(engine, checkfirst=True)
+    n = compact(engine)
+    CURRENT_DRAFT_INDEX.create(engine)
+    print(f"📝 Current-draft index created; {n} superseded drafts moved to message_draft_versions")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine, init_db
+
+    ap = argparse.ArgumentParser(description="Draft storage maintenance")
+    ap.add_argument("--compact", action="store_true", help="collapse duplicate drafts into history")
+    args = ap.parse_args()
+    if args.compact:
+        body_store.ensure(engine)  # compact() reads bodies through message_bodies
+        ensure(engine)
+        init_db()
+        print(f"{compact(engine)} superseded drafts moved to message_draft_versions")
+    else:
+        ap.print_help()
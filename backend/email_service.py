@@ -1,25 +1,25 @@
 # backend/email_service.py
-import os, pathlib, time, smtplib
+import pathlib, time, smtplib
 from email.message import EmailMessage
 from typing import Dict, Optional
-from dotenv import load_dotenv
 
-load_dotenv()
+import metrics
+import profiling
+import shared_state
+from settings import settings
 
-EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "console").lower()  # console | smtp
-SMTP_HOST = os.getenv("SMTP_HOST", "")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USER = os.getenv("SMTP_USER", "")
-SMTP_PASS = os.getenv("SMTP_PASS", "")
-EMAIL_FROM = os.getenv("EMAIL_FROM", "noreply@solisa.ai")
+EMAIL_TRANSPORT = settings.email_transport  # console | smtp
+SMTP_HOST = settings.smtp_host
+SMTP_PORT = settings.smtp_port
+SMTP_USER = settings.smtp_user
+SMTP_PASS = settings.smtp_pass
+EMAIL_FROM = settings.email_from
 
-OUTBOX_DIR = pathlib.Path("./outbox/emails")
-OUTBOX_DIR.mkdir(parents=True, exist_ok=True)
+OUTBOX_DIR = pathlib.Path("./outbox/emails")  # created on first console send
 
 class EmailService:
     def __init__(self):
         self.transport = EMAIL_TRANSPORT
-        print(f"📧 Email transport: {self.transport.upper()}")
 
     def send_email(self, to_email: str, subject: str, body: str) -> Dict:
         if self.transport == "smtp":
@@ -29,10 +29,13 @@ class EmailService:
 
     def _send_console(self, to_email: str, subject: str, body: str) -> Dict:
         ts = int(time.time())
+        seq = shared_state.state.incr("outbox:seq")
         safe_to = to_email.replace("@", "_at_").replace("/", "_")
-        fname = OUTBOX_DIR / f"{ts}-{safe_to}.eml"
+        OUTBOX_DIR.mkdir(parents=True, exist_ok=True)
+        fname = OUTBOX_DIR / f"{ts}-{seq:06d}-{safe_to}.eml"
         content = f"From: {EMAIL_FROM}\nTo: {to_email}\nSubject: {subject}\n\n{body}\n"
-        fname.write_text(content, encoding="utf-8")
+        with metrics.timed(metrics.OUTBOX_WRITE_LATENCY), profiling.span("outbox", fname.name):
+            fname.write_text(content, encoding="utf-8")
         return {
             "sid": "dry_run",
             "status": "queued",
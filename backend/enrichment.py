@@ -1,14 +1,16 @@
-import os, asyncio
+import asyncio, random
 from datetime import datetime
 from typing import Dict
-from dotenv import load_dotenv
 
-load_dotenv()
-USE_MOCK = os.getenv("USE_MOCK_ENRICHMENT", "true").lower() == "true"
+from settings import settings
+
+USE_MOCK = settings.use_mock_enrichment
+MOCK_LATENCY_SEC = settings.mock_enrichment_latency_ms / 1000.0
+# set ENRICHMENT_SEED to make mock enrichment reproducible (same email -> same profile)
+ENRICHMENT_SEED = settings.enrichment_seed
 
 class EnrichmentService:
-    def __init__(self):
-        print(f"🔧 Enrichment mode: {'MOCK' if USE_MOCK else 'REAL APIS'}")
+    mode = "MOCK" if USE_MOCK else "REAL APIS"
 
     async def enrich_lead(self, name: str, email: str, phone: str) -> Dict:
         if USE_MOCK:
@@ -17,23 +19,27 @@ class EnrichmentService:
         return await self._mock_enrichment(name, email, phone)
 
     async def _mock_enrichment(self, name: str, email: str, phone: str) -> Dict:
-        await asyncio.sleep(0.4)
+        await asyncio.sleep(MOCK_LATENCY_SEC)
         domain = email.split('@')[1] if '@' in email else "unknown.com"
         company_name = domain.split('.')[0].title()
+        rng = self._rng(email)
         return {
             "company": f"{company_name} Inc.",
-            "job_title": self._pick(["Software Engineer","Product Manager","Marketing Director","VP Sales","CTO","CEO","Ops Manager","Data Analyst"]),
-            "location": self._pick(["San Francisco, CA","New York, NY","Austin, TX","Seattle, WA","Boston, MA","Los Angeles, CA","Chicago, IL"]),
+            "job_title": self._pick(["Software Engineer","Product Manager","Marketing Director","VP Sales","CTO","CEO","Ops Manager","Data Analyst"], rng),
+            "location": self._pick(["San Francisco, CA","New York, NY","Austin, TX","Seattle, WA","Boston, MA","Los Angeles, CA","Chicago, IL"], rng),
             "linkedin_url": f"https://linkedin.com/in/{name.lower().replace(' ', '-')}",
-            "company_size": self._pick(["1-10 employees","11-50 employees","50-200 employees","200-500 employees","500-1000 employees"]),
+            "company_size": self._pick(["1-10 employees","11-50 employees","50-200 employees","200-500 employees","500-1000 employees"], rng),
             "industry": self._infer_industry(domain),
             "enriched": "success",
             "enriched_at": datetime.utcnow(),
         }
 
-    def _pick(self, items):
-        import random
-        return random.choice(items)
+    def _rng(self, email: str):
+        # seeded per email so repeated runs enrich the same lead identically
+        return random.Random(f"{ENRICHMENT_SEED}:{email.lower()}") if ENRICHMENT_SEED is not None else random
+
+    def _pick(self, items, rng=random):
+        return rng.choice(items)
 
     def _infer_industry(self, domain: str) -> str:
         d = domain.lower()
@@ -0,0 +1,134 @@
+# backend/export.py
+"""
+Streaming CSV / NDJSON export of leads and messages.
+
+Rows are read through a server-side cursor (stream_results + yield_per) on a
+connection owned by the generator, encoded per batch and optionally gzipped on
+the fly, so memory stays flat and the first bytes go out before the query ends.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.engine import Engine
+
+import body_store
+import metrics
+from database import Lead, Message, engine
+from settings import settings
+
+EXPORT_BATCH_ROWS = settings.export_batch_rows
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+EXPORT_ROWS = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_export_rows_total", "Rows streamed by export endpoints", ("entity", "format"),
+))
+
+LEAD_COLUMNS = ["id", "name", "email", "phone", "status", "created_at", "company", "job_title",
+                "location", "linkedin_url", "company_size", "industry", "enriched", "enriched_at"]
+MESSAGE_COLUMNS = ["id", "lead_id", "direction", "channel", "subject", "body", "provider_sid",
+                   "status", "created_at"]
+
+
+# ── Queries ───────────────────────────────────────────────────────────────────
+def leads_query(status: Optional[str] = None, enriched: Optional[str] = None,
+                since: Optional[datetime] = None, until: Optional[datetime] = None) -> Select:
+    t = Lead.__table__
+    q = select(*(t.c[c] for c in LEAD_COLUMNS)).order_by(t.c.id)
+    if status:
+        q = q.where(t.c.status == status)
+    if enriched:
+        q = q.where(t.c.enriched == enriched)
+    if since:
+        q = q.where(t.c.created_at >= since)
+    if until:
+        q = q.where(t.c.created_at < until)
+    return q
+
+
+def messages_query(lead_id: Optional[int] = None, channel: Optional[str] = None,
+                   direction: Optional[str] = None, status: Optional[str] = None,
+                   since: Optional[datetime] = None, until: Optional[datetime] = None) -> Select:
+    t = Message.__table__
+    q = select(*body_store.columns(t, MESSAGE_COLUMNS)).order_by(t.c.id)
+    if lead_id is not None:
+        q = q.where(t.c.lead_id == lead_id)
+    if channel:
+        q = q.where(t.c.channel == channel)
+    if direction:
+        q = q.where(t.c.direction == direction)
+    if status:
+        q = q.where(t.c.status == status)
+    if since:
+        q = q.where(t.c.created_at >= since)
+    if until:
+        q = q.where(t.c.created_at < until)
+    return q
+
+
+# ── Encoding ──────────────────────────────────────────────────────────────────
+def _cell(v: Any) -> Any:
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+def _encode_csv(columns: List[str], rows, header: bool) -> bytes:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    if header:
+        w.writerow(columns)
+    w.writerows([[_cell(v) for v in r] for r in rows])
+    return buf.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(columns: List[str], rows, header: bool) -> bytes:
+    return "".join(
+        json.dumps({c: _cell(v) for c, v in zip(columns, r)}, ensure_ascii=False) + "\n" for r in rows
+    ).encode("utf-8")
+
+
+def stream_rows(query: Select, columns: List[str], fmt: str, gzip: bool = False,
+                entity: str = "rows", bind: Optional[Engine] = None) -> Iterator[bytes]:
+    """
+    Sync generator (Starlette iterates it in the threadpool). It checks out its own
+    connection (from `bind`, default the primary), because the request-scoped
+    session is closed before the body is sent.
+    """
+    encode = _encode_csv if fmt == "csv" else _encode_ndjson
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None  # wbits=31 -> gzip container
+    if fmt == "csv":
+        first = encode(columns, [], True)
+        yield gz.compress(first) + gz.flush(zlib.Z_SYNC_FLUSH) if gz else first
+
+    with (bind or engine).connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_ROWS).execute(query)
+        for batch in result.partitions():
+            chunk = encode(columns, batch, False)
+            EXPORT_ROWS.inc(entity, fmt, amount=len(batch))
+            if gz:
+                # sync-flush each batch so the client sees progress instead of a buffered tail
+                chunk = gz.compress(chunk) + gz.flush(zlib.Z_SYNC_FLUSH)
+            if chunk:
+                yield chunk
+    if gz:
+        yield gz.flush()
+
+
+def response_headers(entity: str, fmt: str, gzip: bool) -> Dict[str, str]:
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    name = f"{entity}-{stamp}.{fmt}" + (".gz" if gzip else "")
+    return {
+        "Content-Disposition": f'attachment; filename="{name}"',
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",
+    }
+
+
+def media_type(fmt: str, gzip: bool) -> str:
+    return "application/gzip" if gzip else FORMATS[fmt]
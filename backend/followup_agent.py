@@ -1,17 +1,40 @@
 # backend/followup_agent.py
-import os, json, asyncio
+import json, asyncio
 from typing import Dict, List, Any
-from openai import OpenAI
-import httpx
-from datetime import datetime, timedelta
-
-OPENAI_MODEL = os.getenv("FOLLOWUP_MODEL", "gpt-4o-mini")
-CALENDLY_URL = os.getenv("CALENDLY_URL", "https://calendly.com/mmohanr1-asu/new-meeting")
-API_BASE = os.getenv("AGENT_SELF_API", "http://127.0.0.1:8010")  # self-calls to our API
-AGENT_ENABLED = os.getenv("AGENT_AUTOPILOT", "on").lower() in ("1","true","on","yes")
-AGENT_MIN_INTERVAL_SEC = int(os.getenv("AGENT_MIN_INTERVAL_SEC", "30"))  # throttle
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from datetime import datetime
+
+import http_clients
+import llm_scheduler
+import metrics
+import prompts
+import resilience
+import shared_state
+from mock_llm import LLM_PROVIDER, MockOpenAI
+from prompts import PromptTemplate
+from settings import settings
+
+OPENAI_MODEL = settings.followup_model
+CALENDLY_URL = settings.calendly_url or "https://calendly.com/mmohanr1-asu/new-meeting"
+API_BASE = settings.agent_self_api  # self-calls to our API
+AGENT_ENABLED = settings.agent_autopilot
+AGENT_MIN_INTERVAL_SEC = settings.agent_min_interval_sec  # throttle
+FOLLOWUP_EST_COMPLETION_TOKENS = 800  # no max_tokens on the JSON plan; used for scheduling only
+
+# built on first use (see _get_client); tests/benchmarks may assign their own
+client = None
+
+
+def _get_client():
+    global client
+    if client is None:
+        if LLM_PROVIDER == "mock":
+            client = MockOpenAI()
+        else:
+            from openai import OpenAI
+            # retries/timeouts are handled by resilience.py, not the SDK
+            client = OpenAI(api_key=settings.openai_api_key or None, max_retries=0,
+                            http_client=http_clients.get_sync("openai_sync"))
+    return client
 
 SYSTEM = (
   "You are a follow-up copilot for insurance sales. "
@@ -21,30 +44,15 @@ SYSTEM = (
   "Prefer concise, human-sounding copy. Keep SMS < 300 chars; email 120–180 words."
 )
 
-def _prompt(lead: Dict[str, Any], events: List[Dict[str, Any]], calendly_url: str) -> str:
-    who = f"{lead.get('name')} — {lead.get('job_title','')} @ {lead.get('company','')}".strip()
-    ctx = []
-    for e in events[-15:]:
-        stamp = e.get("created_at","")
-        line = f"[{stamp}] {e.get('channel','note').upper()} {e.get('direction','')}: {e.get('subject') or ''} {e.get('body') or ''}".strip()
-        ctx.append(line)
-    history = "\n".join(ctx) or "(no history)"
-    return f"""
-LEAD:
-- {who}
-- Location: {lead.get('location','')}
-- Industry: {lead.get('industry','')}
-- Company size: {lead.get('company_size','')}
-
-HISTORY (most recent last):
-{history}
+# task rules are static and go first (system); the lead, history and link come last
+FOLLOWUP_PROMPT = prompts.register(PromptTemplate("followup", "2", system=SYSTEM + """
 
 TASK:
 1) One-sentence situation summary.
 2) Stage (one of: cold, curious, evaluating, ready_to_switch, closed_lost).
 3) Intent signal (short phrase).
 4) Objections: array of short strings.
-5) Recommended_actions: array of objects: 
+5) Recommended_actions: array of objects:
    - type: one of [sms, email, call_script, task, wait]
    - title: short
    - body: one-liner or script
@@ -52,46 +60,93 @@ TASK:
 6) Messages:
    - sms_1 (concise, friendly, prospect tone)
    - sms_2 (value/ROI angle)
-   - email (include booking link once on its own line): {calendly_url}
+   - email (include the booking link below once on its own line)
 
 Return ONLY valid JSON with keys:
-summary, stage, intent_signal, objections, recommended_actions, sms_1, sms_2, email
-"""
+summary, stage, intent_signal, objections, recommended_actions, sms_1, sms_2, email""", user="""
+LEAD:
+- {who}
+- Location: {location}
+- Industry: {industry}
+- Company size: {company_size}
 
-def analyze(lead: Dict[str, Any], events: List[Dict[str, Any]], calendly_url: str) -> Dict[str, Any]:
-    """LLM analysis -> JSON plan"""
-    resp = client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=[
-            {"role":"system","content":SYSTEM},
-            {"role":"user","content":_prompt(lead, events, calendly_url)}
-        ],
-        temperature=0.4,
-        response_format={"type":"json_object"},
+HISTORY (most recent last):
+{history}
+
+BOOKING LINK: {calendly_url}"""))
+
+def _prompt(lead: Dict[str, Any], events: List[Dict[str, Any]], calendly_url: str) -> List[Dict[str, str]]:
+    who = f"{lead.get('name')} — {lead.get('job_title','')} @ {lead.get('company','')}".strip()
+    ctx = []
+    for e in events[-15:]:
+        stamp = e.get("created_at","")
+        line = f"[{stamp}] {e.get('channel','note').upper()} {e.get('direction','')}: {e.get('subject') or ''} {e.get('body') or ''}".strip()
+        ctx.append(line)
+    history = "\n".join(ctx) or "(no history)"
+    return FOLLOWUP_PROMPT.render(
+        who=who,
+        location=lead.get('location',''),
+        industry=lead.get('industry',''),
+        company_size=lead.get('company_size',''),
+        history=history,
+        calendly_url=calendly_url,
     )
+
+def _fallback_plan(calendly_url: str) -> Dict[str, Any]:
+    return {
+        "summary":"Light interest; pricing concern. Recommend quick nudge + ROI email.",
+        "stage":"evaluating",
+        "intent_signal":"asked pricing last call",
+        "objections":["too expensive"],
+        "recommended_actions":[
+            {"type":"sms","title":"Nudge","body":"Can price a lighter plan for apples-to-apples. Want me to send it?","when":"now"},
+            {"type":"email","title":"ROI example","body":"Send ROI proof + booking link","when":"now"}
+        ],
+        "sms_1":"Quick one — I can quote a lighter plan to compare apples-to-apples. Want me to send it?",
+        "sms_2":"We just cut a similar team’s premium 14% without losing coverage. Want a side-by-side?",
+        "email":f"Subject: Quick path to savings\n\nHi there…\n\nBook a time:\n{calendly_url}\n"
+    }
+
+def analyze(lead: Dict[str, Any], events: List[Dict[str, Any]], calendly_url: str) -> Dict[str, Any]:
+    """
+    LLM analysis -> JSON plan (falls back to a canned plan on provider failure / bad JSON).
+    Blocking: run it in a worker thread, since it may wait for a scheduler slot.
+    """
+    messages = _prompt(lead, events, calendly_url)
+
+    def attempt(timeout: float):
+        with metrics.llm_call(OPENAI_MODEL, "followup") as call:
+            resp = _get_client().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                temperature=0.4,
+                response_format={"type":"json_object"},
+                timeout=timeout,
+            )
+            call.record_usage(resp)
+            return resp
+
+    est = llm_scheduler.estimate_tokens(sum(len(m["content"]) for m in messages), FOLLOWUP_EST_COMPLETION_TOKENS)
+    try:
+        with llm_scheduler.scheduler.slot_sync(est, priority=llm_scheduler.AUTOPILOT) as grant:
+            resp = resilience.call_sync(attempt, name="followup")
+            grant.record_usage(resp)
+            prompts.record_usage(FOLLOWUP_PROMPT, OPENAI_MODEL, resp)
+    except Exception as e:
+        print(f"❌ Follow-up LLM error: {e}")
+        resilience.LLM_FALLBACKS.inc("followup", resilience.fallback_reason(e))
+        return _fallback_plan(calendly_url)
     try:
         return json.loads(resp.choices[0].message.content)
     except Exception:
-        # safe fallback
-        return {
-            "summary":"Light interest; pricing concern. Recommend quick nudge + ROI email.",
-            "stage":"evaluating",
-            "intent_signal":"asked pricing last call",
-            "objections":["too expensive"],
-            "recommended_actions":[
-                {"type":"sms","title":"Nudge","body":"Can price a lighter plan for apples-to-apples. Want me to send it?","when":"now"},
-                {"type":"email","title":"ROI example","body":"Send ROI proof + booking link","when":"now"}
-            ],
-            "sms_1":"Quick one — I can quote a lighter plan to compare apples-to-apples. Want me to send it?",
-            "sms_2":"We just cut a similar team’s premium 14% without losing coverage. Want a side-by-side?",
-            "email":f"Subject: Quick path to savings\n\nHi there…\n\nBook a time:\n{calendly_url}\n"
-        }
+        resilience.LLM_FALLBACKS.inc("followup", "bad_json")
+        return _fallback_plan(calendly_url)
 
 async def _post_json(url: str, payload: Dict[str, Any]):
-    async with httpx.AsyncClient(timeout=10) as ac:
-        r = await ac.post(url, json=payload)
-        r.raise_for_status()
-        return r.json()
+    # pooled client: the autopilot's back-to-back self-calls reuse one connection
+    r = await http_clients.get_async("internal").post(url, json=payload, timeout=10)
+    r.raise_for_status()
+    return r.json()
 
 async def act(lead_id: int, plan: Dict[str, Any]):
     """Fire actions: 2 SMS + Email, plus add handoff note when needed."""
@@ -134,19 +189,17 @@ async def act(lead_id: int, plan: Dict[str, Any]):
                          {"subject":"escalate_to_human", "body": brief})
 
 # --- public entry point used by main.py ---
-_last_run: Dict[int, datetime] = {}
-
 async def run_autopilot(lead: Dict[str, Any], events: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Analyze + act (throttled). Returns the plan."""
     if not AGENT_ENABLED:
         return {"disabled": True}
 
+    # claim the run slot atomically, so concurrent workers cannot both pass the throttle
     now = datetime.utcnow()
-    last = _last_run.get(lead["id"])
-    if last and (now - last) < timedelta(seconds=AGENT_MIN_INTERVAL_SEC):
-        return {"throttled": True, "last_run": last.isoformat()}
+    key = f"autopilot:last_run:{lead['id']}"
+    if not shared_state.state.set(key, now.isoformat(), ttl=AGENT_MIN_INTERVAL_SEC, nx=True):
+        return {"throttled": True, "last_run": shared_state.state.get(key)}
 
-    plan = analyze(lead, events, CALENDLY_URL)
+    plan = await asyncio.to_thread(analyze, lead, events, CALENDLY_URL)
     await act(lead["id"], plan)
-    _last_run[lead["id"]] = now
     return {"executed": True, "plan": plan}
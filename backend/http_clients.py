@@ -0,0 +1,197 @@
+# backend/http_clients.py
+"""
+Process-wide outbound HTTP clients.
+
+Every outbound caller (OpenAI SDK clients, autopilot self-calls, Twilio REST)
+borrows a named, long-lived httpx client from here instead of building its own.
+Connections then stay in one keep-alive pool per upstream, so a burst of LLM
+calls pays the TCP + TLS handshake once per pooled connection, not once per
+request. All clients are closed in the app lifespan (lifecycle.py).
+
+    HTTP_MAX_CONNECTIONS=100  HTTP_MAX_KEEPALIVE=50  HTTP_KEEPALIVE_EXPIRY_SEC=30
+    HTTP_HTTP2=true   # only if the `h2` package is installed (pip install "httpx[http2]")
+
+A trace hook counts requests and newly opened connections per client, so the
+reuse ratio is visible in /metrics and GET /api/ops/http-clients.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+import metrics
+from settings import settings
+
+HTTP_MAX_CONNECTIONS = settings.http_max_connections
+HTTP_MAX_KEEPALIVE = settings.http_max_keepalive
+HTTP_KEEPALIVE_EXPIRY_SEC = settings.http_keepalive_expiry_sec
+HTTP_CONNECT_TIMEOUT_SEC = settings.http_connect_timeout_sec
+
+try:  # HTTP/2 multiplexes many requests over one connection; needs the optional `h2` package
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+HTTP_HTTP2 = settings.http_http2 and HTTP2_AVAILABLE
+
+HTTP_CLIENT_REQUESTS = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_http_client_requests_total", "Outbound HTTP requests", ("client",),
+))
+HTTP_CLIENT_CONNECTIONS = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_http_client_connections_opened_total", "Outbound TCP connections opened", ("client",),
+))
+HTTP_CLIENT_HANDSHAKE = metrics.REGISTRY.register(metrics.Histogram(
+    "solisa_http_client_handshake_seconds", "TCP connect + TLS handshake time of new connections", ("client",),
+))
+
+
+class _Stats:
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.handshake_sec = 0.0
+        self.lock = threading.Lock()
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            reused = max(0, self.requests - self.connections)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections,
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else None,
+                "handshake_ms_total": round(self.handshake_sec * 1000, 1),
+            }
+
+
+class _Tracer:
+    """httpcore `trace` extension: sees connect/TLS events of new connections only."""
+
+    def __init__(self, name: str, stats: _Stats):
+        self.name = name
+        self.stats = stats
+        self._started: Optional[float] = None
+
+    def event(self, event: str, info: Dict[str, Any]) -> None:
+        if event == "connection.connect_tcp.started":
+            self._started = time.perf_counter()
+        elif event == "connection.connect_tcp.complete":
+            with self.stats.lock:
+                self.stats.connections += 1
+            HTTP_CLIENT_CONNECTIONS.inc(self.name)
+        elif event in ("connection.start_tls.complete", "http11.send_request_headers.started",
+                       "http2.send_request_headers.started") and self._started is not None:
+            # first request on a fresh connection: handshake is over
+            took = time.perf_counter() - self._started
+            self._started = None
+            with self.stats.lock:
+                self.stats.handshake_sec += took
+            HTTP_CLIENT_HANDSHAKE.observe(self.name, value=took)
+
+
+_lock = threading.Lock()
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_sync_clients: Dict[str, httpx.Client] = {}
+_stats: Dict[str, _Stats] = {}
+
+
+def _stats_for(name: str) -> _Stats:
+    with _lock:
+        return _stats.setdefault(name, _Stats())
+
+
+def _options(timeout: float) -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SEC,
+        ),
+        "timeout": httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT_SEC),
+        "http2": HTTP_HTTP2,
+    }
+
+
+def get_async(name: str, timeout: float = 30.0) -> httpx.AsyncClient:
+    """The shared AsyncClient for `name` ("openai", "internal", ...). Built on first use."""
+    with _lock:
+        client = _async_clients.get(name)
+        if client is not None and not client.is_closed:
+            return client
+    stats = _stats_for(name)
+
+    async def on_request(request: httpx.Request) -> None:
+        tracer = _Tracer(name, stats)
+
+        async def trace(event: str, info: Dict[str, Any]) -> None:
+            tracer.event(event, info)
+
+        request.extensions["trace"] = trace
+        with stats.lock:
+            stats.requests += 1
+        HTTP_CLIENT_REQUESTS.inc(name)
+
+    client = httpx.AsyncClient(event_hooks={"request": [on_request]}, **_options(timeout))
+    with _lock:
+        current = _async_clients.get(name)
+        if current is not None and not current.is_closed:  # lost a race; keep the first one
+            return current  # the unused client never opened a connection
+        _async_clients[name] = client
+    return client
+
+
+def get_sync(name: str, timeout: float = 30.0) -> httpx.Client:
+    """The shared (thread-safe) sync Client for `name`."""
+    with _lock:
+        client = _sync_clients.get(name)
+        if client is not None and not client.is_closed:
+            return client
+    stats = _stats_for(name)
+
+    def on_request(request: httpx.Request) -> None:
+        request.extensions["trace"] = _Tracer(name, stats).event
+        with stats.lock:
+            stats.requests += 1
+        HTTP_CLIENT_REQUESTS.inc(name)
+
+    client = httpx.Client(event_hooks={"request": [on_request]}, **_options(timeout))
+    with _lock:
+        current = _sync_clients.get(name)
+        if current is not None and not current.is_closed:
+            client.close()
+            return current
+        _sync_clients[name] = client
+    return client
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        items = list(_stats.items())
+        open_clients = {n for n, c in _async_clients.items() if not c.is_closed} | \
+                       {n for n, c in _sync_clients.items() if not c.is_closed}
+    return {
+        "http2": HTTP_HTTP2,
+        "limits": {
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive": HTTP_MAX_KEEPALIVE,
+            "keepalive_expiry_sec": HTTP_KEEPALIVE_EXPIRY_SEC,
+        },
+        "clients": {name: dict(s.as_dict(), open=name in open_clients) for name, s in items},
+    }
+
+
+async def aclose_all() -> None:
+    """Close every pool (app shutdown). Later get_* calls build fresh clients."""
+    with _lock:
+        async_clients = list(_async_clients.values())
+        sync_clients = list(_sync_clients.values())
+        _async_clients.clear()
+        _sync_clients.clear()
+    for client in async_clients:
+        await client.aclose()
+    for client in sync_clients:
+        client.close()
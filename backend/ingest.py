@@ -0,0 +1,232 @@
+# backend/ingest.py
+"""
+Idempotent, group-committed webhook ingestion (Twilio SMS + inbound email).
+
+Handlers hand each payload to a process-wide micro-batcher and await its result.
+The batcher collects payloads for up to INGEST_FLUSH_MS, or until INGEST_MAX_BATCH
+arrive. It then resolves their leads with one query, claims the provider ids in
+`inbound_dedup` (INSERT .. ON CONFLICT DO NOTHING), inserts only the new messages
+and commits once. Provider retries of an already-stored id return the original
+message id with duplicate=True, and a burst of webhooks costs one commit per batch
+instead of one per request.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.engine import Connection, Engine
+
+import activity
+import body_store
+import metrics
+from database import InboundDedup, Lead, Message, engine
+from settings import settings
+
+INGEST_FLUSH_MS = settings.ingest_flush_ms
+INGEST_MAX_BATCH = settings.ingest_max_batch
+
+INGEST_BATCH_SIZE = metrics.REGISTRY.register(metrics.Histogram(
+    "solisa_ingest_batch_size", "Inbound webhook rows per group commit", (),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+))
+INGEST_DUPLICATES = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_ingest_duplicates_total", "Inbound webhooks dropped as provider retries", ("channel",),
+))
+
+DEDUP = InboundDedup.__table__
+MESSAGES = Message.__table__
+
+
+@dataclass
+class Inbound:
+    channel: str                   # "sms" | "email"
+    sender: str                    # phone (sms) or email address (email) used to match the lead
+    body: str
+    subject: Optional[str] = None
+    provider_id: Optional[str] = None   # MessageSid / Message-ID
+    received_at: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def dedup_key(self) -> Optional[str]:
+        return f"{self.channel}:{self.provider_id}" if self.provider_id else None
+
+
+@dataclass
+class IngestResult:
+    lead_id: Optional[int]          # None -> no lead matched
+    message_id: Optional[int]
+    duplicate: bool = False
+
+
+def _insert(conn: Connection, table):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def _match_leads(conn: Connection, items: List[Inbound]) -> Dict[Tuple[str, str], int]:
+    out: Dict[Tuple[str, str], int] = {}
+    for channel, col in (("sms", Lead.phone), ("email", Lead.email)):
+        values = {i.sender for i in items if i.channel == channel}
+        if values:
+            # highest id first so the lowest (oldest) lead wins, like the old .first()
+            for value, lead_id in conn.execute(select(col, Lead.id).where(col.in_(values)).order_by(Lead.id.desc())):
+                out[(channel, value)] = lead_id
+    return out
+
+
+def ingest_batch(conn: Connection, items: List[Inbound]) -> List[IngestResult]:
+    """Store a batch inside the caller's transaction. One result per item, in order."""
+    leads = _match_leads(conn, items)
+    results: List[Optional[IngestResult]] = [None] * len(items)
+
+    # in-batch retries: the first occurrence of a key is the one that gets stored
+    first_of: Dict[str, int] = {}
+    candidates: List[int] = []
+    for idx, item in enumerate(items):
+        lead_id = leads.get((item.channel, item.sender))
+        if lead_id is None:
+            results[idx] = IngestResult(None, None)
+            continue
+        key = item.dedup_key
+        if key is not None and key in first_of:
+            continue
+        if key is not None:
+            first_of[key] = idx
+        candidates.append(idx)
+
+    keys = [items[i].dedup_key for i in candidates if items[i].dedup_key]
+    fresh = set()
+    if keys:
+        conn.execute(_insert(conn, DEDUP).values([{"key": k, "created_at": datetime.utcnow()} for k in keys])
+                     .on_conflict_do_nothing(index_elements=["key"]))
+        # rows claimed by this transaction are the only ones still without a message id
+        fresh = set(conn.execute(select(DEDUP.c.key).where(DEDUP.c.key.in_(keys), DEDUP.c.message_id.is_(None))).scalars())
+
+    to_store = [i for i in candidates if items[i].dedup_key is None or items[i].dedup_key in fresh]
+    if to_store:
+        rows = [{
+            "lead_id": leads[(items[i].channel, items[i].sender)],
+            "direction": "inbound",
+            "channel": items[i].channel,
+            "subject": items[i].subject,
+            "body": items[i].body,
+            "provider_sid": items[i].provider_id,
+            "status": "received",
+            "created_at": items[i].received_at,
+        } for i in to_store]
+        ids = conn.execute(
+            MESSAGES.insert().returning(MESSAGES.c.id, sort_by_parameter_order=True),
+            body_store.externalize(conn, [dict(r) for r in rows]),  # copies: `rows` keeps the text
+        ).scalars().all()
+        claimed = [{"k": items[i].dedup_key, "mid": mid} for i, mid in zip(to_store, ids) if items[i].dedup_key]
+        if claimed:
+            conn.execute(update(DEDUP).where(DEDUP.c.key == bindparam("k")).values(message_id=bindparam("mid")),
+                         claimed)
+        for i, mid, row in zip(to_store, ids, rows):
+            # core inserts skip the ORM hook that maintains lead_activity
+            activity.record(conn, row["lead_id"], "inbound", row["channel"], row["created_at"])
+            results[i] = IngestResult(row["lead_id"], mid)
+
+    dup_keys = {items[i].dedup_key for i in range(len(items)) if results[i] is None}
+    if dup_keys:
+        stored = dict(conn.execute(select(DEDUP.c.key, DEDUP.c.message_id).where(DEDUP.c.key.in_(dup_keys))).all())
+        for idx, item in enumerate(items):
+            if results[idx] is None:
+                results[idx] = IngestResult(leads[(item.channel, item.sender)], stored.get(item.dedup_key), True)
+                INGEST_DUPLICATES.inc(item.channel)
+    return results
+
+
+# ── Micro-batcher ─────────────────────────────────────────────────────────────
+class InboundBatcher:
+    """Group commit: one background task drains the queue and commits a batch at a time."""
+
+    def __init__(self, engine: Engine, flush_ms: float = INGEST_FLUSH_MS, max_batch: int = INGEST_MAX_BATCH):
+        self.engine = engine
+        self.flush_sec = flush_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._busy = False
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run(), name="inbound-batcher")
+
+    async def stop(self) -> None:
+        """Flush what is queued, then stop the task."""
+        if self._task is None:
+            return
+        while self._busy or (self._queue is not None and not self._queue.empty()):
+            await asyncio.sleep(self.flush_sec)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, item: Inbound) -> IngestResult:
+        self.start()
+        fut = self._loop.create_future()
+        self._queue.put_nowait((item, fut))
+        return await fut
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            self._busy = True
+            deadline = loop.time() + self.flush_sec
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            INGEST_BATCH_SIZE.observe(value=len(batch))
+            try:
+                results = await asyncio.to_thread(self._commit, [item for item, _ in batch])
+            except Exception as e:
+                print(f"❌ inbound batch of {len(batch)} failed: {e}")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            else:
+                for (_, fut), res in zip(batch, results):
+                    if not fut.done():  # caller may have gone away
+                        fut.set_result(res)
+            finally:
+                self._busy = False
+
+    def _commit(self, items: List[Inbound]) -> List[IngestResult]:
+        with self.engine.begin() as conn:
+            return ingest_batch(conn, items)
+
+
+def ensure(engine: Engine) -> None:
+    DEDUP.create(engine, checkfirst=True)
+
+
+batcher = InboundBatcher(engine)
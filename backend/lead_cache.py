@@ -0,0 +1,204 @@
+# backend/lead_cache.py
+"""
+Read-through cache of serialized lead rows (LRU, LEAD_CACHE_SIZE entries).
+
+Every personalize / follow-up page fetches the lead detail, and sending, composing
+and autopilot each re-read the same row. An entry keeps the lead's dict, its JSON
+bytes and an ETag built from `leads.version`:
+
+- `get(db, id)` returns the lead dict (one query on a miss); GET /api/leads/{id}
+  serves the stored bytes, and a matching If-None-Match gets 304 without touching
+  the database or the serializer
+- `leads.version` is a counter the UPDATE itself increments (`onupdate` in
+  database.py), for ORM and core updates alike; it is not an optimistic lock. The
+  session evicts changed leads on flush and again after commit; core writers call
+  `invalidate()` after their commit (see dedupe.merge)
+- evictions are broadcast through shared_state, so other workers drop their copy;
+  LEAD_CACHE_TTL_SEC bounds how long a missed broadcast can serve a stale row
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import chain
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import metrics
+import shared_state
+from database import Lead
+from settings import settings
+
+LEAD_CACHE_SIZE = settings.lead_cache_size
+LEAD_CACHE_TTL_SEC = settings.lead_cache_ttl_sec
+
+CHANNEL = "leads:invalidate"
+_PENDING = "lead_cache.pending"  # Session.info key: leads written in the open transaction
+
+LOOKUPS = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_lead_cache_lookups_total", "Lead cache lookups by outcome (hit | miss)", ("outcome",),
+))
+NOT_MODIFIED = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_lead_cache_not_modified_total", "Lead detail requests answered with 304", (),
+))
+
+
+@dataclass
+class Entry:
+    lead: Dict[str, Any]
+    body: bytes   # the JSON response
+    etag: str
+    expires: float
+
+
+def etag_of(lead: Dict[str, Any], version: int, body: bytes) -> str:
+    # the checksum tells apart a lead re-created under a reused id at version 1
+    return f'"{lead["id"]}.{version}.{zlib.crc32(body):08x}"'
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, `*` and lists included)."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+class LeadCache:
+    def __init__(self, size: int = LEAD_CACHE_SIZE, ttl: float = LEAD_CACHE_TTL_SEC):
+        self.size = size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by every invalidation; a fill that raced one is dropped
+        self.hits = 0
+        self.misses = 0
+
+    def entry(self, db: Session, lead_id: int) -> Optional[Entry]:
+        """The cached entry, loading and serializing the lead on a miss. None if it does not exist."""
+        now = time.monotonic()
+        with self._lock:
+            e = self._entries.get(lead_id)
+            if e is not None and e.expires > now:
+                self._entries.move_to_end(lead_id)
+                self.hits += 1
+                LOOKUPS.inc("hit")
+                return e
+            generation = self._generation
+            self.misses += 1
+        LOOKUPS.inc("miss")
+
+        lead = db.get(Lead, lead_id)
+        if lead is None:
+            return None
+        data = lead.to_dict()
+        body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        e = Entry(lead=data, body=body, etag=etag_of(data, lead.version or 1, body), expires=now + self.ttl)
+        with self._lock:
+            if self.size > 0 and generation == self._generation:
+                self._entries[lead_id] = e
+                self._entries.move_to_end(lead_id)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return e
+
+    def get(self, db: Session, lead_id: int) -> Optional[Dict[str, Any]]:
+        """The lead as a dict (Lead.to_dict() shape, a copy), or None."""
+        e = self.entry(db, lead_id)
+        return dict(e.lead) if e is not None else None
+
+    def invalidate(self, lead_ids: Iterable[int], broadcast: bool = True) -> None:
+        ids = sorted({int(i) for i in lead_ids})
+        if not ids:
+            return
+        self._evict(ids)
+        if broadcast:
+            try:
+                shared_state.state.publish(CHANNEL, {"ids": ids})
+            except Exception as e:  # the TTL still bounds staleness on other workers
+                print(f"⚠️ lead cache broadcast failed: {e}")
+
+    def _evict(self, ids: Iterable[int]) -> None:
+        with self._lock:
+            self._generation += 1
+            for i in ids:
+                self._entries.pop(i, None)
+
+    def _on_remote(self, message: Dict[str, Any]) -> None:
+        if not shared_state.is_own(message):
+            self._evict(message.get("ids") or ())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.size,
+            "ttl_sec": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+cache = LeadCache()
+shared_state.state.subscribe(CHANNEL, cache._on_remote)
+
+
+def get(db: Session, lead_id: int) -> Optional[Dict[str, Any]]:
+    return cache.get(db, lead_id)
+
+
+def invalidate(lead_ids: Iterable[int]) -> None:
+    cache.invalidate(lead_ids)
+
+
+# ── Session hooks ─────────────────────────────────────────────────────────────
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    ids = {o.id for o in chain(session.dirty, session.deleted) if isinstance(o, Lead) and o.id is not None}
+    if ids:
+        cache.invalidate(ids, broadcast=False)  # again after commit: a reader may refill the old row meanwhile
+        session.info.setdefault(_PENDING, set()).update(ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    ids = session.info.pop(_PENDING, None)
+    if ids:
+        cache.invalidate(ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_PENDING, None)
+
+
+# ── Schema ────────────────────────────────────────────────────────────────────
+def ensure(engine: Engine) -> None:
+    """Add leads.version / leads.updated_at to databases that predate them (fresh ones get them from init_db())."""
+    insp = inspect(engine)
+    if not insp.has_table("leads"):
+        return
+    have = {col["name"] for col in insp.get_columns("leads")}
+    if {"version", "updated_at"} <= have:
+        return
+    with engine.begin() as conn:
+        if "version" not in have:
+            conn.execute(text("ALTER TABLE leads ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+        if "updated_at" not in have:
+            conn.execute(text("ALTER TABLE leads ADD COLUMN updated_at TIMESTAMP"))
+            conn.execute(text("UPDATE leads SET updated_at = created_at"))
+    print("🗂️ leads.version / leads.updated_at added (lead cache ETags)")
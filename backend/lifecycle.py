@@ -0,0 +1,107 @@
+# backend/lifecycle.py
+"""
+App startup / shutdown (FastAPI lifespan).
+
+Importing `main` only builds the app and its routes. Work that touches the
+database or the network happens here, once per worker, before the first request:
+
+- create missing tables / FTS index (DB_AUTO_CREATE=false skips it for managed schemas)
+- start polling shared_state events (SHARED_STATE_BACKEND=db)
+- open DB_WARM_CONNECTIONS pool connections so the first requests skip the connect
+- start the inbound webhook batcher and the periodic lead rescore (SCORING_INTERVAL_SEC)
+- build the LLM SDK client in a background thread (LLM_WARM_CLIENT), so its
+  import cost is paid off the critical path instead of by the first generation
+
+Shutdown flushes queued webhooks, checkpoints a running autopilot sweep, closes the outbound HTTP pools (http_clients.py)
+and disposes the DB pool.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import text
+
+import activity
+import autopilot
+import body_store
+import dedupe
+import drafts
+import lead_cache
+import partitions
+import http_clients
+import ingest
+import scoring
+import search
+import shared_state
+from database import engine, init_db, replica_engines
+from personalization import personalization_service
+from settings import settings
+
+
+def prepare_database() -> None:
+    if settings.db_auto_create:
+        body_store.ensure(engine)  # message_bodies + messages.body_hash first: the steps below read them
+        lead_cache.ensure(engine)  # leads.version / updated_at, before anything loads a Lead
+        activity.ensure(engine)  # backfills lead_activity the first time it is created
+        dedupe.ensure(engine)    # same for the duplicate-detection blocking index
+        drafts.ensure(engine)    # collapses legacy duplicate drafts before indexing them
+        init_db()
+        search.ensure_search_index(engine)
+        partitions.ensure(engine)  # MESSAGES_PARTITIONED (Postgres): monthly partitions of messages
+        shared_state.state.ensure()  # SHARED_STATE_BACKEND=db: shared_state / shared_events
+    warm = []
+    try:
+        for _ in range(settings.db_warm_connections):
+            conn = engine.connect()
+            warm.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in warm:
+            conn.close()  # back to the pool, already connected
+
+
+def _warm_llm_client() -> None:
+    try:
+        personalization_service.client  # noqa: B018 - builds it (imports the SDK)
+        import followup_agent
+        followup_agent._get_client()
+    except Exception as e:
+        print(f"⚠️ LLM client warm-up failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    t0 = time.perf_counter()
+    await asyncio.to_thread(prepare_database)
+    await asyncio.to_thread(shared_state.state.start)  # cross-worker events (breakers, lead cache)
+    ingest.batcher.start()
+    scoring.rescorer.start()
+    partitions.maintainer.start()
+    warmup = None
+    if settings.llm_warm_client and personalization_service.has_api_key:
+        warmup = asyncio.create_task(asyncio.to_thread(_warm_llm_client))
+    print(f"🚀 Ready in {(time.perf_counter() - t0) * 1000:.0f} ms — "
+          f"personalization: {personalization_service.mode}, "
+          f"email: {settings.email_transport.upper()}, "
+          f"enrichment: {'MOCK' if settings.use_mock_enrichment else 'REAL APIS'}")
+    try:
+        yield
+    finally:
+        if warmup is not None:
+            await warmup
+        await ingest.batcher.stop()
+        await scoring.rescorer.stop()
+        await partitions.maintainer.stop()
+        await autopilot.sweeper.stop()
+        personalization_service.reset()
+        followup = sys.modules.get("followup_agent")
+        if followup is not None:
+            followup.client = None
+        await http_clients.aclose_all()
+        engine.dispose()
+        for replica in replica_engines:
+            replica.dispose()
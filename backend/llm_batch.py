@@ -0,0 +1,403 @@
+# backend/llm_batch.py
+"""
+Offline bulk generation through an OpenAI-Batch-API-compatible provider.
+
+Nightly campaigns don't need answers in seconds, so instead of the interactive
+generate_messages path (realtime price, rate limits) they go through the Batch API:
+
+1. export   one JSONL request file per batch under BATCH_DIR (SMS + email per lead,
+            same prompts as personalization.py), plus one generation_batch_items row
+            per request line
+2. submit   upload the file and create the provider batch
+3. poll     until the provider finishes; download the output / error files
+4. ingest   stream the result files BATCH_INGEST_ROWS lines per transaction into
+            the leads' current drafts (drafts.py)
+
+Every step records its progress in generation_batches, so `--run` simply moves each
+open batch forward from wherever it stopped. An item becomes a draft only while it
+is still pending (checked in the same transaction as the upsert), so re-ingesting a
+file never replays old results over newer drafts. A lead sits in at most one open
+batch; leads of failed batches can be exported again.
+
+LLM_PROVIDER=mock uses mock_llm.MockBatchOpenAI, a file-based stand-in.
+
+    python llm_batch.py --export [--status new] [--lead-ids 1,2,3] [--limit N]
+    python llm_batch.py --run [--wait]
+    python llm_batch.py --list
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.engine import Connection, Engine
+
+import drafts
+import http_clients
+import metrics
+import shared_state
+from database import (GenerationBatch, GenerationBatchItem, Lead, SessionLocal,
+                      engine as default_engine)
+from mock_llm import LLM_PROVIDER, MockBatchOpenAI
+from personalization import personalization_service
+from settings import settings
+
+BATCH_DIR = os.path.abspath(settings.batch_dir)
+BATCH_MODEL = settings.batch_model or settings.openai_model
+BATCH_INGEST_ROWS = settings.batch_ingest_rows
+BATCH_POLL_SEC = settings.batch_poll_sec
+
+ENDPOINT = "/v1/chat/completions"
+PROFILE_FIELDS = ("name", "company", "job_title", "location", "industry", "company_size")
+OPEN_STATUSES = ("exported", "submitted", "completed")
+LEADS = Lead.__table__
+BATCHES = GenerationBatch.__table__
+ITEMS = GenerationBatchItem.__table__
+LOCK_TTL_SEC = 3600
+
+BATCH_RESULTS = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_llm_batch_results_total", "Offline batch result lines ingested", ("outcome",),
+))
+
+_client = None
+
+
+def client():
+    """Sync Batch API client: the real SDK, or the local stand-in with LLM_PROVIDER=mock."""
+    global _client
+    if _client is None:
+        if LLM_PROVIDER == "mock":
+            _client = MockBatchOpenAI(os.path.join(BATCH_DIR, "mock-provider"))
+        else:
+            from openai import OpenAI
+
+            # uploads/downloads can be large: longer timeout than chat calls, own pool
+            _client = OpenAI(api_key=settings.openai_api_key, max_retries=2,
+                             http_client=http_clients.get_sync("openai-batch", timeout=300.0))
+    return _client
+
+
+def file_path(batch_id: int, kind: str) -> str:
+    """BATCH_DIR/batch-<id>.<input|output|errors>.jsonl"""
+    return os.path.join(BATCH_DIR, f"batch-{batch_id}.{kind}.jsonl")
+
+
+def custom_id(lead_id: int, artifact: str) -> str:
+    return f"{lead_id}:{artifact}"
+
+
+def get(batch_id: int) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        batch = db.get(GenerationBatch, batch_id)
+        return batch.to_dict() if batch else None
+
+
+def list_batches(limit: int = 20) -> List[Dict[str, Any]]:
+    with SessionLocal() as db:
+        rows = db.query(GenerationBatch).order_by(GenerationBatch.id.desc()).limit(limit).all()
+        return [b.to_dict() for b in rows]
+
+
+def _set(conn: Connection, batch_id: int, **values) -> None:
+    conn.execute(update(BATCHES).where(BATCHES.c.id == batch_id).values(updated_at=datetime.utcnow(), **values))
+
+
+# ── Export ────────────────────────────────────────────────────────────────────
+def _busy_leads():
+    """Leads with a request in a batch that is still open."""
+    return (
+        select(ITEMS.c.lead_id)
+        .join(BATCHES, BATCHES.c.id == ITEMS.c.batch_id)
+        .where(BATCHES.c.status.in_(OPEN_STATUSES))
+    )
+
+
+def export(engine: Engine = default_engine, lead_ids: Optional[Sequence[int]] = None,
+           status: Optional[str] = None, limit: Optional[int] = None,
+           model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Write the request file for the selected leads (all, `lead_ids` and/or lead `status`)
+    that are not already in an open batch. Returns the new batch, or None if no lead qualified.
+    """
+    model = model or BATCH_MODEL
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    q = (select(LEADS.c.id, *(LEADS.c[f] for f in PROFILE_FIELDS))
+         .where(LEADS.c.id.not_in(_busy_leads()))
+         .order_by(LEADS.c.id))
+    if lead_ids is not None:
+        q = q.where(LEADS.c.id.in_(list(lead_ids)))
+    if status:
+        q = q.where(LEADS.c.status == status)
+    if limit:
+        q = q.limit(limit)
+
+    with engine.connect() as conn, conn.begin() as trans:
+        now = datetime.utcnow()
+        batch_id = conn.execute(BATCHES.insert().values(
+            status="exported", model=model, created_at=now, updated_at=now,
+        )).inserted_primary_key[0]
+        path = file_path(batch_id, "input")
+        leads = requests = 0
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for part in conn.execute(q).partitions(BATCH_INGEST_ROWS):
+                items = []
+                for row in part:
+                    profile = {k: row._mapping[k] for k in PROFILE_FIELDS}
+                    for artifact, body in personalization_service.batch_requests(profile, model):
+                        cid = custom_id(row.id, artifact)
+                        f.write(json.dumps({"custom_id": cid, "method": "POST", "url": ENDPOINT, "body": body}) + "\n")
+                        items.append({"batch_id": batch_id, "custom_id": cid, "lead_id": row.id,
+                                      "artifact": artifact, "status": "pending"})
+                conn.execute(ITEMS.insert(), items)
+                leads += len(part)
+                requests += len(items)
+            f.flush()
+            os.fsync(f.fileno())
+        if not leads:
+            os.remove(path + ".tmp")
+            trans.rollback()
+            return None
+        os.replace(path + ".tmp", path)
+        _set(conn, batch_id, lead_count=leads, request_count=requests)
+    print(f"📦 Batch #{batch_id}: {leads} leads, {requests} requests -> {path}")
+    return get(batch_id)
+
+
+# ── Submit / poll ─────────────────────────────────────────────────────────────
+def _find_remote(api, batch: Dict[str, Any]) -> Optional[Any]:
+    """The provider batch an earlier, interrupted submit already created for `batch`, if any."""
+    # provider batches are listed newest first (the SDK fetches further pages as needed):
+    # stop at the ones older than our export, with a minute of slack for clock skew
+    exported = batch.get("created_at")
+    since = exported.replace(tzinfo=timezone.utc).timestamp() - 60 if exported else 0
+    for remote in api.batches.list(limit=100):
+        if remote.created_at < since:
+            break
+        if (remote.metadata or {}).get("solisa_batch") == str(batch["id"]):
+            return remote
+    return None
+
+
+def _submit(engine: Engine, batch: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Upload the request file and create the provider batch. Each provider id is
+    committed as soon as it exists, so a retry after a crash reuses the upload and
+    finds the batch by its metadata instead of paying for the requests twice.
+    """
+    api = client()
+    file_id = batch.get("input_file_id")
+    remote = None
+    if file_id:
+        remote = _find_remote(api, batch)
+    else:
+        path = file_path(batch["id"], "input")
+        with open(path, "rb") as f:
+            file_id = api.files.create(file=(os.path.basename(path), f), purpose="batch").id
+        with engine.begin() as conn:
+            _set(conn, batch["id"], input_file_id=file_id)
+    if remote is None:
+        remote = api.batches.create(input_file_id=file_id, endpoint=ENDPOINT, completion_window="24h",
+                                    metadata={"solisa_batch": str(batch["id"])})
+    values = {"status": "submitted", "input_file_id": file_id, "provider_batch_id": remote.id}
+    with engine.begin() as conn:
+        _set(conn, batch["id"], **values)
+    print(f"📤 Batch #{batch['id']} submitted as {remote.id}")
+    return values
+
+
+def _download(file_id: str, path: str) -> None:
+    client().files.content(file_id).write_to_file(path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _poll(engine: Engine, batch: Dict[str, Any]) -> Dict[str, Any]:
+    remote = client().batches.retrieve(batch["provider_batch_id"])
+    if remote.status not in ("completed", "expired", "cancelled", "failed"):
+        return {}  # validating | in_progress | finalizing | cancelling
+    # expired / cancelled batches still return the lines that finished
+    if remote.output_file_id:
+        _download(remote.output_file_id, file_path(batch["id"], "output"))
+    if remote.error_file_id:
+        _download(remote.error_file_id, file_path(batch["id"], "errors"))
+    if remote.output_file_id or remote.error_file_id:
+        values = {"status": "completed", "output_file_id": remote.output_file_id,
+                  "error_file_id": remote.error_file_id}
+    else:
+        values = {"status": "failed",
+                  "error": f"provider batch {remote.status}: {getattr(remote, 'errors', None) or ''}".strip()}
+    with engine.begin() as conn:
+        _set(conn, batch["id"], **values)
+    print(f"📥 Batch #{batch['id']} {remote.status} at the provider")
+    return values
+
+
+# ── Ingest ────────────────────────────────────────────────────────────────────
+def _lines(path: str) -> Iterator[List[Dict[str, Any]]]:
+    """Result lines of one file, BATCH_INGEST_ROWS at a time (never the whole file in memory)."""
+    if not os.path.exists(path):
+        return
+    chunk: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                chunk.append(json.loads(line))
+            if len(chunk) >= BATCH_INGEST_ROWS:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _outcome(line: Dict[str, Any]) -> tuple:
+    """(content, None) for a successful line, (None, error) otherwise."""
+    resp = line.get("response") or {}
+    if line.get("error") or resp.get("status_code") != 200:
+        err = line.get("error") or (resp.get("body") or {}).get("error") or {}
+        return None, str(err.get("message") if isinstance(err, dict) else err)[:500] or "request failed"
+    try:
+        return resp["body"]["choices"][0]["message"]["content"] or "", None
+    except (KeyError, IndexError, TypeError):
+        return None, "malformed response"
+
+
+def _ingest_chunk(conn: Connection, batch_id: int, lines: List[Dict[str, Any]]) -> tuple:
+    """Drafts for the chunk's still-pending items. Returns (drafted, failed)."""
+    by_id = {ln.get("custom_id"): ln for ln in lines}
+    pending = conn.execute(
+        select(ITEMS.c.custom_id, ITEMS.c.lead_id, ITEMS.c.artifact)
+        .where(ITEMS.c.batch_id == batch_id, ITEMS.c.custom_id.in_(list(by_id)), ITEMS.c.status == "pending")
+    ).all()
+    now = datetime.utcnow()
+    rows, done, updates = [], [], []
+    for item in pending:
+        content, error = _outcome(by_id[item.custom_id])
+        fields = None if error else personalization_service.finalize_batch_result(item.artifact, content)
+        if fields is None or not fields["body"]:
+            updates.append({"cid": item.custom_id, "st": "failed", "mid": None, "err": error or "empty completion"})
+            continue
+        rows.append({"lead_id": item.lead_id, "channel": item.artifact, "subject": fields["subject"],
+                     "body": fields["body"], "created_at": now})
+        done.append(item.custom_id)
+    n_failed = len(updates)
+    if rows:
+        ids = drafts.upsert_many(conn, rows)
+        updates += [{"cid": cid, "st": "drafted", "mid": mid, "err": None} for cid, mid in zip(done, ids)]
+    if updates:
+        conn.execute(
+            update(ITEMS)
+            .where(ITEMS.c.batch_id == batch_id, ITEMS.c.custom_id == bindparam("cid"))
+            .values(status=bindparam("st"), message_id=bindparam("mid"), error=bindparam("err")),
+            updates,
+        )
+    conn.execute(update(BATCHES).where(BATCHES.c.id == batch_id).values(
+        drafted=BATCHES.c.drafted + len(rows), failed=BATCHES.c.failed + n_failed, updated_at=now,
+    ))
+    BATCH_RESULTS.inc("drafted", amount=len(rows))
+    BATCH_RESULTS.inc("failed", amount=n_failed)
+    return len(rows), n_failed
+
+
+def _ingest(engine: Engine, batch: Dict[str, Any]) -> None:
+    batch_id = batch["id"]
+    drafted = failed = 0
+    for kind in ("output", "errors"):
+        for lines in _lines(file_path(batch_id, kind)):
+            with engine.begin() as conn:
+                d, f = _ingest_chunk(conn, batch_id, lines)
+            drafted, failed = drafted + d, failed + f
+    with engine.begin() as conn:
+        # requests the provider never answered
+        missing = conn.execute(
+            update(ITEMS).where(ITEMS.c.batch_id == batch_id, ITEMS.c.status == "pending")
+            .values(status="failed", error="no result")
+        ).rowcount
+        _set(conn, batch_id, status="ingested", completed_at=datetime.utcnow(),
+             failed=BATCHES.c.failed + missing)
+    print(f"✅ Batch #{batch_id} ingested: {drafted} drafts, {failed + missing} failed")
+
+
+# ── Driver ────────────────────────────────────────────────────────────────────
+def advance(batch_id: int, engine: Engine = default_engine) -> Dict[str, Any]:
+    """
+    Move one batch as far as it can go right now (submit -> poll -> ingest).
+    Raises LookupError for unknown batches, RuntimeError if another worker holds it.
+    """
+    batch = get(batch_id)
+    if batch is None:
+        raise LookupError(f"batch {batch_id} not found")
+    lock = f"llm_batch:{batch_id}"
+    if not shared_state.state.set(lock, datetime.utcnow().isoformat(), ttl=LOCK_TTL_SEC, nx=True):
+        raise RuntimeError(f"batch {batch_id} is being processed elsewhere")
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(select(BATCHES).where(BATCHES.c.id == batch_id)).one()._mapping
+        batch = dict(row)
+        if batch["status"] == "exported":
+            batch.update(_submit(engine, batch))
+        if batch["status"] == "submitted":
+            batch.update(_poll(engine, batch))
+        if batch["status"] == "completed":
+            _ingest(engine, batch)
+    finally:
+        shared_state.state.delete(lock)
+    return get(batch_id)
+
+
+def open_batch_ids(engine: Engine = default_engine) -> List[int]:
+    with engine.connect() as conn:
+        return list(conn.execute(
+            select(BATCHES.c.id).where(BATCHES.c.status.in_(OPEN_STATUSES)).order_by(BATCHES.c.id)
+        ).scalars())
+
+
+def run(engine: Engine = default_engine, wait: bool = False) -> List[Dict[str, Any]]:
+    """Advance every open batch; with `wait`, keep polling until none is left open."""
+    while True:
+        results = []
+        for batch_id in open_batch_ids(engine):
+            try:
+                results.append(advance(batch_id, engine))
+            except RuntimeError as e:
+                print(f"⏭️ {e}")
+        if not wait or not open_batch_ids(engine):
+            return results
+        time.sleep(BATCH_POLL_SEC)
+
+
+def stats(conn: Connection) -> Dict[str, int]:
+    rows = conn.execute(select(ITEMS.c.status, func.count()).group_by(ITEMS.c.status)).all()
+    return {status: n for status, n in rows}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import init_db
+
+    ap = argparse.ArgumentParser(description="Offline batch generation (Batch API)")
+    ap.add_argument("--export", action="store_true", help="write a request file for the selected leads")
+    ap.add_argument("--lead-ids", default=None, help="comma-separated lead ids")
+    ap.add_argument("--status", default=None, help="only leads with this status")
+    ap.add_argument("--limit", type=int, default=None)
+    ap.add_argument("--run", action="store_true", help="submit / poll / ingest every open batch")
+    ap.add_argument("--wait", action="store_true", help="with --run: poll every BATCH_POLL_SEC until done")
+    ap.add_argument("--list", action="store_true")
+    args = ap.parse_args()
+    init_db()
+    if args.export:
+        ids = [int(x) for x in args.lead_ids.split(",") if x.strip()] if args.lead_ids else None
+        batch = export(lead_ids=ids, status=args.status, limit=args.limit)
+        print(json.dumps(batch, indent=2) if batch else "no leads to export")
+    if args.run:
+        for batch in run(wait=args.wait):
+            print(json.dumps(batch))
+    if args.list:
+        for batch in list_batches():
+            print(json.dumps(batch))
+    if not (args.export or args.run or args.list):
+        ap.print_help()
@@ -0,0 +1,311 @@
+# backend/llm_scheduler.py
+"""
+Central admission control for LLM calls.
+
+Every completion (personalization, autopilot analysis) waits here for a slot
+before it goes to the provider:
+
+- priority classes: interactive > autopilot > batch. A queued interactive call is
+  always dispatched before queued autopilot/batch work.
+- weighted fair queuing per tenant inside a class (start-time fair queuing over
+  estimated tokens), so one tenant's big batch cannot monopolize its class
+- at most LLM_MAX_CONCURRENCY calls in flight
+- a global tokens-per-minute budget (LLM_TPM_BUDGET, 0 = off). Each call reserves
+  its estimate up front, and the estimate is corrected by the reported usage.
+
+    LLM_MAX_CONCURRENCY=32  LLM_TPM_BUDGET=200000  LLM_TENANT_WEIGHTS="acme:3,beta:1"
+
+The priority and tenant come from a context (`llm_scheduler.context(...)`). Call
+sites deep in the services do not need extra arguments, and requests default to
+interactive. TenantMiddleware takes the tenant from the `X-Tenant-Id` header.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from settings import settings
+
+LLM_MAX_CONCURRENCY = settings.llm_max_concurrency
+LLM_TPM_BUDGET = settings.llm_tpm_budget            # tokens per minute, 0 = unlimited
+LLM_QUEUE_TIMEOUT_SEC = settings.llm_queue_timeout_sec
+LLM_TENANT_WEIGHTS = settings.llm_tenant_weights    # "tenant:weight,..."
+
+INTERACTIVE, AUTOPILOT, BATCH = "interactive", "autopilot", "batch"
+PRIORITIES = {INTERACTIVE: 0, AUTOPILOT: 1, BATCH: 2}
+DEFAULT_TENANT = "default"
+
+LLM_QUEUE_DEPTH = metrics.REGISTRY.register(metrics.Gauge(
+    "solisa_llm_queue_depth", "LLM calls waiting for a scheduler slot", ("priority",),
+))
+LLM_INFLIGHT = metrics.REGISTRY.register(metrics.Gauge(
+    "solisa_llm_inflight", "LLM calls currently admitted",
+))
+LLM_QUEUE_WAIT = metrics.REGISTRY.register(metrics.Histogram(
+    "solisa_llm_queue_wait_seconds", "Time LLM calls waited for a scheduler slot", ("priority",),
+))
+LLM_QUEUE_TIMEOUTS = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_llm_queue_timeouts_total", "LLM calls that gave up waiting for a slot", ("priority",),
+))
+LLM_TOKEN_BUDGET = metrics.REGISTRY.register(metrics.Gauge(
+    "solisa_llm_token_budget_available", "Tokens left in the tokens-per-minute bucket",
+))
+
+
+class QueueTimeoutError(RuntimeError):
+    """No slot within LLM_QUEUE_TIMEOUT_SEC; callers fall back like any provider error."""
+
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+_tenant: contextvars.ContextVar[str] = contextvars.ContextVar("llm_tenant", default=DEFAULT_TENANT)
+
+
+@contextmanager
+def context(priority: Optional[str] = None, tenant: Optional[str] = None) -> Iterator[None]:
+    """
+    with llm_scheduler.context(llm_scheduler.BATCH):
+        await personalization_service.generate_messages(...)
+    """
+    tokens = []
+    if priority is not None:
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown LLM priority {priority!r}")
+        tokens.append((_priority, _priority.set(priority)))
+    if tenant is not None:
+        tokens.append((_tenant, _tenant.set(tenant)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def estimate_tokens(prompt_chars: int, max_tokens: int) -> int:
+    """~4 characters per token for the prompt plus the completion cap."""
+    return prompt_chars // 4 + max_tokens
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        tenant, _, weight = item.rpartition(":")
+        weights[tenant] = float(weight)
+    return weights
+
+
+class _Waiter:
+    __slots__ = ("priority", "tenant", "tokens", "start_tag", "wake", "granted", "cancelled", "queued_at")
+
+    def __init__(self, priority: str, tenant: str, tokens: int, wake):
+        self.priority = priority
+        self.tenant = tenant
+        self.tokens = tokens
+        self.start_tag = 0.0
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+        self.queued_at = time.monotonic()
+
+
+class Grant:
+    """An admitted call. Report real usage so the token bucket stays accurate."""
+
+    def __init__(self, waiter: _Waiter):
+        self._waiter = waiter
+        self.used_tokens: Optional[int] = None
+
+    def record_usage(self, resp: Any) -> None:
+        usage = getattr(resp, "usage", None)
+        total = getattr(usage, "total_tokens", None) if usage is not None else None
+        if total:
+            self.used_tokens = int(total)
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, tpm: int = LLM_TPM_BUDGET,
+                 weights: Optional[Dict[str, float]] = None, queue_timeout: float = LLM_QUEUE_TIMEOUT_SEC):
+        self.max_concurrency = max_concurrency
+        self.tpm = tpm
+        self.weights = weights if weights is not None else parse_weights(LLM_TENANT_WEIGHTS)
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[int, float, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._depth = {p: 0 for p in PRIORITIES}
+        # SFQ state: virtual time per class and the last finish tag per (class, tenant)
+        self._vtime = {p: 0.0 for p in PRIORITIES}
+        self._finish: Dict[Tuple[str, str], float] = {}
+        self._bucket = float(tpm)
+        self._refilled_at = time.monotonic()
+        self._timer: Optional[threading.Timer] = None
+
+    # ── core (caller holds self._lock) ──
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._bucket = min(float(self.tpm), self._bucket + (now - self._refilled_at) * self.tpm / 60.0)
+        self._refilled_at = now
+
+    def _push(self, w: _Waiter) -> None:
+        key = (w.priority, w.tenant)
+        w.start_tag = max(self._vtime[w.priority], self._finish.get(key, 0.0))
+        self._finish[key] = w.start_tag + w.tokens / self.weights.get(w.tenant, 1.0)
+        heapq.heappush(self._heap, (PRIORITIES[w.priority], w.start_tag, next(self._seq), w))
+        self._depth[w.priority] += 1
+        LLM_QUEUE_DEPTH.set(w.priority, value=self._depth[w.priority])
+
+    def _pop(self) -> _Waiter:
+        w = heapq.heappop(self._heap)[3]
+        self._depth[w.priority] -= 1
+        LLM_QUEUE_DEPTH.set(w.priority, value=self._depth[w.priority])
+        return w
+
+    def _dispatch(self) -> None:
+        while self._heap and self._inflight < self.max_concurrency:
+            w = self._heap[0][3]
+            if w.cancelled:  # already taken out of the depth count by _abandon
+                heapq.heappop(self._heap)
+                continue
+            if self.tpm:
+                self._refill()
+                # a call larger than the whole bucket still runs once the bucket is full
+                need = min(w.tokens, self.tpm)
+                if self._bucket < need:
+                    self._schedule_retry((need - self._bucket) * 60.0 / self.tpm)
+                    break
+                self._bucket -= w.tokens
+                LLM_TOKEN_BUDGET.set(value=self._bucket)
+            self._pop()
+            self._vtime[w.priority] = w.start_tag
+            self._inflight += 1
+            LLM_INFLIGHT.set(value=self._inflight)
+            w.granted = True
+            LLM_QUEUE_WAIT.observe(w.priority, value=time.monotonic() - w.queued_at)
+            w.wake()
+
+    def _schedule_retry(self, delay: float) -> None:
+        if self._timer is not None:
+            return
+        def fire():
+            with self._lock:
+                self._timer = None
+                self._dispatch()
+        self._timer = threading.Timer(max(0.005, delay), fire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _release(self, grant: Grant) -> None:
+        with self._lock:
+            self._inflight -= 1
+            LLM_INFLIGHT.set(value=self._inflight)
+            if self.tpm and grant.used_tokens is not None:
+                # settle the reservation against what the provider actually counted
+                self._bucket += grant._waiter.tokens - grant.used_tokens
+                LLM_TOKEN_BUDGET.set(value=self._bucket)
+            self._dispatch()
+
+    def _abandon(self, w: _Waiter) -> bool:
+        """Withdraw a waiter that gave up. Returns True if it had been granted meanwhile."""
+        with self._lock:
+            if w.granted:
+                return True
+            w.cancelled = True
+            self._depth[w.priority] -= 1
+            LLM_QUEUE_DEPTH.set(w.priority, value=self._depth[w.priority])
+            return False
+
+    def _timed_out(self, w: _Waiter) -> QueueTimeoutError:
+        LLM_QUEUE_TIMEOUTS.inc(w.priority)
+        return QueueTimeoutError(f"no LLM slot within {self.queue_timeout:g}s ({w.priority})")
+
+    # ── public API ──
+    @asynccontextmanager
+    async def slot(self, tokens: int, priority: Optional[str] = None,
+                   tenant: Optional[str] = None) -> AsyncIterator[Grant]:
+        """async with scheduler.slot(estimate) as grant: resp = ...; grant.record_usage(resp)"""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(None))
+
+        w = _Waiter(priority or _priority.get(), tenant or _tenant.get(), tokens, wake)
+        with self._lock:
+            self._push(w)
+            self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if not self._abandon(w):
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._timed_out(w) from None
+                raise
+            if isinstance(e, asyncio.CancelledError):
+                self._release(Grant(w))
+                raise
+            # granted in the same instant the wait timed out: use the slot
+        grant = Grant(w)
+        try:
+            yield grant
+        finally:
+            self._release(grant)
+
+    @contextmanager
+    def slot_sync(self, tokens: int, priority: Optional[str] = None,
+                  tenant: Optional[str] = None) -> Iterator[Grant]:
+        """Blocking twin of slot() for worker threads. Never call it on the event loop thread."""
+        event = threading.Event()
+        w = _Waiter(priority or _priority.get(), tenant or _tenant.get(), tokens, event.set)
+        with self._lock:
+            self._push(w)
+            self._dispatch()
+        if not event.wait(self.queue_timeout) and not self._abandon(w):
+            raise self._timed_out(w)
+        grant = Grant(w)
+        try:
+            yield grant
+        finally:
+            self._release(grant)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            if self.tpm:
+                self._refill()
+            return {
+                "inflight": self._inflight,
+                "max_concurrency": self.max_concurrency,
+                "queued": dict(self._depth),
+                "tpm_budget": self.tpm or None,
+                "tokens_available": round(self._bucket) if self.tpm else None,
+            }
+
+
+class TenantMiddleware:
+    """Pure ASGI: binds the `X-Tenant-Id` request header to the scheduler context."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        tenant = None
+        for name, value in scope.get("headers") or ():
+            if name == b"x-tenant-id":
+                tenant = value.decode("latin-1").strip() or None
+                break
+        if tenant is None:
+            return await self.app(scope, receive, send)
+        with context(tenant=tenant):
+            await self.app(scope, receive, send)
+
+
+scheduler = LLMScheduler()
@@ -1,25 +1,50 @@
 # main.py  — Solisa AI demo API (Phase 1 + Agentic Follow-ups)
 
+import asyncio
+import json
 import os
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from dotenv import load_dotenv
 
 # --- your local modules ---
-from database import SessionLocal, engine, Base, Lead as LeadModel, Message as MessageModel
+from settings import settings  # loads .env once, before anything reads config
+from database import (SessionLocal, engine, Base, Lead as LeadModel, Message as MessageModel, LeadActivity,
+                      LeadDuplicate, LeadScore)
 from personalization import personalization_service  # async service you already created
-
-load_dotenv()
+import activity  # registers the Message -> lead_activity hook
+import archive
+import autopilot
+import body_store  # registers the Message body hooks (content-addressed text)
+import copy_reuse
+import db_router  # read-replica sessions; marks clients that just wrote
+import dedupe  # registers the Lead -> lead_block_keys hook
+import drafts
+import export
+import http_clients
+import ingest
+import lead_cache  # registers the Lead cache eviction hooks
+import lifecycle
+import llm_batch
+import llm_scheduler
+import metrics
+import partitions
+import profiling
+import prompts
+import scoring
+import search
+import shared_state
 
 # -----------------------------------------------------------------------------
 # App + CORS
 # -----------------------------------------------------------------------------
-app = FastAPI(title="Solisa AI API", version="5.0.0")
+# table checks, pool warm-up and background tasks run in the lifespan, not at import
+app = FastAPI(title="Solisa AI API", version="5.0.0", lifespan=lifecycle.lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,11 +53,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(llm_scheduler.TenantMiddleware)
+
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
 # -----------------------------------------------------------------------------
 # DB Dependency
 # -----------------------------------------------------------------------------
-def get_db():
+def get_db(request: Request):
     db = SessionLocal()
+    db.info[db_router.CLIENT] = db_router.client_key(request)  # its commits pin the client's reads to the primary
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request):
+    """For handlers that only read: a replica session, unless this client just wrote (db_router.py)."""
+    db = db_router.router.session(db_router.client_key(request))
     try:
         yield db
     finally:
@@ -60,6 +102,7 @@ def lead_to_dict(lead: LeadModel) -> Dict[str, Any]:
         "industry": getattr(lead, "industry", None),
         "enriched": getattr(lead, "enriched", None),
         "enriched_at": iso(getattr(lead, "enriched_at", None)),
+        "updated_at": iso(getattr(lead, "updated_at", None)),
     }
 
 def msg_to_dict(m: MessageModel) -> Dict[str, Any]:
@@ -86,20 +129,194 @@ def root():
         "timestamp": datetime.utcnow().isoformat(),
     }
 
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(404, "metrics disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/ops/http-clients")
+def http_client_stats():
+    """Outbound connection pools: requests vs. connections opened (keep-alive reuse)."""
+    return http_clients.stats()
+
+@app.get("/api/ops/llm-scheduler")
+def llm_scheduler_stats():
+    """LLM admission control: in-flight calls, queue depth per priority, token budget."""
+    return llm_scheduler.scheduler.stats()
+
+@app.get("/api/ops/prompt-cache")
+def prompt_cache_report():
+    """Prompt templates in use and their cached-prompt-token ratio (total + recent calls)."""
+    return dict(prompts.report.as_dict(), versions=sorted(t.key for t in prompts.TEMPLATES.values()))
+
+@app.get("/api/ops/scoring")
+def scoring_status():
+    """Lead scoring weights and the last background rescore."""
+    weights = scoring.weights_vector()
+    return {
+        "weights": dict(zip(scoring.FEATURES, weights.tolist())),
+        "industries": scoring.parse_pairs(scoring.SCORING_INDUSTRIES),
+        "interval_sec": scoring.SCORING_INTERVAL_SEC,
+        "last_run": scoring.rescorer.last,
+    }
+
+@app.post("/api/ops/scoring/rescore")
+async def scoring_rescore(full: bool = False):
+    """Rescore every lead now (`full=true` also rewrites unchanged scores)."""
+    min_delta = 0.0 if full else scoring.SCORING_MIN_DELTA
+    return await asyncio.to_thread(scoring.rescore_all, engine, min_delta=min_delta)
+
+@app.get("/api/ops/database")
+def database_layout(db: Session = Depends(get_db)):
+    """Read replicas (health, read-your-writes window) and, on Postgres, the messages partitions."""
+    return {**db_router.router.stats(), "message_partitions": partitions.list_partitions(db.connection())}
+
+@app.get("/api/ops/lead-cache")
+def lead_cache_stats():
+    return lead_cache.cache.stats()
+
+@app.get("/api/ops/copy-reuse")
+def copy_reuse_stats():
+    """Look-alike copy reuse: index size, hit rate, quality-guard rejections."""
+    return copy_reuse.index.stats()
+
+@app.get("/api/ops/body-store")
+def body_store_stats():
+    """Message text storage: inline vs. content-addressed bodies, dedup ratio."""
+    with engine.connect() as conn:
+        return body_store.stats(conn)
+
+@app.get("/api/ops/profiles")
+def profiles_list(limit: int = Query(50, ge=1, le=500)):
+    """Stored request profiles, newest first (send `X-Profile: 1` to record one)."""
+    return {"enabled": profiling.PROFILING_ENABLED, "profiles": profiling.list_profiles(limit)}
+
+@app.get("/api/ops/profiles/{profile_id}")
+def profile_detail(profile_id: str):
+    """One profile: summary plus every span (kind, name, start, duration)."""
+    path = profiling.profile_path(profile_id)
+    if not path:
+        raise HTTPException(404, "Profile not found")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+@app.get("/api/ops/profiles/{profile_id}/download")
+def profile_download(profile_id: str, format: str = Query("speedscope", pattern="^(speedscope|folded|summary)$")):
+    """speedscope = open in speedscope.app; folded = input for flamegraph.pl / inferno."""
+    path = profiling.profile_path(profile_id, format)
+    if not path:
+        raise HTTPException(404, "Profile not found")
+    media = "text/plain" if format == "folded" else "application/json"
+    return FileResponse(path, media_type=media, filename=os.path.basename(path))
+
 # -----------------------------------------------------------------------------
 # Leads (list, get)
 # -----------------------------------------------------------------------------
 @app.get("/api/leads")
-def list_leads(db: Session = Depends(get_db)):
-    leads = db.query(LeadModel).order_by(LeadModel.id.desc()).all()
-    return [lead_to_dict(l) for l in leads]
+def list_leads(
+    include: Optional[str] = None,
+    sort: str = Query("recent", pattern="^(recent|score)$"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db),
+):
+    with_activity = "activity" in (include or "").split(",")
+    by_score = sort == "score"
+    q = db.query(LeadModel)
+    if with_activity:
+        q = q.outerjoin(LeadActivity, LeadActivity.lead_id == LeadModel.id).add_entity(LeadActivity)
+    if by_score:
+        # unscored leads (created since the last rescore) go last
+        q = q.outerjoin(LeadScore, LeadScore.lead_id == LeadModel.id).add_columns(LeadScore.score)
+        q = q.order_by(LeadScore.score.desc().nulls_last(), LeadModel.id.desc())
+    else:
+        q = q.order_by(LeadModel.id.desc())
+    q = q.offset(offset)
+    if limit is not None:
+        q = q.limit(limit)
+    if not with_activity and not by_score:
+        return [lead_to_dict(l) for l in q.all()]
+    empty = LeadActivity().to_dict()
+    out = []
+    for row in q.all():
+        d = lead_to_dict(row[0])
+        if with_activity:
+            d["activity"] = row[1].to_dict() if row[1] else empty
+        if by_score:
+            d["score"] = row[-1]
+        out.append(d)
+    return out
+
+@app.get("/api/stats")
+def dashboard_stats(db: Session = Depends(get_db)):
+    return activity.stats(db.connection())
 
-@app.get("/api/leads/{lead_id}")
-def get_lead(lead_id: int, db: Session = Depends(get_db)):
+# -----------------------------------------------------------------------------
+# Near-duplicate leads (find, dismiss, merge)
+# declared before /api/leads/{lead_id} so the static paths match first
+# -----------------------------------------------------------------------------
+@app.get("/api/leads/duplicates")
+def list_duplicates(
+    status: str = Query("open", pattern="^(open|dismissed)$"),
+    min_score: float = Query(0.0, ge=0.0, le=1.0),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    q = (db.query(LeadDuplicate)
+         .filter(LeadDuplicate.status == status, LeadDuplicate.score >= min_score)
+         .order_by(LeadDuplicate.score.desc(), LeadDuplicate.id)
+         .offset(offset).limit(limit))
+    return [d.to_dict() for d in q.all()]
+
+@app.post("/api/leads/duplicates/scan")
+async def scan_duplicates(threshold: float = Query(dedupe.DEDUPE_THRESHOLD, ge=0.0, le=1.0)):
+    """Batch job: score leads that share a blocking key, record likely duplicate pairs."""
+    return await asyncio.to_thread(dedupe.scan, engine, threshold)
+
+@app.post("/api/leads/duplicates/{pair_id}/dismiss")
+def dismiss_duplicate(pair_id: int, db: Session = Depends(get_db)):
+    if not dedupe.dismiss(db.connection(), pair_id):
+        raise HTTPException(404, "Duplicate pair not found")
+    db.commit()
+    return {"ok": True, "id": pair_id, "status": "dismissed"}
+
+@app.get("/api/leads/{lead_id}/duplicates")
+def lead_duplicates(lead_id: int, threshold: float = Query(dedupe.DEDUPE_THRESHOLD, ge=0.0, le=1.0),
+                    db: Session = Depends(get_db)):
     lead = db.query(LeadModel).filter(LeadModel.id == lead_id).first()
     if not lead:
         raise HTTPException(404, "Lead not found")
-    return lead_to_dict(lead)
+    return dedupe.check(db.connection(), lead.name, lead.email, lead.phone, threshold=threshold, exclude=lead_id)
+
+class MergeIn(BaseModel):
+    duplicate_ids: List[int]
+
+@app.post("/api/leads/{lead_id}/merge")
+def merge_leads(lead_id: int, body: MergeIn, db: Session = Depends(get_db)):
+    """Merge duplicates into this lead: their messages move here, then they are deleted."""
+    try:
+        result = dedupe.merge(db.connection(), lead_id, body.duplicate_ids)
+    except LookupError as e:
+        raise HTTPException(404, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    db.commit()
+    lead_cache.invalidate([lead_id, *result["merged"]])
+    return result
+
+@app.get("/api/leads/{lead_id}")
+def get_lead(lead_id: int, request: Request, db: Session = Depends(get_db)):
+    """Lead detail from the lead cache; If-None-Match with the current ETag gets 304."""
+    entry = lead_cache.cache.entry(db, lead_id)
+    if entry is None:
+        raise HTTPException(404, "Lead not found")
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if lead_cache.matches(request.headers.get("if-none-match"), entry.etag):
+        lead_cache.NOT_MODIFIED.inc()
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
 
 # -----------------------------------------------------------------------------
 # Capture (simple: create + mock enrichment)
@@ -110,10 +327,17 @@ class CaptureIn(BaseModel):
     phone: Optional[str] = None
 
 @app.post("/api/leads/capture")
-def capture(lead: CaptureIn, db: Session = Depends(get_db)):
+def capture(lead: CaptureIn, force: bool = False, db: Session = Depends(get_db)):
     exists = db.query(LeadModel).filter(LeadModel.email == lead.email).first()
     if exists:
         raise HTTPException(status_code=400, detail=f"Lead with email {lead.email} already exists")
+    if not force:
+        duplicates = dedupe.check(db.connection(), lead.name, lead.email, lead.phone)
+        if duplicates:
+            raise HTTPException(status_code=409, detail={
+                "message": "Looks like an existing lead; merge it or pass force=true to create it anyway",
+                "duplicates": duplicates,
+            })
 
     now = datetime.utcnow()
     l = LeadModel(
@@ -133,6 +357,8 @@ def capture(lead: CaptureIn, db: Session = Depends(get_db)):
         enriched_at=now,
     )
     db.add(l)
+    db.flush()
+    scoring.score_leads(db.connection(), [l.id])
     db.commit()
     db.refresh(l)
     return lead_to_dict(l)
@@ -142,43 +368,62 @@ def capture(lead: CaptureIn, db: Session = Depends(get_db)):
 # -----------------------------------------------------------------------------
 @app.post("/api/leads/{lead_id}/personalize")
 async def personalize_lead(lead_id: int, db: Session = Depends(get_db)):
-    lead = db.query(LeadModel).filter(LeadModel.id == lead_id).first()
+    lead = lead_cache.get(db, lead_id)
     if not lead:
         raise HTTPException(404, "Lead not found")
 
-    lead_data = {
-        "name": lead.name,
-        "company": lead.company,
-        "job_title": lead.job_title,
-        "location": lead.location,
-        "industry": lead.industry,
-        "company_size": lead.company_size,
-    }
-    messages = await personalization_service.generate_messages(lead_data)
+    messages = await personalization_service.generate_messages(autopilot.lead_profile(lead))
     return {
         "lead_id": lead_id,
-        "lead_name": lead.name,
+        "lead_name": lead["name"],
         "messages": messages,
         "generated_at": datetime.utcnow().isoformat(),
     }
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Streaming variant: SSE events `start`, `token` ({artifact, delta}) and a final `done`
+# carrying the same payload as /personalize (validated, signature-patched).
+@app.post("/api/leads/{lead_id}/personalize/stream")
+async def personalize_lead_stream(lead_id: int, db: Session = Depends(get_db)):
+    lead = lead_cache.get(db, lead_id)
+    if not lead:
+        raise HTTPException(404, "Lead not found")
+
+    lead_name = lead["name"]
+    lead_data = autopilot.lead_profile(lead)
+
+    async def events():
+        yield _sse("start", {"lead_id": lead_id, "lead_name": lead_name})
+        async for ev in personalization_service.stream_messages(lead_data):
+            if ev["type"] == "done":
+                yield _sse("done", {
+                    "lead_id": lead_id,
+                    "lead_name": lead_name,
+                    "messages": ev["messages"],
+                    "generated_at": datetime.utcnow().isoformat(),
+                })
+            else:
+                yield _sse(ev["type"], {"artifact": ev["artifact"], "delta": ev["delta"]})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/api/leads/personalize/batch")
 async def personalize_batch(lead_ids: List[int], db: Session = Depends(get_db)):
     out = []
     for lid in lead_ids[:10]:
-        lead = db.query(LeadModel).filter(LeadModel.id == lid).first()
+        lead = lead_cache.get(db, lid)
         if not lead:
             continue
-        data = {
-            "name": lead.name,
-            "company": lead.company,
-            "job_title": lead.job_title,
-            "location": lead.location,
-            "industry": lead.industry,
-            "company_size": lead.company_size,
-        }
-        messages = await personalization_service.generate_messages(data)
-        out.append({"lead_id": lid, "lead_name": lead.name, "messages": messages})
+        # batch priority: interactive personalize calls overtake it in the LLM scheduler
+        with llm_scheduler.context(llm_scheduler.BATCH):
+            messages = await personalization_service.generate_messages(autopilot.lead_profile(lead))
+        out.append({"lead_id": lid, "lead_name": lead["name"], "messages": messages})
     return {"total": len(out), "results": out}
 
 # -----------------------------------------------------------------------------
@@ -189,31 +434,17 @@ class SmsSendIn(BaseModel):
 
 @app.post("/api/leads/{lead_id}/sms/send")
 async def send_sms(lead_id: int, body: SmsSendIn, db: Session = Depends(get_db)):
-    lead = db.query(LeadModel).filter(LeadModel.id == lead_id).first()
+    lead = lead_cache.get(db, lead_id)
     if not lead:
         raise HTTPException(404, "Lead not found")
 
     sms_text = None
     if body.regenerate:
-        messages = await personalization_service.generate_messages({
-            "name": lead.name,
-            "company": lead.company,
-            "job_title": lead.job_title,
-            "location": lead.location,
-            "industry": lead.industry,
-            "company_size": lead.company_size,
-        })
+        messages = await personalization_service.generate_messages(autopilot.lead_profile(lead), reuse=False)
         sms_text = messages["sms"]
     else:
         # simple fallback if not regenerating
-        messages = await personalization_service.generate_messages({
-            "name": lead.name,
-            "company": lead.company,
-            "job_title": lead.job_title,
-            "location": lead.location,
-            "industry": lead.industry,
-            "company_size": lead.company_size,
-        })
+        messages = await personalization_service.generate_messages(autopilot.lead_profile(lead))
         sms_text = messages["sms"]
 
     msg = MessageModel(
@@ -229,7 +460,7 @@ async def send_sms(lead_id: int, body: SmsSendIn, db: Session = Depends(get_db))
     db.commit()
     db.refresh(msg)
 
-    to_num = lead.phone or "+15550000000"
+    to_num = lead["phone"] or "+15550000000"
     return {
         "sent": True,
         "provider": {"sid": "dry_run", "status": "queued", "to": to_num},
@@ -239,55 +470,56 @@ async def send_sms(lead_id: int, body: SmsSendIn, db: Session = Depends(get_db))
 
 # Twilio-style inbound (form-encoded)
 @app.post("/integrations/twilio/inbound")
-async def twilio_inbound(request: Request, db: Session = Depends(get_db)):
+async def twilio_inbound(request: Request):
     form = await request.form()
     from_num = (form.get("From") or "").strip()
     body = form.get("Body") or ""
     if not from_num:
         raise HTTPException(400, "From required")
 
-    lead = db.query(LeadModel).filter(LeadModel.phone == from_num).first()
-    if not lead:
-        raise HTTPException(404, detail="No lead matched by phone")
-
-    msg = MessageModel(
-        lead_id=lead.id,
-        direction="inbound",
+    res = await ingest.batcher.submit(ingest.Inbound(
         channel="sms",
+        sender=from_num,
         body=body,
-        status="received",
-        created_at=datetime.utcnow(),
-    )
-    db.add(msg)
-    db.commit()
-    db.refresh(msg)
-    return {"ok": True, "stored_message_id": msg.id, "matched_lead_id": lead.id}
+        provider_id=(form.get("MessageSid") or form.get("SmsSid") or "").strip() or None,
+    ))
+    if res.lead_id is None:
+        raise HTTPException(404, detail="No lead matched by phone")
+    return {"ok": True, "stored_message_id": res.message_id, "matched_lead_id": res.lead_id,
+            "duplicate": res.duplicate}
 
 # -----------------------------------------------------------------------------
 # Email (console .eml)
 # -----------------------------------------------------------------------------
 OUTBOX = os.path.join(os.getcwd(), "outbox", "emails")
-os.makedirs(OUTBOX, exist_ok=True)
-FROM_ADDR = os.getenv("EMAIL_FROM", "noreply@solisa.ai")
-CALENDLY_URL = os.getenv("CALENDLY_URL") or os.getenv("NEXT_PUBLIC_CALENDLY_URL") or ""
+FROM_ADDR = settings.email_from
+CALENDLY_URL = settings.calendly_url or settings.next_public_calendly_url
 
 class EmailSendIn(BaseModel):
     regenerate: bool = True
 
+def _write_eml(lead: Dict[str, Any], subject: str, body: str) -> str:
+    # the shared sequence keeps names unique when several workers write the same second
+    seq = shared_state.state.incr("outbox:seq")
+    eml_name = f"{datetime.utcnow():%Y%m%d-%H%M%S}-{seq:06d}__{lead['email'].replace('@','_at_')}.eml"
+    os.makedirs(OUTBOX, exist_ok=True)
+    eml_path = os.path.join(OUTBOX, eml_name)
+    with metrics.timed(metrics.OUTBOX_WRITE_LATENCY), profiling.span("outbox", eml_name):
+        with open(eml_path, "w", encoding="utf-8") as f:
+            f.write(f"From: Solisa AI <{FROM_ADDR}>\n")
+            f.write(f"To: {lead['name']} <{lead['email']}>\n")
+            f.write(f"Subject: {subject}\n")
+            f.write("Content-Type: text/plain; charset=utf-8\n\n")
+            f.write(body)
+    return eml_path
+
 @app.post("/api/leads/{lead_id}/email/send")
 async def send_email(lead_id: int, data: EmailSendIn, db: Session = Depends(get_db)):
-    lead = db.query(LeadModel).filter(LeadModel.id == lead_id).first()
+    lead = lead_cache.get(db, lead_id)
     if not lead:
         raise HTTPException(404, "Lead not found")
 
-    msgs = await personalization_service.generate_messages({
-        "name": lead.name,
-        "company": lead.company,
-        "job_title": lead.job_title,
-        "location": lead.location,
-        "industry": lead.industry,
-        "company_size": lead.company_size,
-    })
+    msgs = await personalization_service.generate_messages(autopilot.lead_profile(lead))
 
     subject = msgs["email"]["subject"]
     body = msgs["email"]["body"]
@@ -296,15 +528,7 @@ async def send_email(lead_id: int, data: EmailSendIn, db: Session = Depends(get_
     if CALENDLY_URL and CALENDLY_URL not in body:
         body = body.rstrip() + f"\n\nBook a time: {CALENDLY_URL}\n"
 
-    eml_name = f"{datetime.utcnow():%Y%m%d-%H%M%S}__{lead.email.replace('@','_at_')}.eml"
-    eml_path = os.path.join(OUTBOX, eml_name)
-    with open(eml_path, "w", encoding="utf-8") as f:
-        f.write(f"From: Solisa AI <{FROM_ADDR}>\n")
-        f.write(f"To: {lead.name} <{lead.email}>\n")
-        f.write(f"Subject: {subject}\n")
-        f.write("Content-Type: text/plain; charset=utf-8\n")
-        f.write("\n")
-        f.write(body)
+    eml_path = _write_eml(lead, subject, body)
 
     msg = MessageModel(
         lead_id=lead_id,
@@ -325,66 +549,47 @@ async def send_email(lead_id: int, data: EmailSendIn, db: Session = Depends(get_
         "provider": {"transport": "console", "eml_path": eml_path},
         "message_id": msg.id,
         "subject": subject,
-        "to": lead.email,
+        "to": lead["email"],
     }
 
 # Email inbound (for demo; form-encoded)
 @app.post("/integrations/email/inbound")
-async def email_inbound(request: Request, db: Session = Depends(get_db)):
+async def email_inbound(request: Request):
     form = await request.form()
     sender = (form.get("From") or form.get("from") or "").strip()
     to = form.get("To") or form.get("to") or ""
     subject = form.get("Subject") or form.get("subject") or ""
     text = form.get("Text") or form.get("text") or ""
+    message_id = (form.get("Message-ID") or form.get("Message-Id") or form.get("message-id") or "").strip()
 
     if not sender:
         raise HTTPException(400, "From required")
 
-    lead = db.query(LeadModel).filter(LeadModel.email == sender).first()
-    if not lead:
-        raise HTTPException(404, "No lead matched by email")
-
-    msg = MessageModel(
-        lead_id=lead.id,
-        direction="inbound",
+    res = await ingest.batcher.submit(ingest.Inbound(
         channel="email",
+        sender=sender,
         subject=subject,
         body=text,
-        status="received",
-        created_at=datetime.utcnow(),
-    )
-    db.add(msg)
-    db.commit()
-    db.refresh(msg)
-    return {"ok": True, "stored_message_id": msg.id, "matched_lead_id": lead.id}
+        provider_id=message_id or None,
+    ))
+    if res.lead_id is None:
+        raise HTTPException(404, "No lead matched by email")
+    return {"ok": True, "stored_message_id": res.message_id, "matched_lead_id": res.lead_id,
+            "duplicate": res.duplicate}
 
 # Optional: create .eml and just return the path (UI can “Open in Mail”)
 @app.post("/api/leads/{lead_id}/email/compose")
 async def compose_email(lead_id: int, db: Session = Depends(get_db)):
-    lead = db.query(LeadModel).filter(LeadModel.id == lead_id).first()
+    lead = lead_cache.get(db, lead_id)
     if not lead:
         raise HTTPException(404, "Lead not found")
-    msgs = await personalization_service.generate_messages({
-        "name": lead.name,
-        "company": lead.company,
-        "job_title": lead.job_title,
-        "location": lead.location,
-        "industry": lead.industry,
-        "company_size": lead.company_size,
-    })
+    msgs = await personalization_service.generate_messages(autopilot.lead_profile(lead))
     subject = msgs["email"]["subject"]
     body = msgs["email"]["body"]
     if CALENDLY_URL and CALENDLY_URL not in body:
         body = body.rstrip() + f"\n\nBook a time: {CALENDLY_URL}\n"
 
-    eml_name = f"{datetime.utcnow():%Y%m%d-%H%M%S}__{lead.email.replace('@','_at_')}.eml"
-    eml_path = os.path.join(OUTBOX, eml_name)
-    with open(eml_path, "w", encoding="utf-8") as f:
-        f.write(f"From: Solisa AI <{FROM_ADDR}>\n")
-        f.write(f"To: {lead.name} <{lead.email}>\n")
-        f.write(f"Subject: {subject}\n")
-        f.write("Content-Type: text/plain; charset=utf-8\n\n")
-        f.write(body)
+    eml_path = _write_eml(lead, subject, body)
 
     return {"ok": True, "compose_path": eml_path, "subject": subject}
 
@@ -392,19 +597,103 @@ async def compose_email(lead_id: int, db: Session = Depends(get_db)):
 # Messages thread
 # -----------------------------------------------------------------------------
 @app.get("/api/leads/{lead_id}/messages")
-def thread(lead_id: int, db: Session = Depends(get_db)):
-    msgs = (
-        db.query(MessageModel)
-        .filter(MessageModel.lead_id == lead_id)
-        .order_by(MessageModel.created_at.asc())
-        .all()
+def thread(
+    lead_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    include_archived: bool = True,
+    db: Session = Depends(get_read_db),
+):
+    q = db.query(MessageModel).filter(MessageModel.lead_id == lead_id)
+    if limit is None:
+        rows = [msg_to_dict(m) for m in q.order_by(MessageModel.created_at.asc()).all()]
+    else:
+        newest = q.order_by(MessageModel.created_at.desc(), MessageModel.id.desc()).limit(limit).all()
+        rows = [msg_to_dict(m) for m in reversed(newest)]
+
+    # cold rows live in archive segments; only decompressed when this lead has any.
+    # Per-channel/status policies can archive rows newer than surviving hot ones,
+    # so a full page of hot rows is still merged with the newest archived ones
+    conn = db.connection()
+    if include_archived and archive.has_archived(conn, lead_id):
+        rows = archive.load_for_lead(conn, lead_id, limit) + rows
+        rows.sort(key=lambda d: (d.get("created_at") or "", d["id"]))
+        if limit is not None:
+            rows = rows[-limit:]
+    return rows
+
+# -----------------------------------------------------------------------------
+# Full-text search (leads + message history)
+# -----------------------------------------------------------------------------
+@app.get("/api/search")
+def search_endpoint(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: str = Query("all", pattern="^(leads|messages|all)$"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    lead_id: Optional[int] = None,
+    channel: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    search.ensure_search_index(engine)
+    conn = db.connection()
+    out: Dict[str, Any] = {"q": q}
+    if type in ("leads", "all") and lead_id is None:
+        out["leads"] = search.search_leads(conn, q, limit, offset)
+    if type in ("messages", "all"):
+        out["messages"] = search.search_messages(conn, q, limit, offset, lead_id=lead_id, channel=channel)
+    return out
+
+# -----------------------------------------------------------------------------
+# Streaming export (CSV / NDJSON, optional gzip)
+# -----------------------------------------------------------------------------
+_FORMAT = Query("csv", pattern="^(csv|ndjson)$")
+
+@app.get("/api/export/leads")
+def export_leads(
+    request: Request,
+    format: str = _FORMAT,
+    gzip: bool = False,
+    status: Optional[str] = None,
+    enriched: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    q = export.leads_query(status=status, enriched=enriched, since=since, until=until)
+    return StreamingResponse(
+        export.stream_rows(q, export.LEAD_COLUMNS, format, gzip, entity="leads",
+                           bind=db_router.router.engine_for(db_router.client_key(request))),
+        media_type=export.media_type(format, gzip),
+        headers=export.response_headers("leads", format, gzip),
+    )
+
+@app.get("/api/export/messages")
+def export_messages(
+    request: Request,
+    format: str = _FORMAT,
+    gzip: bool = False,
+    lead_id: Optional[int] = None,
+    channel: Optional[str] = None,
+    direction: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    q = export.messages_query(lead_id=lead_id, channel=channel, direction=direction,
+                              status=status, since=since, until=until)
+    return StreamingResponse(
+        export.stream_rows(q, export.MESSAGE_COLUMNS, format, gzip, entity="messages",
+                           bind=db_router.router.engine_for(db_router.client_key(request))),
+        media_type=export.media_type(format, gzip),
+        headers=export.response_headers("messages", format, gzip),
     )
-    return [msg_to_dict(m) for m in msgs]
 
 # -----------------------------------------------------------------------------
 # Agentic follow-ups (Phase 2 demo)
 # -----------------------------------------------------------------------------
-FOLLOWUP_CTX: Dict[int, str] = {}  # simple in-memory store for demo
+# latest ingested context per lead, shared across workers (see shared_state.py)
+FOLLOWUP_CTX_TTL_SEC = settings.followup_ctx_ttl_sec
+
+_ctx_key = autopilot.ctx_key
 
 class AutopilotPlan(BaseModel):
     action: str                   # "sms" | "email" | "call_script" | "task" | "wait"
@@ -428,13 +717,7 @@ def _recent_thread_as_text(db: Session, lead_id: int, limit: int = 12) -> str:
         .limit(limit)
         .all()
     )
-    lines = []
-    for m in reversed(msgs):
-        who = "Prospect" if m.direction == "inbound" else "Agent"
-        ch  = m.channel.upper()
-        subj = f" subj={m.subject}" if getattr(m, "subject", None) else ""
-        lines.append(f"[{who} {ch}{subj}] {m.body}")
-    return "\n".join(lines) if lines else ""
+    return autopilot.thread_text(reversed(msgs))
 
 @app.post("/api/leads/{lead_id}/followups/ingest")
 async def ingest_followups(lead_id: int, request: Request, db: Session = Depends(get_db)):
@@ -457,7 +740,7 @@ async def ingest_followups(lead_id: int, request: Request, db: Session = Depends
     if not lead:
         raise HTTPException(404, "Lead not found")
 
-    FOLLOWUP_CTX[lead_id] = text.strip()
+    shared_state.state.set(_ctx_key(lead_id), text.strip(), ttl=FOLLOWUP_CTX_TTL_SEC)
 
     note = MessageModel(
         lead_id=lead_id,
@@ -472,75 +755,32 @@ async def ingest_followups(lead_id: int, request: Request, db: Session = Depends
     return {"ok": True, "lead_id": lead_id, "stored_bytes": len(text.strip())}
 
 async def _run_autopilot_internal(lead_id: int, db: Session) -> AutopilotResult:
-    lead = db.query(LeadModel).filter(LeadModel.id == lead_id).first()
+    lead = lead_cache.get(db, lead_id)
     if not lead:
         raise HTTPException(404, "Lead not found")
 
-    context = FOLLOWUP_CTX.get(lead_id) or _recent_thread_as_text(db, lead_id) or "(no prior context)"
+    context = shared_state.state.get(_ctx_key(lead_id)) or _recent_thread_as_text(db, lead_id) or "(no prior context)"
+    result = await autopilot.analyze(lead_id, autopilot.lead_profile(lead), context)
 
-    lead_dict = {
-        "name": lead.name,
-        "company": lead.company,
-        "job_title": lead.job_title,
-        "location": lead.location,
-        "industry": lead.industry,
-        "company_size": lead.company_size,
-    }
-    drafts = await personalization_service.generate_messages(lead_dict)
-
-    calendly = CALENDLY_URL
-    email_body = drafts["email"]["body"]
-    if calendly and calendly not in email_body:
-        email_body = email_body.rstrip() + f"\n\nBook a time: {calendly}\n"
-
-    lower_ctx = context.lower()
-    intent = "unknown"
-    if "ready" in lower_ctx or "let’s switch" in lower_ctx or "let's switch" in lower_ctx:
-        intent = "ready_to_switch"
-    elif "next month" in lower_ctx or "maybe" in lower_ctx:
-        intent = "considering"
-    elif "just browsing" in lower_ctx:
-        intent = "just_browsing"
-
-    objections = []
-    if "price" in lower_ctx or "too expensive" in lower_ctx:
-        objections.append("price")
-    if "claim" in lower_ctx:
-        objections.append("claims")
-
-    reasoning = f"Detected intent='{intent}' with objections={objections}. Drafting next-best actions."
-
-    plan: List[AutopilotPlan] = [
-        AutopilotPlan(action="sms", when="now", body=drafts["sms"], meta={"channel": "sms"}),
-        AutopilotPlan(
-            action="email", when="now",
-            subject=drafts["email"]["subject"], body=email_body,
-            meta={"channel": "email", "calendly": calendly} if calendly else {"channel": "email"}
-        ),
-        AutopilotPlan(action="task", when="in_2h",
-                      body="Prep ROI one-pager and claims SLA, tailored to objections.",
-                      meta={"assignee": "agent", "priority": "high"}),
-    ]
-
-    # persist drafts as 'draft' messages so they appear in the timeline
-    now = datetime.utcnow()
-    db.add_all([
-        MessageModel(lead_id=lead_id, direction="outbound", channel="sms",
-                     body=drafts["sms"], status="draft", created_at=now),
-        MessageModel(lead_id=lead_id, direction="outbound", channel="email",
-                     subject=drafts["email"]["subject"], body=email_body,
-                     status="draft", created_at=now),
-    ])
+    # drafts appear in the timeline as the lead's current 'draft' messages (one per
+    # channel; re-runs replace them, drafts.py keeps the previous texts)
+    drafts.upsert_many(db.connection(), result.draft_rows(datetime.utcnow()))
+    scoring.record_signals(db.connection(), lead_id, result.intent, result.objections)
     db.commit()
 
     return AutopilotResult(
         lead_id=lead_id,
-        reasoning=reasoning,
-        state={"intent": intent, "objections": objections},
-        plan=plan,
+        reasoning=result.reasoning,
+        state={"intent": result.intent, "objections": result.objections},
+        plan=[AutopilotPlan(**item) for item in result.plan],
         used_context=context,
     )
 
+@app.get("/api/leads/{lead_id}/drafts/history")
+def draft_history(lead_id: int, channel: Optional[str] = None, db: Session = Depends(get_db)):
+    """Draft texts replaced by later autopilot / batch runs, newest first."""
+    return drafts.history(db.connection(), lead_id, channel)
+
 # canonical path your OpenAPI showed
 @app.post("/api/leads/{lead_id}/followups/autopilot", response_model=AutopilotResult)
 async def followups_autopilot(lead_id: int, db: Session = Depends(get_db)):
@@ -550,3 +790,53 @@ async def followups_autopilot(lead_id: int, db: Session = Depends(get_db)):
 @app.post("/api/leads/{lead_id}/followups/run", response_model=AutopilotResult)
 async def followups_run(lead_id: int, db: Session = Depends(get_db)):
     return await _run_autopilot_internal(lead_id, db)
+
+@app.post("/api/followups/sweep", status_code=202)
+async def followups_sweep(fresh: bool = False, max_leads: Optional[int] = Query(None, ge=1)):
+    """Run autopilot over every lead due for a follow-up, in the background (resumes an unfinished run)."""
+    if not autopilot.sweeper.start(resume=not fresh, max_leads=max_leads):
+        raise HTTPException(409, "A sweep is already running")
+    return {"ok": True, "started": True}
+
+@app.get("/api/followups/sweep")
+def followups_sweep_status(db: Session = Depends(get_db)):
+    """The latest sweep run (progress + checkpoint) and how many leads are due now."""
+    conn = db.connection()
+    return {
+        "running": autopilot.sweeper.running,
+        "due": autopilot.count_due(conn),
+        "last_run": autopilot.latest_run(conn),
+    }
+
+# -----------------------------------------------------------------------------
+# Offline batch generation (Batch API, see llm_batch.py)
+# -----------------------------------------------------------------------------
+class BatchExportIn(BaseModel):
+    lead_ids: Optional[List[int]] = None
+    status: Optional[str] = None
+    limit: Optional[int] = None
+    submit: bool = True
+
+@app.post("/api/generation/batches")
+async def create_generation_batch(body: BatchExportIn):
+    """Export SMS + email requests for the selected leads and (by default) submit them."""
+    batch = await asyncio.to_thread(llm_batch.export, lead_ids=body.lead_ids, status=body.status, limit=body.limit)
+    if batch is None:
+        raise HTTPException(400, "No leads to export (none match or all are in an open batch)")
+    if body.submit:
+        batch = await asyncio.to_thread(llm_batch.advance, batch["id"])
+    return batch
+
+@app.get("/api/generation/batches")
+def list_generation_batches(limit: int = Query(20, ge=1, le=200)):
+    return llm_batch.list_batches(limit)
+
+@app.post("/api/generation/batches/{batch_id}/advance")
+async def advance_generation_batch(batch_id: int):
+    """Submit / poll / ingest one batch as far as it can go now."""
+    try:
+        return await asyncio.to_thread(llm_batch.advance, batch_id)
+    except LookupError:
+        raise HTTPException(404, "Batch not found")
+    except RuntimeError as e:
+        raise HTTPException(409, str(e))
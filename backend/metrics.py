@@ -0,0 +1,310 @@
+# backend/metrics.py
+"""
+Lightweight Prometheus-style metrics (no external dependency).
+
+- Counters / histograms kept in-process, rendered in the Prometheus text format
+- ASGI timing middleware (per-route latency histograms)
+- SQLAlchemy hooks: query counts/durations + pool checkout waits
+- Helpers for LLM calls (latency, tokens, errors) and outbox writes
+
+Set METRICS_ENABLED=false to turn everything into no-ops.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+import profiling
+from settings import settings
+
+METRICS_ENABLED = settings.metrics_enabled
+
+# Latency buckets (seconds) — tuned for API / DB / LLM work
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+LLM_BUCKETS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+
+# ── Metric types ──────────────────────────────────────────────────────────────
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labels, k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *label_values: str, value: float) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = value
+
+    def dec(self, *label_values: str, amount: float = 1.0) -> None:
+        self.inc(*label_values, amount=-amount)
+
+
+_INF = 'le="+Inf"'
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values: str, value: float) -> None:
+        if not METRICS_ENABLED:
+            return
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(label_values)
+            if row is None:
+                row = self._values[label_values] = [0.0] * (len(self.buckets) + 2)
+            row[idx] += 1
+            row[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        out: List[str] = []
+        for k, row in items:
+            cum = 0.0
+            for i, b in enumerate(self.buckets):
+                cum += row[i]
+                le = 'le="%s"' % b
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, le)} {cum}")
+            cum += row[len(self.buckets)]
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, _INF)} {cum}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, k)} {row[-1]}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, k)} {cum}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics.values():
+            lines.append(f"# HELP {m.name} {m.doc}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "solisa_http_request_duration_seconds", "HTTP request latency by route",
+    ("method", "route", "status"),
+))
+DB_QUERIES = REGISTRY.register(Counter(
+    "solisa_db_queries_total", "SQL statements executed", ("statement",),
+))
+DB_QUERY_LATENCY = REGISTRY.register(Histogram(
+    "solisa_db_query_duration_seconds", "SQL statement latency", ("statement",),
+))
+DB_POOL_WAIT = REGISTRY.register(Histogram(
+    "solisa_db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection",
+))
+DB_POOL_CHECKED_OUT = REGISTRY.register(Gauge(
+    "solisa_db_pool_checked_out", "DB connections currently checked out",
+))
+LLM_LATENCY = REGISTRY.register(Histogram(
+    "solisa_llm_request_duration_seconds", "LLM call latency", ("model", "prompt"),
+    buckets=LLM_BUCKETS,
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "solisa_llm_tokens_total", "LLM tokens used", ("model", "prompt", "kind"),
+))
+LLM_ERRORS = REGISTRY.register(Counter(
+    "solisa_llm_errors_total", "LLM call failures", ("model", "prompt", "error"),
+))
+OUTBOX_WRITE_LATENCY = REGISTRY.register(Histogram(
+    "solisa_outbox_write_duration_seconds", "Time to write an .eml file to the outbox",
+))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# ── HTTP middleware ───────────────────────────────────────────────────────────
+class MetricsMiddleware:
+    """Pure ASGI middleware (cheaper than BaseHTTPMiddleware on the hot path)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = scope.get("route")
+            # use the route template (/api/leads/{lead_id}) to keep label cardinality bounded
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.observe(scope.get("method", ""), path, str(status["code"]),
+                                 value=time.perf_counter() - start)
+
+
+# ── SQLAlchemy instrumentation ────────────────────────────────────────────────
+def _statement_kind(statement: str) -> str:
+    head = statement.lstrip()[:8].upper()
+    for kind in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+        if head.startswith(kind):
+            return kind.lower()
+    return "other"
+
+
+def instrument_engine(engine) -> None:
+    """Attach query + pool listeners to an Engine (no-op when metrics are off)."""
+    if not METRICS_ENABLED or getattr(engine, "_solisa_instrumented", False):
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_q_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_q_start")
+        if not starts:
+            return
+        kind = _statement_kind(statement)
+        DB_QUERIES.inc(kind)
+        DB_QUERY_LATENCY.observe(kind, value=time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(ctx):
+        starts = ctx.connection.info.get("_q_start") if ctx.connection is not None else None
+        if starts:
+            starts.pop()
+
+    @event.listens_for(engine.pool, "checkout")
+    def _checkout(dbapi_conn, record, proxy):
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine.pool, "checkin")
+    def _checkin(dbapi_conn, record):
+        DB_POOL_CHECKED_OUT.dec()
+
+    # The pool listeners above carry over to the pool dispose() creates; this patch
+    # lives on the pool instance, so it is applied again to the new one
+    _time_pool_connect(engine.pool)
+
+    @event.listens_for(engine, "engine_disposed")
+    def _on_dispose(eng):
+        _time_pool_connect(eng.pool)
+
+    engine._solisa_instrumented = True
+
+
+def _time_pool_connect(pool) -> None:
+    # There is no "before checkout" pool event, so time Pool.connect() directly.
+    _connect = pool.connect
+
+    def _timed_connect():
+        t0 = time.perf_counter()
+        try:
+            return _connect()
+        finally:
+            DB_POOL_WAIT.observe(value=time.perf_counter() - t0)
+
+    pool.connect = _timed_connect
+
+
+# ── LLM / outbox helpers ──────────────────────────────────────────────────────
+class _LLMCall:
+    __slots__ = ("model", "prompt")
+
+    def __init__(self, model: str, prompt: str):
+        self.model, self.prompt = model, prompt
+
+    def record_usage(self, resp: Any) -> None:
+        usage = getattr(resp, "usage", None)
+        if usage is None:
+            return
+        LLM_TOKENS.inc(self.model, self.prompt, "prompt", amount=getattr(usage, "prompt_tokens", 0) or 0)
+        LLM_TOKENS.inc(self.model, self.prompt, "completion", amount=getattr(usage, "completion_tokens", 0) or 0)
+
+
+@contextmanager
+def llm_call(model: str, prompt: str) -> Iterator[_LLMCall]:
+    """
+    with metrics.llm_call(model, "sms") as call:
+        resp = await client.chat.completions.create(...)
+        call.record_usage(resp)
+    """
+    call = _LLMCall(model, prompt)
+    t0 = time.perf_counter()
+    try:
+        with profiling.span("llm", f"{prompt} ({model})"):
+            yield call
+    except BaseException as e:
+        LLM_ERRORS.inc(model, prompt, type(e).__name__)
+        raise
+    finally:
+        LLM_LATENCY.observe(model, prompt, value=time.perf_counter() - t0)
+
+
+@contextmanager
+def timed(histogram: Histogram, *label_values: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(*label_values, value=time.perf_counter() - t0)
@@ -0,0 +1,550 @@
+# backend/mock_llm.py
+"""
+Deterministic local LLM stand-in for offline load / regression testing.
+
+- In-process drop-ins for `AsyncOpenAI` / `OpenAI` (client.chat.completions.create)
+- Optional OpenAI-compatible HTTP server:  python mock_llm.py --port 8787
+  (then point the SDK at it with OPENAI_BASE_URL=http://127.0.0.1:8787/v1)
+- File-based stand-in for the Batch API (files + batches) used by llm_batch.py
+- Configurable latency distribution, 429 / timeout injection, token accounting
+- Outputs are seeded per prompt, so the same lead always gets the same copy
+
+Enable in the app with LLM_PROVIDER=mock.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from settings import settings
+
+LLM_PROVIDER = settings.llm_provider  # openai | mock
+
+
+# ── Config ────────────────────────────────────────────────────────────────────
+@dataclass
+class MockLLMConfig:
+    seed: int = 0
+    latency_dist: str = "lognormal"   # fixed | uniform | lognormal
+    latency_ms: float = 400.0         # median (lognormal) / mean (uniform) / exact (fixed)
+    latency_jitter: float = 0.35      # sigma (lognormal) or +/- fraction (uniform)
+    rate_limit_rate: float = 0.0      # probability of a 429 per call
+    retry_after_sec: float = 1.0      # Retry-After sent with injected 429s
+    timeout_rate: float = 0.0         # probability a call hangs until it times out
+    timeout_sec: float = 30.0
+    cache_min_tokens: int = 1024      # prompt-prefix caching kicks in above this (OpenAI: 1024)
+    batch_delay_sec: float = 0.0      # how long a submitted batch stays in_progress
+
+    @classmethod
+    def from_env(cls) -> "MockLLMConfig":
+        return cls(
+            seed=int(os.getenv("MOCK_LLM_SEED", "0")),
+            latency_dist=os.getenv("MOCK_LLM_LATENCY_DIST", "lognormal").lower(),
+            latency_ms=float(os.getenv("MOCK_LLM_LATENCY_MS", "400")),
+            latency_jitter=float(os.getenv("MOCK_LLM_LATENCY_JITTER", "0.35")),
+            rate_limit_rate=float(os.getenv("MOCK_LLM_429_RATE", "0")),
+            retry_after_sec=float(os.getenv("MOCK_LLM_RETRY_AFTER_SEC", "1")),
+            timeout_rate=float(os.getenv("MOCK_LLM_TIMEOUT_RATE", "0")),
+            timeout_sec=float(os.getenv("MOCK_LLM_TIMEOUT_SEC", "30")),
+            cache_min_tokens=int(os.getenv("MOCK_LLM_CACHE_MIN_TOKENS", "1024")),
+            batch_delay_sec=float(os.getenv("MOCK_LLM_BATCH_DELAY_SEC", "0")),
+        )
+
+
+@dataclass
+class MockLLMStats:
+    calls: int = 0
+    rate_limited: int = 0
+    timeouts: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    by_prompt: Dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+# ── Errors (shaped like the OpenAI SDK's, so retry paths behave the same) ─────
+_MOCK_URL = "http://mock-llm.local/v1/chat/completions"
+
+
+def rate_limit_error(retry_after: float) -> Exception:
+    try:
+        import httpx
+        import openai
+    except Exception:  # pragma: no cover
+        return RuntimeError("mock 429: rate limit")
+    req = httpx.Request("POST", _MOCK_URL)
+    resp = httpx.Response(
+        429, request=req, headers={"retry-after": f"{retry_after:g}"},
+        json={"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}},
+    )
+    return openai.RateLimitError("Rate limit reached (mock)", response=resp, body=None)
+
+
+def timeout_error() -> Exception:
+    try:
+        import httpx
+        import openai
+    except Exception:  # pragma: no cover
+        return TimeoutError("mock timeout")
+    return openai.APITimeoutError(request=httpx.Request("POST", _MOCK_URL))
+
+
+# ── Deterministic copy ────────────────────────────────────────────────────────
+def count_tokens(text: str) -> int:
+    # ~4 chars/token is close enough for capacity planning
+    return max(1, len(text) // 4) if text else 0
+
+
+def _field(prompt: str, label: str) -> Optional[str]:
+    m = re.search(rf"{label}:\s*([^|\n]+)", prompt)
+    return m.group(1).strip() if m else None
+
+
+def prompt_kind(messages: List[Dict[str, str]], json_mode: bool) -> str:
+    text = "\n".join(m.get("content", "") for m in messages)
+    if json_mode:
+        return "followup"
+    if "SUBJECT:" in text:
+        return "email"
+    if "LinkedIn" in text:
+        return "linkedin"
+    return "sms"
+
+
+_SMS = (
+    "Hi {first}! Quick idea to trim {company}'s premiums without losing coverage — 10 min this week?",
+    "Hey {first}, saw your work as {title} at {company}. Open to a quick coverage review call?",
+    "{first}, teams like {company} are saving 12-18% on coverage. Worth a quick chat?",
+)
+_SUBJECTS = (
+    "Coverage review for {company}",
+    "{first}, a quick idea for {company}",
+    "Cutting {company}'s insurance spend",
+)
+_EMAIL = (
+    "Hi {first},\n\nAs {title} at {company}, you're probably juggling coverage decisions with a lot else. "
+    "We help teams like yours get the same protection for less, with faster claims.\n\n"
+    "Would a 15-minute review be useful?",
+    "Hi {first},\n\nI took a look at {company} and think there's room to tighten your coverage and reduce cost. "
+    "Happy to walk you through a side-by-side.\n\nOpen to a quick call?",
+)
+_LINKEDIN = (
+    "Hi {first} — enjoyed learning about {company}. I help {title}s simplify insurance; would love to connect!",
+    "{first}, great to see what {company} is building. Always glad to swap notes on coverage — let's connect.",
+)
+
+
+def _render(kind: str, prompt: str, rng: random.Random) -> str:
+    name = _field(prompt, "Name") or "there"
+    values = {
+        "first": name.split()[0],
+        "company": _field(prompt, "Company") or "your company",
+        "title": _field(prompt, "Title") or "your role",
+    }
+    if kind == "email":
+        subject = rng.choice(_SUBJECTS).format(**values)
+        return f"SUBJECT: {subject}\n\nBODY:\n{rng.choice(_EMAIL).format(**values)}"
+    if kind == "linkedin":
+        return rng.choice(_LINKEDIN).format(**values)
+    if kind == "followup":
+        stage = rng.choice(("curious", "evaluating", "ready_to_switch"))
+        return json.dumps({
+            "summary": f"Prospect is {stage.replace('_', ' ')}; keep momentum with a concrete next step.",
+            "stage": stage,
+            "intent_signal": rng.choice(("asked about pricing", "mentioned renewal date", "requested a quote")),
+            "objections": rng.sample(["price", "claims", "timing"], k=rng.randint(0, 2)),
+            "recommended_actions": [
+                {"type": "sms", "title": "Nudge", "body": "Quick check-in with a lighter-plan quote", "when": "now"},
+                {"type": "email", "title": "ROI example", "body": "Send ROI proof + booking link", "when": "after_2_days"},
+            ],
+            "sms_1": rng.choice(_SMS).format(first="there", company="your team", title="your role"),
+            "sms_2": "We just cut a similar team's premium 14% without losing coverage. Want a side-by-side?",
+            "email": "Subject: Quick path to savings\n\nHi there,\n\nHappy to share a side-by-side.\n",
+        })
+    return rng.choice(_SMS).format(**values)
+
+
+# ── Core ──────────────────────────────────────────────────────────────────────
+class MockLLM:
+    def __init__(self, config: Optional[MockLLMConfig] = None):
+        self.config = config or MockLLMConfig.from_env()
+        self.stats = MockLLMStats()
+        self._lock = threading.Lock()
+        # one seeded stream for latency/fault injection -> reproducible call sequences
+        self._rng = random.Random(self.config.seed)
+        self._prefixes: Set[bytes] = set()  # message prefixes seen so far (prompt cache)
+
+    def _latency(self) -> float:
+        c = self.config
+        with self._lock:
+            if c.latency_dist == "uniform":
+                ms = c.latency_ms * (1 + self._rng.uniform(-c.latency_jitter, c.latency_jitter))
+            elif c.latency_dist == "lognormal":
+                ms = c.latency_ms * math.exp(self._rng.gauss(0.0, c.latency_jitter))
+            else:
+                ms = c.latency_ms
+        return max(0.0, ms) / 1000.0
+
+    def _fault(self) -> Optional[str]:
+        with self._lock:
+            r = self._rng.random()
+        if r < self.config.rate_limit_rate:
+            return "429"
+        if r < self.config.rate_limit_rate + self.config.timeout_rate:
+            return "timeout"
+        return None
+
+    def _cached_tokens(self, model: str, messages: List[Dict[str, str]]) -> int:
+        """
+        Provider-style prefix cache: the longest run of leading messages already seen
+        (for this model) counts as cached, in 128-token blocks, once it reaches
+        cache_min_tokens. Prefixes are whole messages here, which matches how the
+        static system prompts are laid out.
+        """
+        h = hashlib.sha256(model.encode("utf-8"))
+        cached = tokens = 0
+        keys = []
+        for m in messages[:-1]:  # the final message is never a reusable prefix
+            h.update(b"\x00" + m.get("content", "").encode("utf-8"))
+            tokens += count_tokens(m.get("content", ""))
+            keys.append(h.digest())
+            with self._lock:
+                hit = keys[-1] in self._prefixes
+            if hit and tokens >= self.config.cache_min_tokens:
+                cached = tokens // 128 * 128
+        with self._lock:
+            if len(self._prefixes) > 100_000:
+                self._prefixes.clear()
+            self._prefixes.update(keys)
+        return cached
+
+    def plan(self, model: str, messages: List[Dict[str, str]], **kw) -> Tuple[float, Optional[str], str, str, Dict[str, int]]:
+        """Decide latency, fault and output for one call: (delay, fault, kind, content, usage)."""
+        json_mode = (kw.get("response_format") or {}).get("type") == "json_object"
+        kind = prompt_kind(messages, json_mode)
+        prompt = "\n".join(m.get("content", "") for m in messages)
+        digest = hashlib.sha256(f"{self.config.seed}|{model}|{prompt}".encode("utf-8")).digest()
+        content = _render(kind, prompt, random.Random(int.from_bytes(digest[:8], "big")))
+        max_tokens = kw.get("max_tokens")
+        if max_tokens:
+            content = content[: int(max_tokens) * 4]
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(content)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        usage["prompt_tokens_details"] = {"cached_tokens": self._cached_tokens(model, messages)}
+
+        fault = self._fault()
+        with self._lock:
+            self.stats.calls += 1
+            self.stats.by_prompt[kind] = self.stats.by_prompt.get(kind, 0) + 1
+            if fault == "429":
+                self.stats.rate_limited += 1
+            elif fault == "timeout":
+                self.stats.timeouts += 1
+            else:
+                self.stats.prompt_tokens += usage["prompt_tokens"]
+                self.stats.cached_tokens += usage["prompt_tokens_details"]["cached_tokens"]
+                self.stats.completion_tokens += usage["completion_tokens"]
+        return self._latency(), fault, kind, content, usage
+
+    def _timeout_after(self, kw: Dict[str, Any]) -> float:
+        t = kw.get("timeout")
+        t = getattr(t, "read", t)  # httpx.Timeout or float
+        return min(float(t), self.config.timeout_sec) if isinstance(t, (int, float)) else self.config.timeout_sec
+
+
+def _response(model: str, content: str, usage: Dict[str, int]) -> Any:
+    return SimpleNamespace(
+        id=f"chatcmpl-mock-{hashlib.md5(content.encode('utf-8')).hexdigest()[:12]}",
+        model=model,
+        choices=[SimpleNamespace(index=0, finish_reason="stop",
+                                 message=SimpleNamespace(role="assistant", content=content))],
+        usage=SimpleNamespace(**usage),
+    )
+
+
+# time-to-first-token as a share of total latency when streaming
+STREAM_TTFT_SHARE = 0.25
+
+
+def split_tokens(content: str) -> List[str]:
+    """Chunk text roughly like a tokenizer would (~4 chars, whitespace kept)."""
+    return re.findall(r"\s*\S{1,4}|\s+", content)
+
+
+def _chunk(model: str, delta: Optional[str], usage: Optional[Dict[str, int]] = None) -> Any:
+    choices = [] if delta is None else [
+        SimpleNamespace(index=0, finish_reason=None, delta=SimpleNamespace(role="assistant", content=delta))
+    ]
+    return SimpleNamespace(model=model, choices=choices, usage=SimpleNamespace(**usage) if usage else None)
+
+
+class MockAsyncOpenAI:
+    """Async drop-in for `openai.AsyncOpenAI` (chat.completions.create only, incl. stream=True)."""
+
+    def __init__(self, llm: Optional[MockLLM] = None):
+        self.llm = llm or MockLLM()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, *, model: str, messages: List[Dict[str, str]], stream: bool = False,
+                      stream_options: Optional[Dict[str, Any]] = None, **kw) -> Any:
+        delay, fault, _, content, usage = self.llm.plan(model, messages, **kw)
+        if fault == "429":
+            await asyncio.sleep(min(delay, 0.05))
+            raise rate_limit_error(self.llm.config.retry_after_sec)
+        if fault == "timeout":
+            await asyncio.sleep(self.llm._timeout_after(kw))
+            raise timeout_error()
+        if stream:
+            await asyncio.sleep(delay * STREAM_TTFT_SHARE)
+            return self._stream(model, content, usage, delay * (1 - STREAM_TTFT_SHARE),
+                                bool((stream_options or {}).get("include_usage")))
+        await asyncio.sleep(delay)
+        return _response(model, content, usage)
+
+    async def _stream(self, model: str, content: str, usage: Dict[str, int], remaining: float,
+                      include_usage: bool):
+        pieces = split_tokens(content)
+        gap = remaining / max(1, len(pieces))
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(gap)
+            yield _chunk(model, piece)
+        if include_usage:
+            yield _chunk(model, None, usage)
+
+
+class MockOpenAI:
+    """Sync drop-in for `openai.OpenAI` (chat.completions.create only)."""
+
+    def __init__(self, llm: Optional[MockLLM] = None):
+        self.llm = llm or MockLLM()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, *, model: str, messages: List[Dict[str, str]], **kw) -> Any:
+        delay, fault, _, content, usage = self.llm.plan(model, messages, **kw)
+        if fault == "429":
+            time.sleep(min(delay, 0.05))
+            raise rate_limit_error(self.llm.config.retry_after_sec)
+        if fault == "timeout":
+            time.sleep(self.llm._timeout_after(kw))
+            raise timeout_error()
+        time.sleep(delay)
+        return _response(model, content, usage)
+
+
+# ── Batch API stand-in ────────────────────────────────────────────────────────
+class _FileContent:
+    """Shaped like the SDK's binary file response (files.content)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def iter_lines(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+    def write_to_file(self, file: str) -> None:
+        with open(self.path, "rb") as src, open(file, "wb") as dst:
+            while chunk := src.read(1 << 20):
+                dst.write(chunk)
+
+
+class MockBatchOpenAI:
+    """
+    Sync drop-in for the `files` + `batches` part of `openai.OpenAI`, backed by a
+    directory. A batch completes `batch_delay_sec` after it was created, on the first
+    retrieve() after that; every line is answered by MockLLM (no latency), and
+    injected 429s / timeouts become error-file lines like the real API reports them.
+    """
+
+    def __init__(self, root: str, llm: Optional[MockLLM] = None):
+        self.root = root
+        self.llm = llm or MockLLM()
+        os.makedirs(os.path.join(root, "files"), exist_ok=True)
+        os.makedirs(os.path.join(root, "batches"), exist_ok=True)
+        self.files = SimpleNamespace(create=self._file_create, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._batch_create, retrieve=self._batch_retrieve,
+                                       list=self._batch_list)
+
+    def _path(self, kind: str, obj_id: str) -> str:
+        return os.path.join(self.root, kind, f"{obj_id}.{'jsonl' if kind == 'files' else 'json'}")
+
+    def _file_create(self, *, file: Any, purpose: str) -> Any:
+        file_id = f"file-mock-{os.urandom(6).hex()}"
+        fh = file[1] if isinstance(file, tuple) else file
+        with open(self._path("files", file_id), "wb") as out:
+            while chunk := fh.read(1 << 20):
+                out.write(chunk)
+        return SimpleNamespace(id=file_id, purpose=purpose, bytes=os.path.getsize(self._path("files", file_id)))
+
+    def _file_content(self, file_id: str) -> _FileContent:
+        path = self._path("files", file_id)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"mock batch file {file_id} not found")
+        return _FileContent(path)
+
+    def _save(self, batch: Dict[str, Any]) -> None:
+        tmp = self._path("batches", batch["id"]) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(batch, f)
+        os.replace(tmp, self._path("batches", batch["id"]))
+
+    def _batch_create(self, *, input_file_id: str, endpoint: str, completion_window: str,
+                      metadata: Optional[Dict[str, str]] = None) -> Any:
+        self._file_content(input_file_id)  # 404 like the API for unknown files
+        batch = {
+            "id": f"batch_mock_{os.urandom(6).hex()}", "object": "batch", "endpoint": endpoint,
+            "input_file_id": input_file_id, "completion_window": completion_window, "status": "in_progress",
+            "output_file_id": None, "error_file_id": None, "created_at": int(time.time()), "completed_at": None,
+            "metadata": metadata or {}, "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        self._save(batch)
+        return self._view(batch)
+
+    def _batch_retrieve(self, batch_id: str) -> Any:
+        with open(self._path("batches", batch_id), encoding="utf-8") as f:
+            batch = json.load(f)
+        if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= self.llm.config.batch_delay_sec:
+            self._run(batch)
+            self._save(batch)
+        return self._view(batch)
+
+    def _batch_list(self, *, limit: int = 20) -> List[Any]:
+        """Newest first, like the API (one page: `limit` only sets the page size there)."""
+        batches = []
+        for name in os.listdir(os.path.join(self.root, "batches")):
+            if name.endswith(".json"):
+                with open(os.path.join(self.root, "batches", name), encoding="utf-8") as f:
+                    batches.append(json.load(f))
+        batches.sort(key=lambda b: b["created_at"], reverse=True)
+        return [self._view(b) for b in batches]
+
+    def _run(self, batch: Dict[str, Any]) -> None:
+        out_id, err_id = f"file-mock-{os.urandom(6).hex()}", f"file-mock-{os.urandom(6).hex()}"
+        counts = {"total": 0, "completed": 0, "failed": 0}
+        with open(self._path("files", out_id), "w", encoding="utf-8") as out, \
+                open(self._path("files", err_id), "w", encoding="utf-8") as err:
+            for line in self._file_content(batch["input_file_id"]).iter_lines():
+                if not line.strip():
+                    continue
+                req = json.loads(line)
+                body = req.get("body") or {}
+                model = body.get("model", "mock-gpt")
+                _, fault, _, content, usage = self.llm.plan(
+                    model, body.get("messages") or [],
+                    max_tokens=body.get("max_tokens"), response_format=body.get("response_format"),
+                )
+                counts["total"] += 1
+                rid = f"batch_req_{os.urandom(6).hex()}"
+                if fault:
+                    counts["failed"] += 1
+                    code = 429 if fault == "429" else 504
+                    err.write(json.dumps({"id": rid, "custom_id": req.get("custom_id"), "response": {
+                        "status_code": code, "request_id": rid,
+                        "body": {"error": {"message": f"mock {fault}", "type": "server_error"}},
+                    }, "error": None}) + "\n")
+                    continue
+                counts["completed"] += 1
+                out.write(json.dumps({"id": rid, "custom_id": req.get("custom_id"), "response": {
+                    "status_code": 200, "request_id": rid,
+                    "body": {"id": f"chatcmpl-mock-{rid}", "object": "chat.completion", "model": model,
+                             "choices": [{"index": 0, "finish_reason": "stop",
+                                          "message": {"role": "assistant", "content": content}}],
+                             "usage": usage},
+                }, "error": None}) + "\n")
+        batch.update(status="completed", output_file_id=out_id, error_file_id=err_id if counts["failed"] else None,
+                     completed_at=int(time.time()), request_counts=counts)
+
+    @staticmethod
+    def _view(batch: Dict[str, Any]) -> Any:
+        return SimpleNamespace(**dict(batch, request_counts=SimpleNamespace(**batch["request_counts"])))
+
+
+# ── Optional OpenAI-compatible HTTP server ────────────────────────────────────
+def create_app(llm: Optional[MockLLM] = None):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    llm = llm or MockLLM()
+    app = FastAPI(title="Mock LLM", version="1.0.0")
+
+    @app.get("/v1/models")
+    def models():
+        return {"object": "list", "data": [{"id": "mock-gpt", "object": "model", "owned_by": "local"}]}
+
+    @app.get("/stats")
+    def stats():
+        return llm.stats.as_dict()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        req = await request.json()
+        model = req.get("model", "mock-gpt")
+        delay, fault, _, content, usage = llm.plan(
+            model, req.get("messages") or [],
+            max_tokens=req.get("max_tokens"), response_format=req.get("response_format"),
+        )
+        if fault == "429":
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}},
+                status_code=429, headers={"retry-after": f"{llm.config.retry_after_sec:g}"},
+            )
+        if fault == "timeout":
+            await asyncio.sleep(llm.config.timeout_sec)
+            return JSONResponse({"error": {"message": "timeout (mock)"}}, status_code=504)
+        if req.get("stream"):
+            return StreamingResponse(_sse(model, content, usage, delay, req), media_type="text/event-stream")
+        await asyncio.sleep(delay)
+        return {
+            "id": f"chatcmpl-mock-{hashlib.md5(content.encode('utf-8')).hexdigest()[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        }
+
+    async def _sse(model: str, content: str, usage: Dict[str, int], delay: float, req: Dict[str, Any]):
+        cid = f"chatcmpl-mock-{hashlib.md5(content.encode('utf-8')).hexdigest()[:12]}"
+        pieces = split_tokens(content)
+        await asyncio.sleep(delay * STREAM_TTFT_SHARE)
+        gap = delay * (1 - STREAM_TTFT_SHARE) / max(1, len(pieces))
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(gap)
+            chunk = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        if (req.get("stream_options") or {}).get("include_usage"):
+            chunk = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [], "usage": usage}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return app
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    args = ap.parse_args()
+    uvicorn.run(create_app(), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,235 @@
+# backend/partitions.py
+"""
+Monthly range partitions of `messages` on created_at (Postgres, opt-in:
+MESSAGES_PARTITIONED=true).
+
+`messages` is the table that grows without bound, while reads are mostly of
+recent months. Partitioned, each month is its own table: recent months stay in
+cache, old ones are vacuumed on their own (or detached / dropped), and queries
+bounded on created_at (exports with since/until, archive cut-offs) scan only the
+months they cover.
+
+- on startup an empty table is converted in place; an existing one needs
+  `python partitions.py --convert`, which copies every row in one transaction
+  (run it in a maintenance window)
+- partitions `messages_yYYYYmMM` are created MESSAGES_PARTITIONS_AHEAD months ahead
+  on startup and every CHECK_INTERVAL_SEC; `messages_default` catches anything
+  outside them and should stay empty
+- Postgres only accepts unique indexes that contain the partition key: the primary
+  key becomes (id, created_at), ids stay unique through their sequence, and the
+  one-current-draft index is no longer unique. drafts.py then serializes writers
+  per lead + channel with advisory locks instead of relying on ON CONFLICT
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+import search
+from database import Message, engine
+from settings import settings
+
+MESSAGES_PARTITIONED = settings.messages_partitioned
+MESSAGES_PARTITIONS_AHEAD = settings.messages_partitions_ahead
+
+MESSAGES = Message.__table__
+CHECK_INTERVAL_SEC = 6 * 3600
+DRAFT_INDEX = "ix_messages_current_draft"  # stands in for uq_messages_current_draft
+_LOCK = "hashtext('messages:partitions')"
+
+_partitioned: Dict[str, bool] = {}  # per database URL
+
+
+def month_start(d: datetime) -> datetime:
+    return datetime(d.year, d.month, 1)
+
+
+def add_months(d: datetime, n: int) -> datetime:
+    y, m = divmod(d.year * 12 + d.month - 1 + n, 12)
+    return datetime(y, m + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"messages_y{month:%Y}m{month:%m}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    key = str(conn.engine.url)
+    if key not in _partitioned:
+        _partitioned[key] = bool(conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('messages'))"
+        )).scalar())
+    return _partitioned[key]
+
+
+def lock_keys(conn: Connection, keys: List[str]) -> None:
+    """Transaction-scoped advisory locks, taken in sorted order so writers cannot deadlock."""
+    if keys:
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), [{"k": k} for k in sorted(keys)])
+
+
+def create_partitions(conn: Connection, first: datetime, last: datetime) -> List[str]:
+    """Monthly partitions from `first`'s month through `last`'s. Returns the ones created."""
+    created = []
+    month = month_start(first)
+    while month <= last:
+        name = partition_name(month)
+        if conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar() is None:
+            conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF messages "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+            ))
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_partitions(engine: Engine, ahead: int = MESSAGES_PARTITIONS_AHEAD) -> List[str]:
+    """Create this month's and the next `ahead` months' partitions. Idempotent; safe from several workers."""
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        conn.execute(text(f"SELECT pg_advisory_xact_lock({_LOCK})"))
+        now = datetime.utcnow()
+        created = create_partitions(conn, now, add_months(now, ahead))
+        stray = conn.execute(text("SELECT count(*) FROM messages_default")).scalar()
+    if created:
+        print(f"🗓️ messages partitions created: {', '.join(created)}")
+    if stray:
+        print(f"⚠️ {stray} messages in messages_default (created_at outside the monthly partitions)")
+    return created
+
+
+def convert(engine: Engine, ahead: int = MESSAGES_PARTITIONS_AHEAD) -> int:
+    """Rebuild `messages` as a partitioned table, in one transaction. Returns rows copied (-1 if already done)."""
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return -1
+        conn.execute(text(f"SELECT pg_advisory_xact_lock({_LOCK})"))
+        conn.execute(text("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE"))
+        cols = [c["name"] for c in inspect(conn).get_columns("messages")]
+        lo, hi = conn.execute(text("SELECT min(created_at), max(created_at) FROM messages")).one()
+        seq = conn.execute(text("SELECT pg_get_serial_sequence('messages', 'id')")).scalar()
+
+        conn.execute(text("ALTER TABLE messages RENAME TO messages_unpartitioned"))
+        conn.execute(text(
+            "CREATE TABLE messages (LIKE messages_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(text("ALTER TABLE messages ALTER COLUMN created_at SET DEFAULT (now() AT TIME ZONE 'utc'), "
+                          "ALTER COLUMN created_at SET NOT NULL"))
+        conn.execute(text("ALTER TABLE messages ADD PRIMARY KEY (id, created_at)"))
+        conn.execute(text("ALTER TABLE messages ADD FOREIGN KEY (lead_id) REFERENCES leads (id) ON DELETE CASCADE"))
+        now = datetime.utcnow()
+        create_partitions(conn, lo or now, max(hi or now, add_months(now, ahead)))
+        conn.execute(text("CREATE TABLE messages_default PARTITION OF messages DEFAULT"))
+
+        listed = ", ".join(cols)
+        selected = ", ".join("coalesce(created_at, now() AT TIME ZONE 'utc')" if c == "created_at" else c
+                             for c in cols)
+        copied = conn.execute(text(
+            f"INSERT INTO messages ({listed}) SELECT {selected} FROM messages_unpartitioned"
+        )).rowcount
+        if seq:
+            conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY messages.id"))
+        conn.execute(text("DROP TABLE messages_unpartitioned"))
+
+        # the model's indexes, minus the unique draft index Postgres cannot keep here
+        for ix in MESSAGES.indexes:
+            if ix.name != "uq_messages_current_draft":
+                ix.create(conn)
+        conn.execute(text(f"CREATE INDEX {DRAFT_INDEX} ON messages (lead_id, channel) WHERE status = 'draft'"))
+        search.create_search_index(conn)  # the tsvector trigger and GIN index
+        _partitioned[str(conn.engine.url)] = True
+    print(f"🗓️ messages converted to monthly partitions ({copied} rows)")
+    return copied
+
+
+def list_partitions(conn: Connection) -> List[Dict[str, Any]]:
+    if not is_partitioned(conn):
+        return []
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint, "
+        "pg_total_relation_size(c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'messages'::regclass ORDER BY c.relname"
+    )).all()
+    return [{"name": r[0], "bounds": r[1], "rows_estimate": max(int(r[2]), 0), "bytes": int(r[3])} for r in rows]
+
+
+def ensure(engine: Engine) -> None:
+    """Startup: convert an empty messages table when partitioning is on, then create upcoming partitions."""
+    if not MESSAGES_PARTITIONED:
+        return
+    if engine.dialect.name != "postgresql":
+        print("⚠️ MESSAGES_PARTITIONED needs Postgres; ignored")
+        return
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            if conn.execute(text("SELECT EXISTS (SELECT 1 FROM messages)")).scalar():
+                print("⚠️ MESSAGES_PARTITIONED: messages has rows; run `python partitions.py --convert`")
+                return
+            conn.rollback()
+            convert(engine)
+    ensure_partitions(engine)
+
+
+class Maintainer:
+    """Creates upcoming partitions every CHECK_INTERVAL_SEC while the app runs."""
+
+    def __init__(self, engine: Engine, interval: float = CHECK_INTERVAL_SEC):
+        self.engine = engine
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if not MESSAGES_PARTITIONED or self.engine.dialect.name != "postgresql" or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="messages-partitions")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(ensure_partitions, self.engine)
+            except Exception as e:
+                print(f"⚠️ messages partition maintenance failed: {e}")
+
+
+maintainer = Maintainer(engine)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from database import init_db
+
+    ap = argparse.ArgumentParser(description="Monthly partitions of the messages table (Postgres)")
+    ap.add_argument("--convert", action="store_true", help="rebuild messages as a partitioned table (copies all rows)")
+    ap.add_argument("--ahead", type=int, default=MESSAGES_PARTITIONS_AHEAD, help="months to create ahead of now")
+    args = ap.parse_args()
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("messages partitioning needs Postgres")
+    init_db()
+    if args.convert:
+        convert(engine, args.ahead)
+    ensure_partitions(engine, args.ahead)
+    with engine.connect() as conn:
+        print(json.dumps(list_partitions(conn), indent=2))
@@ -6,34 +6,31 @@ AI Personalization Service
 
 from __future__ import annotations
 
-import os
 import asyncio
-from typing import Dict, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from dotenv import load_dotenv
-
-# ── Load env early ────────────────────────────────────────────────────────────
-load_dotenv()
-
-# OpenAI (async)
-try:
-    from openai import AsyncOpenAI  # openai >= 1.0
-except Exception:  # pragma: no cover
-    AsyncOpenAI = None  # handled below
+import copy_reuse
+import http_clients
+import llm_scheduler
+import metrics
+import prompts
+import resilience
+from mock_llm import LLM_PROVIDER, MockAsyncOpenAI
+from prompts import PromptTemplate
+from settings import settings
 
 
 # ── Config / Branding ─────────────────────────────────────────────────────────
-OPENAI_KEY = os.getenv("OPENAI_API_KEY", "")
-MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_KEY = settings.openai_api_key
+MODEL = settings.openai_model
 
-CALENDLY_URL = os.getenv("CALENDLY_URL", "").strip() or \
-               "https://calendly.com/mmohanr1-asu/new-meeting"
+CALENDLY_URL = settings.calendly_url or "https://calendly.com/mmohanr1-asu/new-meeting"
 
-SENDER_NAME = os.getenv("SENDER_NAME", "XYZ")
-SENDER_TITLE = os.getenv("SENDER_TITLE", "Founder")
-SENDER_COMPANY = os.getenv("SENDER_COMPANY", "Solisa AI")
-SENDER_PHONE = os.getenv("SENDER_PHONE", "")
-SENDER_EMAIL = os.getenv("SENDER_EMAIL", "mxxnesh@solisa.ai")
+SENDER_NAME = settings.sender_name
+SENDER_TITLE = settings.sender_title
+SENDER_COMPANY = settings.sender_company
+SENDER_PHONE = settings.sender_phone
+SENDER_EMAIL = settings.sender_email
 
 SIGNATURE_BLOCK = (
     "\n\nBest regards,\n"
@@ -79,6 +76,19 @@ def _build_context(lead: Dict) -> str:
     return " | ".join(parts)
 
 
+def _profile_context(lead: Dict) -> str:
+    """The context minus name and company: what look-alike leads share (copy_reuse.py)."""
+    return _build_context({**lead, "name": None, "company": None})
+
+
+def _replay(messages: Dict) -> List[Dict]:
+    """Finished messages as stream_messages() events (one token per artifact, then done)."""
+    email_raw = f"SUBJECT: {messages['email']['subject']}\n\nBODY:\n{messages['email']['body']}"
+    events = [{"type": "token", "artifact": artifact, "delta": text}
+              for artifact, text in (("sms", messages["sms"]), ("email", email_raw), ("linkedin", messages["linkedin"]))]
+    return events + [{"type": "done", "messages": messages}]
+
+
 def _parse_subject_body(raw: str) -> Dict[str, str]:
     """
     Expect:
@@ -100,45 +110,21 @@ def _parse_subject_body(raw: str) -> Dict[str, str]:
     return {"subject": subject.strip(), "body": "\n".join(body_lines).strip()}
 
 
-# ── Service ───────────────────────────────────────────────────────────────────
-class PersonalizationService:
-    def __init__(self):
-        self.has_api_key = bool(OPENAI_KEY and AsyncOpenAI)
-        self.client: Optional[AsyncOpenAI] = AsyncOpenAI(api_key=OPENAI_KEY) if self.has_api_key else None
-        mode = f"GPT-4x (model={MODEL})" if self.has_api_key else "MOCK"
-        print(f"🤖 Personalization mode: {mode}")
+def _finalize_email(raw: str) -> Dict[str, str]:
+    parsed = _parse_subject_body(raw.strip())
 
-    # Public API
-    async def generate_messages(self, lead: Dict, force_model: Optional[str] = None) -> Dict:
-        """
-        Returns dict with: sms, email{subject,body}, linkedin, context_used
-        """
-        if not self.has_api_key or not self.client:
-            return self._mock_messages(lead)
+    # Safety nets
+    subject = parsed.get("subject") or "Regarding your insurance coverage"
+    body = _ensure_link_and_signature(parsed.get("body", ""))
 
-        ctx = _build_context(lead)
+    return {"subject": subject, "body": body}
 
-        try:
-            sms_task = self._generate_sms(lead, ctx, force_model or MODEL)
-            email_task = self._generate_email(lead, ctx, force_model or MODEL)
-            li_task = self._generate_linkedin(lead, ctx, force_model or MODEL)
-            sms, email, linkedin = await asyncio.gather(sms_task, email_task, li_task)
-            return {
-                "sms": sms,
-                "email": email,
-                "linkedin": linkedin,
-                "context_used": ctx,
-            }
-        except Exception as e:
-            print(f"❌ GPT error: {e}")
-            return self._mock_messages(lead)
 
-    # GPT calls
-    async def _generate_sms(self, lead: Dict, context: str, model: str) -> str:
-        prompt = f"""You are an expert insurance SDR writing a personalized SMS.
-
-Lead Info:
-{context}
+# ── Prompts ───────────────────────────────────────────────────────────────────
+# Static instructions (incl. booking link + signature) live in the system message and
+# never change between calls; only the lead context goes in the user message, last.
+SMS_PROMPT = prompts.register(PromptTemplate("sms", "2", system="""
+You are an expert insurance SDR writing a personalized SMS.
 
 Write one SHORT, friendly SMS (<= 160 chars) that:
 - Uses the lead's first name
@@ -146,20 +132,12 @@ Write one SHORT, friendly SMS (<= 160 chars) that:
 - Offers a clear, specific value (coverage review / savings)
 - Has a simple CTA to book a quick call
 
-Return ONLY the SMS text."""
-        resp = await self.client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=120,
-        )
-        return (resp.choices[0].message.content or "").strip()
+Return ONLY the SMS text.""", user="""
+Lead Info:
+{context}"""))
 
-    async def _generate_email(self, lead: Dict, context: str, model: str) -> Dict[str, str]:
-        prompt = f"""You are an expert insurance sales representative writing a personalized email.
-
-Lead Information:
-{context}
+EMAIL_PROMPT = prompts.register(PromptTemplate("email", "2", system=f"""
+You are an expert insurance sales representative writing a personalized email.
 
 Write a professional email that:
 1. Has a compelling subject line (max 50 chars)
@@ -184,42 +162,260 @@ Format your response EXACTLY like this:
 SUBJECT: [subject line]
 
 BODY:
-[email body]"""
-        resp = await self.client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=500,
-        )
-        raw = (resp.choices[0].message.content or "").strip()
-        parsed = _parse_subject_body(raw)
-
-        # Safety nets
-        subject = parsed.get("subject") or "Regarding your insurance coverage"
-        body = _ensure_link_and_signature(parsed.get("body", ""))
-
-        return {"subject": subject, "body": body}
-
-    async def _generate_linkedin(self, lead: Dict, context: str, model: str) -> str:
-        prompt = f"""Write a SHORT LinkedIn connection note (<= 200 chars).
+[email body]""", user="""
+Lead Information:
+{context}"""))
 
-Lead Info:
-{context}
+LINKEDIN_PROMPT = prompts.register(PromptTemplate("linkedin", "2", system="""
+Write a SHORT LinkedIn connection note (<= 200 chars).
 
 Rules:
 - Reference their company or role naturally
 - Friendly, professional, value-oriented
 - Single sentence is okay
-- Return ONLY the note text"""
-        resp = await self.client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=120,
+- Return ONLY the note text""", user="""
+Lead Info:
+{context}"""))
+
+REUSE_PROMPTS = (SMS_PROMPT, EMAIL_PROMPT, LINKEDIN_PROMPT)  # what a reusable generation was made from
+
+
+# ── Service ───────────────────────────────────────────────────────────────────
+class PersonalizationService:
+    def __init__(self):
+        # the SDK client is built on first use (or by the startup warm-up), not at import:
+        # importing openai alone costs ~0.7s of cold start
+        self._client = None
+        self.has_api_key = LLM_PROVIDER == "mock" or bool(OPENAI_KEY)
+        self.mode = "MOCK LLM (local)" if LLM_PROVIDER == "mock" else (
+            f"GPT-4x (model={MODEL})" if self.has_api_key else "MOCK")
+
+    @property
+    def client(self):
+        if self._client is None and self.has_api_key:
+            if LLM_PROVIDER == "mock":
+                # local deterministic stand-in: exercises the full GPT path without network
+                self._client = MockAsyncOpenAI()
+            else:
+                try:
+                    from openai import AsyncOpenAI  # openai >= 1.0
+                except Exception:  # pragma: no cover
+                    self.has_api_key = False
+                    self.mode = "MOCK"
+                    return None
+                # retries are owned by resilience.py, so turn off the SDK's own retry loop;
+                # connections come from the shared keep-alive pool
+                self._client = AsyncOpenAI(api_key=OPENAI_KEY, max_retries=0,
+                                           http_client=http_clients.get_async("openai"))
+        return self._client
+
+    @client.setter
+    def client(self, value) -> None:
+        self._client = value
+
+    def reset(self) -> None:
+        """Drop the SDK client (its connections belong to http_clients and are closed there)."""
+        self._client = None
+
+    # Public API
+    async def generate_messages(self, lead: Dict, force_model: Optional[str] = None, reuse: bool = True) -> Dict:
+        """
+        Returns dict with: sms, email{subject,body}, linkedin, context_used
+        (+ reused{similarity} when a look-alike lead's copy was adapted; reuse=False skips that)
+        """
+        if not self.has_api_key or not self.client:
+            return self._mock_messages(lead)
+
+        ctx = _build_context(lead)
+        model = force_model or MODEL
+        hit = self._reuse(lead, model) if reuse else None
+        if hit is not None:
+            return dict(hit, context_used=ctx)
+
+        # each artifact succeeds or falls back on its own: one failed call no longer
+        # throws away the other two results
+        sms, email, linkedin = await asyncio.gather(
+            self._generate_sms(lead, ctx, model),
+            self._generate_email(lead, ctx, model),
+            self._generate_linkedin(lead, ctx, model),
+            return_exceptions=True,
+        )
+        result = {"sms": sms, "email": email, "linkedin": linkedin, "context_used": ctx}
+        errors = {f: result[f] for f in ("sms", "email", "linkedin") if isinstance(result[f], BaseException)}
+        if not errors:
+            self._remember(lead, model, result)
+        return self._apply_fallbacks(lead, result, errors)
+
+    async def stream_messages(self, lead: Dict, force_model: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Streaming twin of generate_messages. Yields
+          {"type": "token", "artifact": "sms"|"email"|"linkedin", "delta": str}
+        as tokens arrive (the three completions interleave), then a single
+          {"type": "done", "messages": <generate_messages() shape, validated + signature-patched>}
+        """
+        ctx = _build_context(lead)
+        if not self.has_api_key or not self.client:
+            for event in _replay(self._mock_messages(lead)):
+                yield event
+            return
+
+        model = force_model or MODEL
+        hit = self._reuse(lead, model)
+        if hit is not None:
+            for event in _replay(dict(hit, context_used=ctx)):
+                yield event
+            return
+        specs = (
+            ("sms", SMS_PROMPT, 120),
+            ("email", EMAIL_PROMPT, 500),
+            ("linkedin", LINKEDIN_PROMPT, 120),
         )
+        raw: Dict[str, List[str]] = {artifact: [] for artifact, _, _ in specs}
+        errors: Dict[str, BaseException] = {}
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump(artifact: str, template: PromptTemplate, max_tokens: int) -> None:
+            try:
+                async for delta in self._stream_completion(template, model, template.render(context=ctx),
+                                                           max_tokens):
+                    raw[artifact].append(delta)
+                    await queue.put({"type": "token", "artifact": artifact, "delta": delta})
+            except Exception as e:
+                errors[artifact] = e
+            finally:
+                await queue.put(None)
+
+        tasks = [asyncio.create_task(pump(*spec)) for spec in specs]
+        try:
+            pending = len(tasks)
+            while pending:
+                event = await queue.get()
+                if event is None:
+                    pending -= 1
+                    continue
+                yield event
+        finally:
+            # client went away mid-stream -> stop paying for tokens nobody will read
+            for t in tasks:
+                t.cancel()
+
+        result = {
+            "sms": "".join(raw["sms"]).strip(),
+            "email": _finalize_email("".join(raw["email"])),
+            "linkedin": "".join(raw["linkedin"]).strip(),
+            "context_used": ctx,
+        }
+        if not errors:
+            self._remember(lead, model, result)
+        yield {"type": "done", "messages": self._apply_fallbacks(lead, result, errors)}
+
+    # Look-alike reuse (copy_reuse.py)
+    @staticmethod
+    def _reuse(lead: Dict, model: str) -> Optional[Dict]:
+        if not copy_reuse.COPY_REUSE_ENABLED:
+            return None
+        return copy_reuse.index.lookup(lead, _profile_context(lead), prompts.cache_space(model, *REUSE_PROMPTS))
+
+    @staticmethod
+    def _remember(lead: Dict, model: str, result: Dict) -> None:
+        if copy_reuse.COPY_REUSE_ENABLED:
+            copy_reuse.index.add(lead, _profile_context(lead), prompts.cache_space(model, *REUSE_PROMPTS), result)
+
+    def _apply_fallbacks(self, lead: Dict, result: Dict, errors: Dict[str, BaseException]) -> Dict:
+        mock: Optional[Dict] = None
+        for field, err in errors.items():
+            if not isinstance(err, Exception):
+                raise err  # cancellation etc.
+            print(f"❌ GPT error ({field}): {err}")
+            resilience.LLM_FALLBACKS.inc(field, resilience.fallback_reason(err))
+            mock = mock or self._mock_messages(lead)
+            result[field] = mock[field]
+        return result
+
+    # GPT calls
+    async def _generate_sms(self, lead: Dict, context: str, model: str) -> str:
+        resp = await self._complete(SMS_PROMPT, model, SMS_PROMPT.render(context=context), max_tokens=120)
+        return (resp.choices[0].message.content or "").strip()
+
+    async def _generate_email(self, lead: Dict, context: str, model: str) -> Dict[str, str]:
+        resp = await self._complete(EMAIL_PROMPT, model, EMAIL_PROMPT.render(context=context), max_tokens=500)
+        return _finalize_email(resp.choices[0].message.content or "")
+
+    async def _generate_linkedin(self, lead: Dict, context: str, model: str) -> str:
+        resp = await self._complete(LINKEDIN_PROMPT, model, LINKEDIN_PROMPT.render(context=context), max_tokens=120)
         return (resp.choices[0].message.content or "").strip()
 
-    # Mock fallback (no API key)
+    async def _complete(self, template: PromptTemplate, model: str, messages: List[Dict[str, str]],
+                        max_tokens: int):
+        async def attempt(timeout: float):
+            with metrics.llm_call(model, template.name) as call:
+                resp = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                    timeout=timeout,
+                )
+                call.record_usage(resp)
+                return resp
+
+        est = llm_scheduler.estimate_tokens(sum(len(m["content"]) for m in messages), max_tokens)
+        async with llm_scheduler.scheduler.slot(est) as grant:
+            resp = await resilience.call_async(attempt, name=template.name)
+            grant.record_usage(resp)
+            prompts.record_usage(template, model, resp)
+            return resp
+
+    async def _stream_completion(self, template: PromptTemplate, model: str, messages: List[Dict[str, str]],
+                                 max_tokens: int) -> AsyncIterator[str]:
+        async def open_stream(timeout: float):
+            return await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+            )
+
+        est = llm_scheduler.estimate_tokens(sum(len(m["content"]) for m in messages), max_tokens)
+        # the slot is held until the stream is drained (or abandoned)
+        async with llm_scheduler.scheduler.slot(est) as grant:
+            with metrics.llm_call(model, template.name) as call:
+                # retries/breaker apply to opening the stream; once tokens flow we can't replay them
+                stream = await resilience.call_async(open_stream, name=template.name)
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        call.record_usage(chunk)
+                        grant.record_usage(chunk)
+                        prompts.record_usage(template, model, chunk)
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            yield delta
+
+    # Offline batch requests (llm_batch.py): the same prompts as generate_messages, minus
+    # LinkedIn (not stored); results come back as raw completions hours later
+    BATCH_ARTIFACTS = (("sms", SMS_PROMPT, 120), ("email", EMAIL_PROMPT, 500))
+
+    def batch_requests(self, lead: Dict, model: Optional[str] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """(artifact, /v1/chat/completions body) pairs for one lead."""
+        ctx = _build_context(lead)
+        return [
+            (artifact, {"model": model or MODEL, "messages": template.render(context=ctx),
+                        "temperature": 0.7, "max_tokens": max_tokens})
+            for artifact, template, max_tokens in self.BATCH_ARTIFACTS
+        ]
+
+    @staticmethod
+    def finalize_batch_result(artifact: str, content: str) -> Dict[str, Optional[str]]:
+        """A batch completion as draft fields: {"subject", "body"} (SMS has no subject)."""
+        if artifact == "email":
+            return _finalize_email(content or "")
+        return {"subject": None, "body": (content or "").strip()}
+
+    # Mock fallback (no API key / provider failure)
     def _mock_messages(self, lead: Dict) -> Dict:
         name = _first_name(lead.get("name"))
         company = lead.get("company") or "your company"
@@ -0,0 +1,360 @@
+# backend/profiling.py
+"""
+On-demand request profiling (opt-in: PROFILING_ENABLED=true).
+
+A request is profiled when it carries `X-Profile: 1` or `?__profile=1`, or at
+random with PROFILING_SAMPLE_RATE. If PROFILING_TOKEN is set, a profiled request
+also needs a matching `X-Profile-Token`. The response gets an `X-Profile-Id` header
+and, for the length of the request:
+
+- spans: DB queries (SQLAlchemy cursor events), LLM calls (metrics.llm_call),
+  outbox writes and anything wrapped in `profiling.span()`, with start/end offsets
+- samples: a sampling thread records every thread's Python stack each
+  PROFILING_INTERVAL_MS. Time spent in serialization, file I/O or CPU work that has
+  no span shows up here. Concurrent requests in the same worker are sampled too
+  (threads are labelled)
+
+Each profile is written to PROFILING_DIR as `<id>.json` (summary + spans),
+`<id>.speedscope.json` (open in https://www.speedscope.app: a span timeline plus
+a sampled profile per thread) and `<id>.folded` (collapsed stacks for
+flamegraph.pl / inferno). The newest PROFILING_KEEP profiles are kept.
+GET /api/ops/profiles lists them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as _Tally, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from settings import settings
+
+PROFILING_ENABLED = settings.profiling_enabled
+PROFILING_SAMPLE_RATE = settings.profiling_sample_rate
+PROFILING_TOKEN = settings.profiling_token
+PROFILING_INTERVAL_MS = settings.profiling_interval_ms
+PROFILING_DIR = os.path.abspath(settings.profiling_dir)
+PROFILING_KEEP = settings.profiling_keep
+
+MAX_SPANS = 20000
+MAX_STACK_DEPTH = 128
+SQL_PREVIEW = 120
+
+_current: ContextVar[Optional["Profile"]] = ContextVar("solisa_profile", default=None)
+
+Span = Tuple[str, str, float, float]  # (kind, name, start, end), seconds from the request start
+
+
+# ── Recording ─────────────────────────────────────────────────────────────────
+def _idle_worker(stack: List[Tuple[str, str, int]]) -> bool:
+    """A thread-pool worker blocked on its job queue (leaf first)."""
+    if not stack or not stack[0][1].endswith(("threading.py", "queue.py")):
+        return False
+    pool = os.path.join("concurrent", "futures", "thread.py")
+    return any(f[1].endswith(pool) or "anyio" in f[1] for f in stack)
+
+
+class Profile:
+    def __init__(self, method: str, path: str):
+        self.id = f"{datetime.utcnow():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.method, self.path = method, path
+        self.started_at = datetime.utcnow()
+        self.t0 = time.perf_counter()
+        self.duration = 0.0
+        self.status = 0
+        self.closed = False
+        self.spans: List[Span] = []
+        self.samples: Dict[str, _Tally] = defaultdict(_Tally)  # thread -> stack (root first) -> count
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def add_span(self, kind: str, name: str, start: float, end: float) -> None:
+        if not self.closed and len(self.spans) < MAX_SPANS:
+            self.spans.append((kind, name, start - self.t0, end - self.t0))  # list.append is thread-safe
+
+    # sampling thread
+    def start_sampler(self) -> None:
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.id}", daemon=True)
+        self._sampler.start()
+
+    def _sample(self) -> None:
+        interval = PROFILING_INTERVAL_MS / 1000.0
+        while not self._stop.wait(interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if name.startswith("profiler-"):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                if _idle_worker(stack):
+                    continue
+                self.samples[name][tuple(reversed(stack))] += 1
+
+    def finish(self, status: int) -> None:
+        self.duration = time.perf_counter() - self.t0
+        self.status = status
+        self.closed = True
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    # output
+    def summary(self) -> Dict[str, Any]:
+        by_kind: Dict[str, Dict[str, float]] = {}
+        for kind, _, start, end in self.spans:
+            agg = by_kind.setdefault(kind, {"count": 0, "ms": 0.0})
+            agg["count"] += 1
+            agg["ms"] += (end - start) * 1000
+        for agg in by_kind.values():
+            agg["ms"] = round(agg["ms"], 2)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 2),
+            "spans_by_kind": by_kind,
+            "samples": sum(sum(t.values()) for t in self.samples.values()),
+            "interval_ms": PROFILING_INTERVAL_MS,
+        }
+
+    def _lanes(self) -> List[List[Span]]:
+        """
+        Spans split into properly nested lanes: an evented profile cannot hold
+        overlapping siblings (e.g. three LLM calls under asyncio.gather).
+        """
+        lanes: List[Tuple[List[Span], List[float]]] = []  # (spans, end times of the open spans)
+        for span in sorted(self.spans, key=lambda s: (s[2], -s[3])):
+            for spans, ends in lanes:
+                while ends and ends[-1] <= span[2]:
+                    ends.pop()
+                if not ends or span[3] <= ends[-1]:
+                    spans.append(span)
+                    ends.append(span[3])
+                    break
+            else:
+                lanes.append(([span], [span[3]]))
+        return [spans for spans, _ in lanes]
+
+    def speedscope(self) -> Dict[str, Any]:
+        frames: List[Dict[str, Any]] = []
+        index: Dict[Tuple, int] = {}
+
+        def frame(key: Tuple, **fields) -> int:
+            if key not in index:
+                index[key] = len(frames)
+                frames.append(fields)
+            return index[key]
+
+        end_ms = self.duration * 1000
+        profiles = []
+        for i, lane in enumerate(self._lanes()):
+            events = []
+            open_spans: List[Tuple[int, float]] = []
+            for kind, name, start, end in lane:
+                while open_spans and open_spans[-1][1] <= start:
+                    f, e = open_spans.pop()
+                    events.append({"type": "C", "frame": f, "at": e * 1000})
+                f = frame(("span", kind, name), name=f"{kind}: {name}")
+                events.append({"type": "O", "frame": f, "at": start * 1000})
+                open_spans.append((f, end))
+            while open_spans:
+                f, e = open_spans.pop()
+                events.append({"type": "C", "frame": f, "at": e * 1000})
+            profiles.append({"type": "evented", "name": "spans" if i == 0 else f"spans ({i + 1})",
+                             "unit": "milliseconds", "startValue": 0, "endValue": end_ms, "events": events})
+
+        for thread, stacks in sorted(self.samples.items()):
+            samples, weights = [], []
+            for stack, n in stacks.items():
+                samples.append([frame(("py",) + f, name=f[0], file=f[1], line=f[2]) for f in stack])
+                weights.append(n * PROFILING_INTERVAL_MS)
+            profiles.append({"type": "sampled", "name": f"samples: {thread}", "unit": "milliseconds",
+                             "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights})
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path} ({self.id})",
+            "exporter": "solisa-profiling",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def folded(self) -> str:
+        """Collapsed stacks (`thread;frame;frame count`), the flamegraph.pl input format."""
+        lines = []
+        for thread, stacks in sorted(self.samples.items()):
+            for stack, n in stacks.items():
+                path = ";".join([thread.replace(";", "_")] +
+                                [f"{name} ({os.path.basename(file)}:{line})" for name, file, line in stack])
+                lines.append(f"{path} {n}")
+        return "\n".join(lines) + "\n"
+
+    def save(self) -> None:
+        os.makedirs(PROFILING_DIR, exist_ok=True)
+        doc = dict(self.summary(), spans=[
+            {"kind": k, "name": n, "start_ms": round(s * 1000, 3), "ms": round((e - s) * 1000, 3)}
+            for k, n, s, e in self.spans
+        ])
+        for suffix, content in ((".speedscope.json", json.dumps(self.speedscope())),
+                                (".folded", self.folded()),
+                                (".json", json.dumps(doc))):  # summary last: it marks the profile complete
+            path = os.path.join(PROFILING_DIR, self.id + suffix)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+        _prune()
+
+
+def current() -> Optional[Profile]:
+    return _current.get()
+
+
+@contextmanager
+def span(kind: str, name: str = "") -> Iterator[None]:
+    """Record a span on the current request's profile (no-op when it isn't profiled)."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(kind, name, t0, time.perf_counter())
+
+
+# ── SQLAlchemy hook ───────────────────────────────────────────────────────────
+def instrument_engine(engine) -> None:
+    """Record each query as a "db" span of the profiled request that ran it."""
+    if not PROFILING_ENABLED or getattr(engine, "_solisa_profiled", False):
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("_p_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile, starts = _current.get(), conn.info.get("_p_start")
+        if profile is None or not starts:
+            return
+        name = " ".join(statement.split())[:SQL_PREVIEW]
+        profile.add_span("db", name + (" [many]" if executemany else ""), starts.pop(), time.perf_counter())
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(ctx):
+        starts = ctx.connection.info.get("_p_start") if ctx.connection is not None else None
+        if starts:
+            starts.pop()
+
+    engine._solisa_profiled = True
+
+
+# ── ASGI middleware ───────────────────────────────────────────────────────────
+def _wanted(scope) -> bool:
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers") or ()}
+    if PROFILING_TOKEN and headers.get("x-profile-token") != PROFILING_TOKEN:
+        return False
+    flag = headers.get("x-profile") or (parse_qs((scope.get("query_string") or b"").decode("latin-1"))
+                                         .get("__profile") or [""])[0]
+    if flag.lower() in ("1", "true", "yes"):
+        return True
+    return PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware; requests that are not profiled pay one header scan."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wanted(scope):
+            return await self.app(scope, receive, send)
+
+        profile = Profile(scope.get("method", ""), scope.get("path", ""))
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = dict(message, headers=list(message.get("headers") or [])
+                               + [(b"x-profile-id", profile.id.encode("latin-1"))])
+            await send(message)
+
+        token = _current.set(profile)
+        profile.start_sampler()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _current.reset(token)
+            profile.finish(status["code"])
+            route = scope.get("route")
+            profile.path = getattr(route, "path", None) or profile.path
+            try:
+                await asyncio.to_thread(profile.save)
+            except OSError as e:
+                print(f"⚠️ Could not write profile {profile.id}: {e}")
+
+
+# ── Stored profiles ───────────────────────────────────────────────────────────
+FORMATS = {"summary": ".json", "speedscope": ".speedscope.json", "folded": ".folded"}
+
+
+def _ids() -> List[str]:
+    """Ids of complete profiles, oldest first."""
+    if not os.path.isdir(PROFILING_DIR):
+        return []
+    return sorted(f[:-len(".json")] for f in os.listdir(PROFILING_DIR)
+                  if f.endswith(".json") and not f.endswith(".speedscope.json"))
+
+
+def _prune() -> None:
+    ids = _ids()
+    for old in ids[:-PROFILING_KEEP] if PROFILING_KEEP > 0 else ():
+        for suffix in FORMATS.values():
+            try:
+                os.remove(os.path.join(PROFILING_DIR, old + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit: int = 50) -> List[Dict[str, Any]]:
+    """Summaries of the stored profiles, newest first."""
+    out = []
+    for pid in reversed(_ids()[-limit:]):
+        try:
+            with open(os.path.join(PROFILING_DIR, pid + ".json"), encoding="utf-8") as f:
+                doc = json.load(f)
+        except (OSError, ValueError):
+            continue
+        doc.pop("spans", None)
+        out.append(doc)
+    return out
+
+
+def profile_path(profile_id: str, fmt: str = "summary") -> Optional[str]:
+    """File of a stored profile, or None (unknown id / format)."""
+    if fmt not in FORMATS or not profile_id.replace("-", "").isalnum():
+        return None
+    path = os.path.join(PROFILING_DIR, profile_id + FORMATS[fmt])
+    return path if os.path.exists(path) else None
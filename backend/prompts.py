@@ -0,0 +1,132 @@
+# backend/prompts.py
+"""
+Versioned, precompiled prompt templates.
+
+A template is a static system prompt plus a small user template that holds only
+the per-call data (lead fields, history). Static text always comes first and is
+byte-identical on every call. Providers that cache prompt prefixes (OpenAI: prompts
+over 1024 tokens, in 128-token steps) can then reuse it, and only the short
+variable tail is processed fresh.
+
+    SMS = prompts.register(PromptTemplate("personalize.sms", "2", system=..., user="Lead Info:\\n{context}"))
+    messages = SMS.render(context=ctx)
+
+`key` = name@version+content-hash, so editing a template (or the branding baked
+into it) changes every cache key derived from it (`cache_space()`: the copy_reuse
+index), even without a version bump.
+Usage is tallied per template: prompt tokens vs. cached prompt tokens
+(GET /api/ops/prompt-cache, solisa_llm_tokens_total{kind="cached"}).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import deque
+from datetime import datetime
+from string import Formatter
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import metrics
+
+PROMPT_REPORT_RECENT = 50  # per-call rows kept for the report
+
+
+class PromptTemplate:
+    def __init__(self, name: str, version: str, system: str, user: str):
+        self.name = name
+        self.version = version
+        self.system = system.strip()
+        self.user = user.strip()
+        # compile once: literal chunks + field names, so render() is a plain join
+        self._parts: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in Formatter().parse(self.user)
+        ]
+        self.fields = tuple(f for _, f in self._parts if f)
+        digest = hashlib.sha256(f"{self.system}\x00{self.user}".encode("utf-8")).hexdigest()[:8]
+        self.key = f"{name}@{version}+{digest}"
+        self._system_message = {"role": "system", "content": self.system}
+
+    def render(self, **values: Any) -> List[Dict[str, str]]:
+        user = "".join(lit + (str(values[f]) if f else "") for lit, f in self._parts)
+        return [self._system_message, {"role": "user", "content": user}]
+
+    def __repr__(self) -> str:
+        return f"<PromptTemplate {self.key}>"
+
+
+TEMPLATES: Dict[str, PromptTemplate] = {}
+
+
+def register(template: PromptTemplate) -> PromptTemplate:
+    TEMPLATES[template.name] = template
+    return template
+
+
+def get(name: str) -> PromptTemplate:
+    return TEMPLATES[name]
+
+
+def cache_space(model: str, *templates: PromptTemplate) -> str:
+    """Namespace for cached responses of `model` to `templates`: changes with any template's key."""
+    return "|".join([model, *(t.key for t in templates)])
+
+
+# ── Prefix-cache report ───────────────────────────────────────────────────────
+def cached_tokens(resp: Any) -> Tuple[int, int]:
+    """(prompt_tokens, cached prompt tokens) from an OpenAI-style usage block."""
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        cached = details.get("cached_tokens")
+    else:
+        cached = getattr(details, "cached_tokens", None)
+    return int(getattr(usage, "prompt_tokens", 0) or 0), int(cached or 0)
+
+
+class _Report:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, List[int]] = {}  # key -> [calls, prompt_tokens, cached_tokens]
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=PROMPT_REPORT_RECENT)
+
+    def record(self, template: PromptTemplate, model: str, resp: Any) -> None:
+        prompt, cached = cached_tokens(resp)
+        if not prompt:
+            return
+        metrics.LLM_TOKENS.inc(model, template.name, "cached", amount=cached)
+        with self._lock:
+            row = self._totals.setdefault(template.key, [0, 0, 0])
+            row[0] += 1
+            row[1] += prompt
+            row[2] += cached
+            self._recent.append({
+                "at": datetime.utcnow().isoformat(),
+                "template": template.key,
+                "model": model,
+                "prompt_tokens": prompt,
+                "cached_tokens": cached,
+                "cached_ratio": round(cached / prompt, 4),
+            })
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = {k: list(v) for k, v in self._totals.items()}
+            recent = list(self._recent)
+        return {
+            "templates": {
+                key: {"calls": calls, "prompt_tokens": prompt, "cached_tokens": cached,
+                      "cached_ratio": round(cached / prompt, 4) if prompt else None}
+                for key, (calls, prompt, cached) in totals.items()
+            },
+            "recent": recent,
+        }
+
+
+report = _Report()
+
+
+def record_usage(template: PromptTemplate, model: str, resp: Any) -> None:
+    report.record(template, model, resp)
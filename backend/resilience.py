@@ -0,0 +1,259 @@
+# backend/resilience.py
+"""
+Shared resilience layer for LLM calls (personalization + follow-up agent).
+
+- Per-attempt timeouts and an overall deadline (bounds tail latency)
+- Retries with exponential backoff + jitter that honor Retry-After
+- A circuit breaker that fails fast (callers fall back to mock copy) while the
+  provider is degraded
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import metrics
+import shared_state
+from settings import settings
+
+T = TypeVar("T")
+
+LLM_TIMEOUT_SEC = settings.llm_timeout_sec            # per attempt
+LLM_DEADLINE_SEC = settings.llm_deadline_sec          # whole call incl. retries
+LLM_MAX_RETRIES = settings.llm_max_retries
+LLM_BACKOFF_BASE_SEC = settings.llm_backoff_base_sec
+LLM_BACKOFF_MAX_SEC = settings.llm_backoff_max_sec
+LLM_BREAKER_FAILURES = settings.llm_breaker_failures  # consecutive failures to open
+LLM_BREAKER_RESET_SEC = settings.llm_breaker_reset_sec
+
+LLM_RETRIES = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_llm_retries_total", "LLM call retries", ("prompt", "reason"),
+))
+LLM_FALLBACKS = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_llm_fallbacks_total", "LLM results replaced by the mock fallback", ("prompt", "reason"),
+))
+LLM_BREAKER_OPEN = metrics.REGISTRY.register(metrics.Gauge(
+    "solisa_llm_breaker_open", "1 while the LLM circuit breaker is open", ("breaker",),
+))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the provider while the breaker is open."""
+
+
+# ── Error classification ──────────────────────────────────────────────────────
+def _status_code(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    # openai.APITimeoutError / APIConnectionError (matched by name: keeps openai import lazy)
+    if type(exc).__name__ in ("APITimeoutError", "APIConnectionError", "ReadTimeout", "ConnectTimeout"):
+        return True
+    code = _status_code(exc)
+    return code is not None and (code == 429 or code == 408 or code >= 500)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds to wait as requested by the provider (Retry-After / retry-after-ms), if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except Exception:
+            return None
+
+
+def _backoff(attempt: int) -> float:
+    return min(LLM_BACKOFF_MAX_SEC, LLM_BACKOFF_BASE_SEC * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+# ── Circuit breaker ───────────────────────────────────────────────────────────
+class CircuitBreaker:
+    """
+    closed -> open after N consecutive failures -> half-open probe after reset_sec.
+
+    Open/close transitions are broadcast through shared_state, so with several
+    workers one worker tripping the breaker makes all of them fail fast.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_sec: float = LLM_BREAKER_RESET_SEC, shared: bool = True):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_sec = reset_sec
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self._channel = f"breaker:{name}" if shared else None
+        if self._channel:
+            shared_state.state.subscribe(self._channel, self._on_remote)
+
+    def _broadcast(self, state: str) -> None:
+        if self._channel:
+            try:
+                shared_state.state.publish(self._channel, {"state": state})
+            except Exception as e:  # the breaker must keep working if the state store is down
+                print(f"⚠️ breaker broadcast failed: {e}")
+
+    def _on_remote(self, message) -> None:
+        if shared_state.is_own(message):
+            return
+        with self._lock:
+            if message.get("state") == "open":
+                self._opened_at = time.monotonic()
+                self._probing = False
+                LLM_BREAKER_OPEN.set(self.name, value=1)
+            elif message.get("state") == "closed":
+                self._failures = 0
+                self._opened_at = None
+                self._probing = False
+                LLM_BREAKER_OPEN.set(self.name, value=0)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_sec else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_sec or self._probing:
+                return False
+            self._probing = True  # let exactly one probe through
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            closed = self._opened_at is not None
+            if closed:
+                self._opened_at = None
+                LLM_BREAKER_OPEN.set(self.name, value=0)
+        if closed:
+            self._broadcast("closed")
+
+    def abort_probe(self) -> None:
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            opened = self._probing or (self._opened_at is None and self._failures >= self.failure_threshold)
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probing = False
+                LLM_BREAKER_OPEN.set(self.name, value=1)
+        if opened:
+            self._broadcast("open")
+
+
+# One breaker for the provider, shared by every LLM caller in the process
+llm_breaker = CircuitBreaker("openai")
+
+
+# ── Call wrappers ─────────────────────────────────────────────────────────────
+async def call_async(fn: Callable[[float], Awaitable[T]], *, name: str,
+                     breaker: CircuitBreaker = llm_breaker,
+                     timeout: float = LLM_TIMEOUT_SEC, retries: int = LLM_MAX_RETRIES,
+                     deadline: float = LLM_DEADLINE_SEC) -> T:
+    """
+    Run `fn(timeout)` with retries. `fn` receives the per-attempt timeout so it can pass it
+    to the SDK; asyncio.wait_for enforces it regardless.
+    """
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} circuit open")
+        remaining = deadline - (time.monotonic() - start)
+        per_try = max(0.01, min(timeout, remaining))
+        try:
+            result = await asyncio.wait_for(fn(per_try), per_try)
+        except asyncio.CancelledError:
+            breaker.abort_probe()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                # our request is wrong (400/401/...) — the provider itself answered
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            delay = retry_after(e)
+            delay = _backoff(attempt) if delay is None else delay
+            remaining = deadline - (time.monotonic() - start)
+            if attempt >= retries or delay >= remaining:
+                raise
+            LLM_RETRIES.inc(name, "429" if _status_code(e) == 429 else type(e).__name__)
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def call_sync(fn: Callable[[float], T], *, name: str,
+              breaker: CircuitBreaker = llm_breaker,
+              timeout: float = LLM_TIMEOUT_SEC, retries: int = LLM_MAX_RETRIES,
+              deadline: float = LLM_DEADLINE_SEC) -> T:
+    """Blocking twin of call_async; the timeout is enforced by the SDK via `fn(timeout)`."""
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} circuit open")
+        remaining = deadline - (time.monotonic() - start)
+        try:
+            result = fn(max(0.01, min(timeout, remaining)))
+        except Exception as e:
+            if not is_retryable(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            delay = retry_after(e)
+            delay = _backoff(attempt) if delay is None else delay
+            remaining = deadline - (time.monotonic() - start)
+            if attempt >= retries or delay >= remaining:
+                raise
+            LLM_RETRIES.inc(name, "429" if _status_code(e) == 429 else type(e).__name__)
+            attempt += 1
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def fallback_reason(exc: BaseException) -> str:
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    code = _status_code(exc)
+    return str(code) if code else type(exc).__name__
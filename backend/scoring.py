@@ -0,0 +1,340 @@
+# backend/scoring.py
+"""
+Lead scoring: who to contact next.
+
+Every lead gets a 0-100 score: a weighted sum of features computed in one
+vectorized NumPy pass per chunk of leads (keyset-paged by id, one transaction per chunk):
+
+  fit         company size, industry, enrichment status, how fresh the lead is
+  engagement  has inbound, replied to our last touch, how recent that reply is,
+              unanswered outbound (fatigue)
+  signals     intent / objections found by autopilot, stored in lead_scores
+
+Scores are written only when they moved by at least SCORING_MIN_DELTA, so most
+of a periodic rescore is reads. GET /api/leads?sort=score serves the stored column.
+
+    SCORING_WEIGHTS="intent:4,objections:-2"   # override single defaults
+    SCORING_INTERVAL_SEC=300                   # background rescore (one worker per interval)
+    python scoring.py --rescore
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import String, func, select, type_coerce
+from sqlalchemy.engine import Connection, Engine
+
+import metrics
+import shared_state
+from database import Lead, LeadActivity, LeadScore, engine
+from settings import settings
+
+SCORING_WEIGHTS = settings.scoring_weights
+SCORING_INDUSTRIES = settings.scoring_industries
+SCORING_HALF_LIFE_DAYS = settings.scoring_half_life_days
+SCORING_MIN_DELTA = settings.scoring_min_delta
+SCORING_CHUNK = settings.scoring_chunk
+SCORING_INTERVAL_SEC = settings.scoring_interval_sec
+
+SCORES = LeadScore.__table__
+
+FEATURES = ("size", "industry", "enriched", "fresh", "inbound", "replied",
+            "reply_recency", "unanswered", "intent", "objections")
+DEFAULT_WEIGHTS = {
+    "size": 1.0, "industry": 1.0, "enriched": 0.5, "fresh": 1.0,
+    "inbound": 1.5, "replied": 2.0, "reply_recency": 2.0, "unanswered": -1.0,
+    "intent": 3.0, "objections": -1.0,
+}
+INTENT_VALUES = {"ready_to_switch": 1.0, "considering": 0.5, "just_browsing": -0.5}
+SIZE_CAP = 1000      # employees at which the size feature saturates
+COUNT_CAP = 5        # inbound / outbound messages at which those features saturate
+
+SCORING_RUN_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "solisa_scoring_run_seconds", "Duration of full lead rescoring runs", (),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+))
+SCORES_WRITTEN = metrics.REGISTRY.register(metrics.Counter(
+    "solisa_scoring_scores_written_total", "Lead scores persisted (changed by at least SCORING_MIN_DELTA)", (),
+))
+
+
+def parse_pairs(spec: str) -> Dict[str, float]:
+    """"name:weight,..." (names may contain spaces, e.g. "Business Services:0.4")."""
+    out = {}
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = item.rpartition(":")
+        out[name.strip()] = float(value)
+    return out
+
+
+def weights_vector(overrides: Optional[Dict[str, float]] = None) -> np.ndarray:
+    weights = dict(DEFAULT_WEIGHTS)
+    for name, value in (overrides if overrides is not None else parse_pairs(SCORING_WEIGHTS)).items():
+        if name not in weights:
+            raise ValueError(f"unknown scoring feature {name!r} (known: {', '.join(FEATURES)})")
+        weights[name] = value
+    return np.array([weights[f] for f in FEATURES], dtype=np.float64)
+
+
+# ── Autopilot signals ─────────────────────────────────────────────────────────
+def detect_signals(context: str) -> Tuple[str, List[str]]:
+    """(intent, objections) from a lead's recent conversation text."""
+    lower_ctx = context.lower()
+    intent = "unknown"
+    if "ready" in lower_ctx or "let’s switch" in lower_ctx or "let's switch" in lower_ctx:
+        intent = "ready_to_switch"
+    elif "next month" in lower_ctx or "maybe" in lower_ctx:
+        intent = "considering"
+    elif "just browsing" in lower_ctx:
+        intent = "just_browsing"
+
+    objections = []
+    if "price" in lower_ctx or "too expensive" in lower_ctx:
+        objections.append("price")
+    if "claim" in lower_ctx:
+        objections.append("claims")
+    return intent, objections
+
+
+def _upsert(conn: Connection):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(SCORES)
+
+
+def record_signals(conn: Connection, lead_id: int, intent: str, objections: Sequence[str]) -> float:
+    """Store autopilot's read of the lead and rescore it right away. Returns the new score."""
+    return record_signals_many(conn, [(lead_id, intent, objections)]).get(lead_id, 0.0)
+
+
+def record_signals_many(conn: Connection, signals: Sequence[Tuple[int, str, Sequence[str]]]) -> Dict[int, float]:
+    """Bulk record_signals: one upsert and one rescore for all (lead_id, intent, objections)."""
+    if not signals:
+        return {}
+    stmt = _upsert(conn).values(signals_at=datetime.utcnow())
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[SCORES.c.lead_id],
+        set_={"intent": stmt.excluded.intent, "objections": stmt.excluded.objections,
+              "signals_at": stmt.excluded.signals_at},
+    ), [{"lead_id": lead_id, "intent": intent, "objections": ",".join(objections)}
+        for lead_id, intent, objections in signals])
+    return score_leads(conn, [lead_id for lead_id, _, _ in signals])
+
+
+# ── Feature extraction ────────────────────────────────────────────────────────
+def _raw(col):
+    """
+    Skip SQLAlchemy's per-row DateTime parsing: SQLite hands back ISO strings,
+    Postgres drivers datetime objects, and NumPy converts either in one call.
+    """
+    return type_coerce(col, String)
+
+
+def _feature_query():
+    a, s = LeadActivity.__table__.c, SCORES.c
+    return (
+        select(
+            Lead.id,
+            Lead.company_size,
+            Lead.industry,
+            Lead.enriched,
+            _raw(Lead.created_at),
+            func.coalesce(a.inbound_count, 0),
+            func.coalesce(a.outbound_count, 0),
+            _raw(a.last_inbound_at),
+            _raw(a.last_outbound_at),
+            s.intent,
+            s.objections,
+            s.score,
+        )
+        .select_from(Lead)
+        .outerjoin(LeadActivity, a.lead_id == Lead.id)
+        .outerjoin(SCORES, s.lead_id == Lead.id)
+    )
+
+
+def _lookup(values: Sequence[Optional[str]], fn) -> np.ndarray:
+    """Map a low-cardinality string column through `fn`, calling it once per distinct value."""
+    codes = {v: i for i, v in enumerate(dict.fromkeys(values))}
+    idx = np.fromiter(map(codes.__getitem__, values), dtype=np.intp, count=len(values))
+    return np.array([fn(v or "") for v in codes], dtype=np.float64)[idx]
+
+
+def _days(values: Sequence[Any], now: np.datetime64) -> np.ndarray:
+    """Age in days of a timestamp column; NaN where NULL."""
+    ts = np.array(values, dtype="datetime64[us]")
+    return (now - ts) / np.timedelta64(1, "D")
+
+
+def _size_value(text: str) -> float:
+    m = re.search(r"\d[\d,]*", text)
+    if not m:
+        return 0.0
+    return min(1.0, math.log1p(int(m.group().replace(",", ""))) / math.log1p(SIZE_CAP))
+
+
+def features(rows: Sequence[Sequence[Any]], now: datetime, industries: Dict[str, float],
+             half_life_days: float = SCORING_HALF_LIFE_DAYS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(lead ids, feature matrix [n x len(FEATURES)], stored scores with NaN for none) for query rows."""
+    cols = list(zip(*rows))
+    ids = np.array(cols[0], dtype=np.int64)
+    at = np.datetime64(now, "us")
+    # ages, so a later timestamp is a smaller number
+    created, last_in, last_out = (_days(cols[i], at) for i in (4, 7, 8))
+    inbound, outbound = (np.array(cols[i], dtype=np.float64) for i in (5, 6))
+    stored = np.array(cols[11], dtype=np.float64)
+
+    decay = math.log(2) / half_life_days
+    industries = {k.lower(): v for k, v in industries.items()}
+    replied = ~np.isnan(last_in) & (np.isnan(last_out) | (last_in <= last_out))
+
+    F = np.empty((len(ids), len(FEATURES)), dtype=np.float64)
+    F[:, 0] = _lookup(cols[1], _size_value)
+    F[:, 1] = _lookup(cols[2], lambda v: industries.get(v.lower(), 0.0))
+    F[:, 2] = _lookup(cols[3], lambda v: 1.0 if v == "success" else 0.0)
+    F[:, 3] = np.nan_to_num(np.exp(-decay * np.clip(created, 0, None)))
+    F[:, 4] = np.minimum(1.0, np.log1p(inbound) / math.log1p(COUNT_CAP))
+    F[:, 5] = replied
+    F[:, 6] = np.nan_to_num(np.exp(-decay * np.clip(last_in, 0, None)))
+    F[:, 7] = np.where(replied, 0.0, np.minimum(1.0, np.log1p(outbound) / math.log1p(COUNT_CAP)))
+    F[:, 8] = _lookup(cols[9], lambda v: INTENT_VALUES.get(v, 0.0))
+    F[:, 9] = _lookup(cols[10], lambda v: min(1.0, len([o for o in v.split(",") if o]) / 2))
+    return ids, F, stored
+
+
+def score_matrix(F: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Weighted sum scaled so that a lead maxing every positive feature scores 100."""
+    top = weights[weights > 0].sum() or 1.0
+    return np.round(np.clip(F @ weights / top, 0.0, 1.0) * 100.0, 1)
+
+
+# ── Persisting ────────────────────────────────────────────────────────────────
+def _write(conn: Connection, ids: np.ndarray, scores: np.ndarray, now: datetime) -> None:
+    if not len(ids):
+        return
+    stmt = _upsert(conn).values(scored_at=now)  # one value for the chunk, not a per-row parameter
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SCORES.c.lead_id],
+        set_={"score": stmt.excluded.score, "scored_at": stmt.excluded.scored_at},
+    )
+    conn.execute(stmt, [{"lead_id": i, "score": s} for i, s in zip(ids.tolist(), scores.tolist())])
+    SCORES_WRITTEN.inc(amount=len(ids))
+
+
+def _score_rows(conn: Connection, rows, weights: np.ndarray, now: datetime, min_delta: float) -> Tuple[np.ndarray, int]:
+    ids, F, stored = features(rows, now, parse_pairs(SCORING_INDUSTRIES))
+    scores = score_matrix(F, weights)
+    changed = np.isnan(stored) | (np.abs(scores - stored) >= min_delta)
+    _write(conn, ids[changed], scores[changed], now)
+    return scores, int(changed.sum())
+
+
+def score_leads(conn: Connection, lead_ids: Iterable[int]) -> Dict[int, float]:
+    """Rescore specific leads inside the caller's transaction (always written)."""
+    lead_ids = list(lead_ids)
+    if not lead_ids:
+        return {}
+    rows = conn.execute(_feature_query().where(Lead.id.in_(lead_ids))).all()
+    if not rows:
+        return {}
+    scores, _ = _score_rows(conn, rows, weights_vector(), datetime.utcnow(), min_delta=0.0)
+    return dict(zip((r[0] for r in rows), scores.tolist()))
+
+
+def rescore_all(engine: Engine, chunk: int = SCORING_CHUNK, min_delta: float = SCORING_MIN_DELTA,
+                weights: Optional[Dict[str, float]] = None, stop=None) -> Dict[str, Any]:
+    """
+    Rescore every lead, `chunk` leads per transaction. Safe to interrupt and rerun:
+    each chunk commits on its own. `stop` (a threading.Event) ends the run between chunks.
+    """
+    t0 = time.perf_counter()
+    w = weights_vector(weights)
+    now = datetime.utcnow()
+    last_id, scanned, written = 0, 0, 0
+    while stop is None or not stop.is_set():
+        with engine.begin() as conn:
+            q = _feature_query().where(Lead.id > last_id).order_by(Lead.id).limit(chunk)
+            rows = conn.execute(q).all()
+            if not rows:
+                break
+            _, n = _score_rows(conn, rows, w, now, min_delta)
+        scanned += len(rows)
+        written += n
+        last_id = rows[-1][0]
+    took = time.perf_counter() - t0
+    SCORING_RUN_SECONDS.observe(value=took)
+    return {"scanned": scanned, "written": written, "seconds": round(took, 3)}
+
+
+# ── Background rescoring ──────────────────────────────────────────────────────
+class Rescorer:
+    """Periodic rescore in a worker thread. With several workers, one claims each interval."""
+
+    def __init__(self, engine: Engine, interval: float = SCORING_INTERVAL_SEC):
+        self.engine = engine
+        self.interval = interval
+        self.last: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._job: Optional[asyncio.Future] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="lead-rescorer")
+
+    async def stop(self) -> None:
+        """Cancel the loop; a run in progress finishes its current chunk first."""
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if self._job is not None:
+            await asyncio.wait([self._job])
+        self._task = self._job = None
+
+    async def _run(self) -> None:
+        while True:
+            if shared_state.state.set("scoring:rescore", datetime.utcnow().isoformat(),
+                                      ttl=self.interval * 0.9, nx=True):
+                self._job = asyncio.ensure_future(asyncio.to_thread(rescore_all, self.engine, stop=self._stop))
+                try:
+                    self.last = await asyncio.shield(self._job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ Lead rescoring failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+rescorer = Rescorer(engine)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Recompute lead scores")
+    ap.add_argument("--rescore", action="store_true", help="score every lead (writes only changed scores)")
+    ap.add_argument("--full", action="store_true", help="write every score, even unchanged ones")
+    args = ap.parse_args()
+    if args.rescore:
+        SCORES.create(engine, checkfirst=True)
+        result = rescore_all(engine, min_delta=0.0 if args.full else SCORING_MIN_DELTA)
+        print(f"✅ scored {result['scanned']} leads ({result['written']} written) in {result['seconds']}s")
+    else:
+        ap.print_help()
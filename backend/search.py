@@ -0,0 +1,292 @@
+# backend/search.py
+"""
+Server-side full-text search over leads (name/company/email) and message text.
+
+- SQLite: FTS5 external-content tables kept in sync by triggers (bm25 ranking, snippet())
+- Postgres: stored tsvector columns + GIN indexes (ts_rank_cd, ts_headline)
+
+Message text may live in message_bodies (body_store.py), so the message index reads
+it through `messages_search` (SQLite view) / the messages_search_tsv() trigger.
+
+Both update incrementally on every INSERT/UPDATE/DELETE. The index is created on
+init_db(), lazily on first search, or explicitly with:  python search.py --rebuild
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import DateTime, event, text
+from sqlalchemy.engine import Connection, Engine
+
+SNIPPET_OPEN, SNIPPET_CLOSE = "<mark>", "</mark>"
+
+_ready: Dict[int, bool] = {}
+_ready_lock = threading.Lock()
+
+
+# ── DDL ───────────────────────────────────────────────────────────────────────
+# the text of a messages row: inline, or from message_bodies (inflate() is registered by database.py)
+_SQLITE_BODY = """CASE WHEN {row}.body_hash IS NULL THEN {row}.body ELSE (
+        SELECT coalesce(b.body, inflate(b.body_z)) FROM message_bodies b WHERE b.hash = {row}.body_hash) END"""
+_PG_BODY = """CASE WHEN {row}.body_hash IS NULL THEN {row}.body ELSE (
+        SELECT b.body FROM message_bodies b WHERE b.hash = {row}.body_hash) END"""
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5(
+        name, company, email, content='leads', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    f"""CREATE VIEW IF NOT EXISTS messages_search AS
+        SELECT m.id, m.subject, {_SQLITE_BODY.format(row="m")} AS body FROM messages m""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        subject, body, content='messages_search', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS leads_fts_ai AFTER INSERT ON leads BEGIN
+        INSERT INTO leads_fts(rowid, name, company, email) VALUES (new.id, new.name, new.company, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS leads_fts_ad AFTER DELETE ON leads BEGIN
+        INSERT INTO leads_fts(leads_fts, rowid, name, company, email)
+        VALUES ('delete', old.id, old.name, old.company, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS leads_fts_au AFTER UPDATE OF name, company, email ON leads BEGIN
+        INSERT INTO leads_fts(leads_fts, rowid, name, company, email)
+        VALUES ('delete', old.id, old.name, old.company, old.email);
+        INSERT INTO leads_fts(rowid, name, company, email) VALUES (new.id, new.name, new.company, new.email);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, subject, body) VALUES (new.id, new.subject, {_SQLITE_BODY.format(row="new")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, subject, body)
+        VALUES ('delete', old.id, old.subject, {_SQLITE_BODY.format(row="old")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF subject, body, body_hash ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, subject, body)
+        VALUES ('delete', old.id, old.subject, {_SQLITE_BODY.format(row="old")});
+        INSERT INTO messages_fts(rowid, subject, body) VALUES (new.id, new.subject, {_SQLITE_BODY.format(row="new")});
+    END""",
+]
+
+_PG_DDL = [
+    """ALTER TABLE leads ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(company, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(email, '')), 'C')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_leads_search_tsv ON leads USING GIN (search_tsv)",
+    # a trigger, not a generated column: the text may be in message_bodies
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_tsv tsvector",
+    "ALTER TABLE messages ALTER COLUMN search_tsv DROP EXPRESSION IF EXISTS",  # older DBs: generated
+    f"""CREATE OR REPLACE FUNCTION messages_search_tsv() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_tsv := setweight(to_tsvector('english', coalesce(NEW.subject, '')), 'A') ||
+                          setweight(to_tsvector('english', coalesce({_PG_BODY.format(row="NEW")}, '')), 'B');
+        RETURN NEW;
+    END $$""",
+    "DROP TRIGGER IF EXISTS messages_search_tsv ON messages",
+    """CREATE TRIGGER messages_search_tsv BEFORE INSERT OR UPDATE OF subject, body, body_hash ON messages
+        FOR EACH ROW EXECUTE FUNCTION messages_search_tsv()""",
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_tsv ON messages USING GIN (search_tsv)",
+]
+
+
+def _sqlite_exists(conn: Connection, name: str) -> bool:
+    return conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :n"), {"n": name}).first() is not None
+
+
+def _pg_has_column(conn: Connection, table: str, column: str) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = :t AND column_name = :c"
+    ), {"t": table, "c": column}).first() is not None
+
+
+def create_search_index(conn: Connection) -> None:
+    """Idempotent. A freshly created (or upgraded) index is back-filled from the base tables."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        fresh = not _sqlite_exists(conn, "messages_fts")
+        if not fresh and not _sqlite_exists(conn, "messages_search"):
+            # index from before message_bodies: it read messages.body directly
+            for name in ("messages_fts_ai", "messages_fts_ad", "messages_fts_au"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            conn.execute(text("DROP TABLE messages_fts"))
+            fresh = True
+        for ddl in _SQLITE_DDL:
+            conn.execute(text(ddl))
+        if fresh:
+            rebuild(conn)
+    elif dialect == "postgresql":
+        backfill = not _pg_has_column(conn, "messages", "search_tsv")
+        # the leads column is generated: computed for existing rows by the ALTER itself
+        for ddl in _PG_DDL:
+            conn.execute(text(ddl))
+        if backfill:
+            conn.execute(text("UPDATE messages SET subject = subject"))  # fires messages_search_tsv()
+
+
+def rebuild(conn: Connection) -> None:
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("INSERT INTO leads_fts(leads_fts) VALUES ('rebuild')"))
+        conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+    elif conn.dialect.name == "postgresql":
+        conn.execute(text("REINDEX INDEX ix_leads_search_tsv"))
+        conn.execute(text("REINDEX INDEX ix_messages_search_tsv"))
+
+
+def drop_search_index(conn: Connection) -> None:
+    """SQLite only: the FTS tables outlive their base tables (triggers go with them)."""
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("DROP TABLE IF EXISTS leads_fts"))
+        conn.execute(text("DROP TABLE IF EXISTS messages_fts"))
+
+
+def ensure_search_index(engine: Engine) -> None:
+    """Create the index once per process (cheap no-op afterwards)."""
+    key = id(engine)
+    if _ready.get(key):
+        return
+    with _ready_lock:
+        if _ready.get(key):
+            return
+        with engine.begin() as conn:
+            create_search_index(conn)
+        _ready[key] = True
+
+
+def install(metadata) -> None:
+    """Build the search index whenever tables are created via metadata.create_all()."""
+    @event.listens_for(metadata, "after_create")
+    def _after_create(target, connection, **kw):
+        create_search_index(connection)
+
+    @event.listens_for(metadata, "after_drop")
+    def _after_drop(target, connection, **kw):
+        drop_search_index(connection)
+        _ready.clear()
+
+
+# ── Querying ──────────────────────────────────────────────────────────────────
+_TOKEN = re.compile(r"[\w@.+-]+", re.UNICODE)
+
+
+def _tokens(q: str) -> List[str]:
+    out = []
+    for tok in _TOKEN.findall(q or ""):
+        # split emails/dotted words into their parts (the tokenizers index them that way)
+        out.extend(t for t in re.split(r"[@.+-]+", tok) if t)
+    return out[:16]
+
+
+def _fts5_query(tokens: List[str]) -> str:
+    # every term must match; last term is a prefix so search-as-you-type works
+    parts = ['"%s"' % t.replace('"', "") for t in tokens]
+    parts[-1] += "*"
+    return " ".join(parts)
+
+
+def _pg_query(tokens: List[str]) -> str:
+    parts = [re.sub(r"[^\w]", "", t) for t in tokens]
+    parts = [p for p in parts if p]
+    if parts:
+        parts[-1] += ":*"
+    return " & ".join(parts)
+
+
+def search_leads(conn: Connection, q: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    tokens = _tokens(q)
+    if not tokens:
+        return {"items": [], "has_more": False}
+    params = {"limit": limit + 1, "offset": offset}
+    if conn.dialect.name == "sqlite":
+        params["q"] = _fts5_query(tokens)
+        sql = f"""
+            SELECT l.id, l.name, l.email, l.company, l.status,
+                   bm25(leads_fts, 10.0, 5.0, 2.0) AS rank,
+                   snippet(leads_fts, -1, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '…', 12) AS snippet
+            FROM leads_fts JOIN leads l ON l.id = leads_fts.rowid
+            WHERE leads_fts MATCH :q
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset"""
+    else:
+        params["q"] = _pg_query(tokens)
+        sql = f"""
+            SELECT p.*, ts_headline('simple', concat_ws(' · ', p.name, p.company, p.email),
+                                    to_tsquery('simple', :q),
+                                    'StartSel={SNIPPET_OPEN}, StopSel={SNIPPET_CLOSE}') AS snippet
+            FROM (
+                SELECT id, name, email, company, status,
+                       ts_rank_cd(search_tsv, to_tsquery('simple', :q)) AS rank
+                FROM leads
+                WHERE search_tsv @@ to_tsquery('simple', :q)
+                ORDER BY rank DESC
+                LIMIT :limit OFFSET :offset
+            ) p ORDER BY p.rank DESC"""
+    rows = [dict(r._mapping) for r in conn.execute(text(sql), params)]
+    return {"items": rows[:limit], "has_more": len(rows) > limit}
+
+
+def search_messages(conn: Connection, q: str, limit: int = 20, offset: int = 0,
+                    lead_id: Optional[int] = None, channel: Optional[str] = None) -> Dict[str, Any]:
+    tokens = _tokens(q)
+    if not tokens:
+        return {"items": [], "has_more": False}
+    params: Dict[str, Any] = {"limit": limit + 1, "offset": offset}
+    filters = ""
+    if lead_id is not None:
+        filters += " AND m.lead_id = :lead_id"
+        params["lead_id"] = lead_id
+    if channel:
+        filters += " AND m.channel = :channel"
+        params["channel"] = channel
+
+    if conn.dialect.name == "sqlite":
+        params["q"] = _fts5_query(tokens)
+        sql = f"""
+            SELECT m.id, m.lead_id, m.direction, m.channel, m.subject, m.status, m.created_at,
+                   bm25(messages_fts, 4.0, 1.0) AS rank,
+                   snippet(messages_fts, -1, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '…', 16) AS snippet
+            FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH :q{filters}
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset"""
+    else:
+        params["q"] = _pg_query(tokens)
+        # rank + paginate on the GIN index first, build (expensive) headlines for the page only
+        sql = f"""
+            SELECT p.id, p.lead_id, p.direction, p.channel, p.subject, p.status, p.created_at, p.rank,
+                   ts_headline('english', coalesce(p.subject, '') || ' ' || {_PG_BODY.format(row="p")},
+                               to_tsquery('english', :q),
+                               'StartSel={SNIPPET_OPEN}, StopSel={SNIPPET_CLOSE}, MaxWords=30, MinWords=10') AS snippet
+            FROM (
+                SELECT m.id, m.lead_id, m.direction, m.channel, m.subject, m.status, m.created_at,
+                       m.body, m.body_hash, ts_rank_cd(m.search_tsv, to_tsquery('english', :q)) AS rank
+                FROM messages m
+                WHERE m.search_tsv @@ to_tsquery('english', :q){filters}
+                ORDER BY rank DESC
+                LIMIT :limit OFFSET :offset
+            ) p ORDER BY p.rank DESC"""
+    rows = []
+    # typed, so SQLite's text timestamps come back as datetimes too
+    for r in conn.execute(text(sql).columns(created_at=DateTime), params):
+        row = dict(r._mapping)
+        ts = row.get("created_at")
+        row["created_at"] = ts.isoformat() if ts is not None else None
+        rows.append(row)
+    return {"items": rows[:limit], "has_more": len(rows) > limit}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine
+
+    ap = argparse.ArgumentParser(description="Create / rebuild the full-text search index")
+    ap.add_argument("--rebuild", action="store_true", help="re-index all existing rows")
+    args = ap.parse_args()
+    with engine.begin() as conn:
+        create_search_index(conn)
+        if args.rebuild:
+            rebuild(conn)
+    print("✅ search index ready")
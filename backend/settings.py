@@ -0,0 +1,185 @@
+# backend/settings.py
+"""
+Typed application settings, loaded once per process.
+
+`.env` is read here (and only here) on first import, then every knob is parsed
+into one frozen Settings object. Modules keep their familiar constants
+(e.g. `resilience.LLM_TIMEOUT_SEC`) but take the values from `settings`, so
+config is consistent no matter which module is imported first.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, fields
+from typing import Optional
+
+from dotenv import load_dotenv
+
+
+def _bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "on", "yes")
+
+
+@dataclass(frozen=True)
+class Settings:
+    # Database
+    database_url: str = "sqlite:///./aegis.db"
+    db_auto_create: bool = True          # create missing tables/indexes in the app lifespan
+    db_warm_connections: int = 2         # pool connections opened during startup
+    database_replica_urls: str = ""      # comma-separated read replicas (db_router.py)
+    replica_sticky_sec: float = 5.0      # after a commit, that client reads from the primary this long
+    replica_retry_sec: float = 30.0      # a replica that failed is skipped this long
+    messages_partitioned: bool = False   # Postgres: monthly range partitions of messages (partitions.py)
+    messages_partitions_ahead: int = 3   # months of partitions kept created ahead of now
+
+    # LLM
+    llm_provider: str = "openai"         # openai | mock
+    openai_api_key: str = ""
+    openai_model: str = "gpt-4o-mini"
+    followup_model: str = "gpt-4o-mini"
+    llm_timeout_sec: float = 20.0
+    llm_deadline_sec: float = 30.0
+    llm_max_retries: int = 2
+    llm_backoff_base_sec: float = 0.5
+    llm_backoff_max_sec: float = 8.0
+    llm_breaker_failures: int = 5
+    llm_breaker_reset_sec: float = 30.0
+    llm_warm_client: bool = True         # build the LLM client in the background after startup
+    llm_max_concurrency: int = 32        # LLM calls in flight (llm_scheduler.py)
+    llm_tpm_budget: int = 0              # tokens per minute across all calls, 0 = unlimited
+    llm_queue_timeout_sec: float = 30.0
+    llm_tenant_weights: str = ""         # "tenant:weight,..." for fair queuing
+
+    # Branding / booking
+    calendly_url: str = ""
+    next_public_calendly_url: str = ""
+    sender_name: str = "XYZ"
+    sender_title: str = "Founder"
+    sender_company: str = "Solisa AI"
+    sender_phone: str = ""
+    sender_email: str = "mxxnesh@solisa.ai"
+
+    # Email
+    email_transport: str = "console"     # console | smtp
+    email_from: str = "noreply@solisa.ai"
+    smtp_host: str = ""
+    smtp_port: int = 587
+    smtp_user: str = ""
+    smtp_pass: str = ""
+
+    # SMS (Twilio)
+    twilio_account_sid: str = ""
+    twilio_auth_token: str = ""
+    twilio_from_number: str = ""
+    dry_run_sms: bool = True
+
+    # Enrichment
+    use_mock_enrichment: bool = True
+    mock_enrichment_latency_ms: float = 400.0
+    enrichment_seed: Optional[str] = None
+
+    # Follow-up agent
+    agent_self_api: str = "http://127.0.0.1:8010"
+    agent_autopilot: bool = True
+    agent_min_interval_sec: int = 30
+    followup_ctx_ttl_sec: float = 7 * 24 * 3600
+
+    # Outbound HTTP (shared pools, see http_clients.py)
+    http_max_connections: int = 100
+    http_max_keepalive: int = 50          # idle connections kept per pool; size for the usual burst
+    http_keepalive_expiry_sec: float = 30.0
+    http_connect_timeout_sec: float = 5.0
+    http_http2: bool = True              # used only when the `h2` package is installed
+
+    # Ops
+    metrics_enabled: bool = True
+    shared_state_backend: str = "memory"  # memory | db
+    shared_state_poll_ms: float = 250.0
+    shared_events_retention_sec: float = 300.0
+    ingest_flush_ms: float = 20.0
+    ingest_max_batch: int = 100
+    export_batch_rows: int = 2000
+    archive_dir: str = "./archive"
+    archive_policies: str = "note:*:30,*:draft:14,*:*:180"
+    archive_codec: str = "gzip"          # gzip | zstd
+    archive_batch: int = 5000
+
+    # Lead scoring (scoring.py)
+    scoring_weights: str = ""            # "feature:weight,..." overrides of the defaults
+    scoring_industries: str = "Technology:1,Finance:0.8,Healthcare:0.6,Business Services:0.4"
+    scoring_half_life_days: float = 14.0  # freshness / last-reply decay
+    scoring_min_delta: float = 0.5       # skip writes for scores that moved less than this
+    scoring_chunk: int = 50000
+    scoring_interval_sec: float = 300.0  # background rescore, 0 = off
+
+    # Near-duplicate leads (dedupe.py)
+    dedupe_threshold: float = 0.8        # pair score at which leads count as duplicates
+    dedupe_max_block: int = 200          # leads compared per blocking key
+    dedupe_ignore_phones: str = "+15550000000"  # placeholder numbers that must not link leads
+
+    # Autopilot sweep (autopilot.py)
+    sweep_batch: int = 200               # leads per checkpointed batch
+    sweep_concurrency: int = 16          # leads analyzed at once (LLM calls still go through llm_scheduler)
+    sweep_due_after_hours: float = 48.0  # quiet time after our last touch before a follow-up is due
+    sweep_max_age_days: float = 90.0     # threads quiet for longer are not swept
+    sweep_thread_limit: int = 12         # recent messages used as context
+
+    # Drafts (drafts.py)
+    draft_history_limit: int = 10        # replaced draft texts kept per lead + channel
+
+    # Content-addressed message bodies (body_store.py)
+    body_store_enabled: bool = False
+    body_store_min_bytes: int = 128      # shorter bodies stay inline
+    body_store_compress_bytes: int = 512  # SQLite: zlib above this (Postgres TOAST compresses on its own)
+
+    # Lead detail cache (lead_cache.py)
+    lead_cache_size: int = 2048          # leads kept serialized per worker; 0 disables
+    lead_cache_ttl_sec: float = 60.0     # bounds staleness if a cross-worker eviction is missed
+
+    # Look-alike copy reuse (copy_reuse.py)
+    copy_reuse_enabled: bool = False
+    copy_reuse_threshold: float = 0.92   # cosine similarity of the lead profiles
+    copy_reuse_max_entries: int = 5000   # generations kept per model
+
+    # Offline batch generation (llm_batch.py)
+    batch_dir: str = "./batches"         # exported request files + downloaded results
+    batch_model: str = ""                # defaults to OPENAI_MODEL
+    batch_ingest_rows: int = 1000        # result lines per ingest transaction
+    batch_poll_sec: float = 60.0         # `--run --wait` polling interval
+
+    # Request profiling (profiling.py)
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.0   # fraction of requests profiled without X-Profile
+    profiling_token: str = ""            # if set, X-Profile-Token must match
+    profiling_interval_ms: float = 5.0   # stack sampling interval
+    profiling_dir: str = "./profiles"
+    profiling_keep: int = 50             # newest profiles kept on disk
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Each field is read from the upper-cased env var of the same name."""
+        values = {}
+        for f in fields(cls):
+            raw = os.getenv(f.name.upper())
+            if raw is None:
+                continue
+            kind = f.type if isinstance(f.type, str) else f.type.__name__
+            if kind == "bool":
+                values[f.name] = _bool(raw)
+            elif kind == "int":
+                values[f.name] = int(raw)
+            elif kind == "float":
+                values[f.name] = float(raw)
+            elif f.name in _LOWERCASE:
+                values[f.name] = raw.strip().lower()
+            else:
+                values[f.name] = raw.strip()
+        return cls(**values)
+
+
+_LOWERCASE = {"llm_provider", "email_transport", "shared_state_backend", "archive_codec"}
+
+
+load_dotenv()
+settings = Settings.from_env()
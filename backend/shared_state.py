@@ -0,0 +1,301 @@
+# backend/shared_state.py
+"""
+Process-shared state: TTL keys, atomic counters and pub/sub.
+
+- memory (default): a dict + locks; correct for a single uvicorn worker
+- db: `shared_state` / `shared_events` tables in the app database, so every
+  worker (`uvicorn --workers N`, several hosts) sees the same keys and events
+
+    SHARED_STATE_BACKEND=db   SHARED_STATE_POLL_MS=250
+
+Values are JSON-serializable. Counters are plain integer values, so `incr` and
+`get` work on the same key.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import (Column, DateTime, Integer, MetaData, String, Table, Text, and_, case, cast, delete,
+                        func, or_, select)
+from sqlalchemy.engine import Engine
+
+from settings import settings
+
+SHARED_STATE_BACKEND = settings.shared_state_backend  # memory | db
+SHARED_STATE_POLL_MS = settings.shared_state_poll_ms
+SHARED_EVENTS_RETENTION_SEC = settings.shared_events_retention_sec
+
+# identifies this process in published events, so publishers can skip their own echo
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+# the poller re-reads this many ids below the newest one it has seen: Postgres hands
+# out serial ids before commit, so an event can become visible after a higher one
+EVENT_ID_OVERLAP = 500
+
+Callback = Callable[[Dict[str, Any]], None]
+
+
+class MemoryState:
+    """Single-process implementation."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._subs: Dict[str, List[Callback]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return item
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._live(key)
+            return default if item is None else item[0]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Live values of `keys`; missing/expired keys are left out."""
+        with self._lock:
+            return {k: item[0] for k in keys if (item := self._live(k)) is not None}
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        """Store `value`; with nx=True only if the key is absent/expired. Returns whether it was set."""
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return False
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomic add; a missing key starts at 0 (and gets `ttl`, if given)."""
+        with self._lock:
+            item = self._live(key)
+            value = (int(item[0]) if item else 0) + amount
+            expires = item[1] if item else (time.monotonic() + ttl if ttl else None)
+            self._data[key] = (value, expires)
+            return value
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        payload = dict(message, _origin=INSTANCE_ID)
+        with self._lock:
+            subs = list(self._subs.get(channel, ()))
+        for cb in subs:
+            _deliver(cb, payload)
+
+    def subscribe(self, channel: str, callback: Callback) -> None:
+        with self._lock:
+            self._subs[channel].append(callback)
+
+    def ensure(self) -> None:
+        pass
+
+    def start(self) -> None:
+        pass
+
+
+_metadata = MetaData()
+STATE = Table(
+    "shared_state", _metadata,
+    Column("key", String, primary_key=True),
+    Column("value", Text, nullable=False),
+    Column("expires_at", DateTime, nullable=True, index=True),
+)
+EVENTS = Table(
+    "shared_events", _metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("channel", String, nullable=False, index=True),
+    Column("payload", Text, nullable=False),
+    Column("created_at", DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+class DBState:
+    """
+    Multi-process implementation on the app database. Single-statement upserts keep
+    set-nx / incr atomic. Pub/sub is an append-only events table that a daemon
+    thread polls (started by `start()` in the app lifespan), so delivery lags by
+    up to SHARED_STATE_POLL_MS.
+
+    Nothing touches the database at import: the tables are created by `ensure()`
+    (lifecycle.prepare_database, or the first call that needs them).
+    """
+
+    def __init__(self, engine: Engine, poll_ms: float = SHARED_STATE_POLL_MS):
+        self.engine = engine
+        self.poll_sec = poll_ms / 1000.0
+        self._ready = False
+        self._ddl_lock = threading.Lock()
+        self._subs: Dict[str, List[Callback]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._poller: Optional[threading.Thread] = None
+        self._high = 0                # newest event id seen
+        self._seen: Set[int] = set()  # delivered ids within EVENT_ID_OVERLAP of it
+
+    def ensure(self) -> None:
+        if self._ready:
+            return
+        with self._ddl_lock:
+            if not self._ready:
+                _metadata.create_all(self.engine)
+                self._ready = True
+
+    def _insert(self):
+        if self.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert(STATE)
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[datetime]:
+        return datetime.utcnow() + timedelta(seconds=ttl) if ttl else None
+
+    @staticmethod
+    def _alive(now: datetime):
+        return or_(STATE.c.expires_at.is_(None), STATE.c.expires_at > now)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self.ensure()
+        with self.engine.connect() as conn:
+            raw = conn.execute(
+                select(STATE.c.value).where(STATE.c.key == key, self._alive(datetime.utcnow()))
+            ).scalar()
+        return default if raw is None else json.loads(raw)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        self.ensure()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(STATE.c.key, STATE.c.value).where(STATE.c.key.in_(keys), self._alive(datetime.utcnow()))
+            ).all()
+        return {k: json.loads(v) for k, v in rows}
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        now = datetime.utcnow()
+        stmt = self._insert().values(key=key, value=json.dumps(value), expires_at=self._expiry(ttl))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[STATE.c.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+            # nx: only take over a key whose previous value has expired
+            where=and_(STATE.c.expires_at.isnot(None), STATE.c.expires_at <= now) if nx else None,
+        )
+        self.ensure()
+        with self.engine.begin() as conn:
+            return conn.execute(stmt).rowcount > 0
+
+    def delete(self, key: str) -> None:
+        self.ensure()
+        with self.engine.begin() as conn:
+            conn.execute(delete(STATE).where(STATE.c.key == key))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = datetime.utcnow()
+        expired = and_(STATE.c.expires_at.isnot(None), STATE.c.expires_at <= now)
+        stmt = self._insert().values(key=key, value=str(amount), expires_at=self._expiry(ttl))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[STATE.c.key],
+            set_={
+                # an expired counter restarts from zero with a fresh ttl
+                "value": cast(case((expired, amount), else_=cast(STATE.c.value, Integer) + amount), String),
+                "expires_at": case((expired, stmt.excluded.expires_at), else_=STATE.c.expires_at),
+            },
+        ).returning(STATE.c.value)
+        self.ensure()
+        with self.engine.begin() as conn:
+            return int(conn.execute(stmt).scalar_one())
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        payload = json.dumps(dict(message, _origin=INSTANCE_ID))
+        now = datetime.utcnow()
+        self.ensure()
+        with self.engine.begin() as conn:
+            conn.execute(EVENTS.insert().values(channel=channel, payload=payload, created_at=now))
+            conn.execute(delete(EVENTS).where(EVENTS.c.created_at < now - timedelta(seconds=SHARED_EVENTS_RETENTION_SEC)))
+
+    def subscribe(self, channel: str, callback: Callback) -> None:
+        with self._lock:
+            self._subs[channel].append(callback)
+
+    def start(self) -> None:
+        """Start delivering events published from now on (idempotent)."""
+        with self._lock:
+            if self._poller is not None:
+                return
+            self.ensure()
+            with self.engine.connect() as conn:
+                self._high = conn.execute(select(func.max(EVENTS.c.id))).scalar() or 0
+                self._seen = set(conn.execute(
+                    select(EVENTS.c.id).where(EVENTS.c.id > self._high - EVENT_ID_OVERLAP)
+                ).scalars())
+            self._poller = threading.Thread(target=self._poll, name="shared-state-poller", daemon=True)
+            self._poller.start()
+
+    def _fetch(self, channels: List[str]) -> List[Tuple[int, str, str]]:
+        """Unseen events from the overlap window up, oldest first."""
+        with self.engine.connect() as conn:
+            ids = [i for i in conn.execute(
+                select(EVENTS.c.id).where(EVENTS.c.id > self._high - EVENT_ID_OVERLAP, EVENTS.c.channel.in_(channels))
+            ).scalars() if i not in self._seen]
+            if not ids:
+                return []
+            return conn.execute(
+                select(EVENTS.c.id, EVENTS.c.channel, EVENTS.c.payload).where(EVENTS.c.id.in_(ids)).order_by(EVENTS.c.id)
+            ).all()
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(self.poll_sec)
+            try:
+                with self._lock:
+                    channels = list(self._subs)
+                rows = self._fetch(channels) if channels else []
+            except Exception as e:
+                print(f"⚠️ shared-state poll failed: {e}")
+                continue
+            for event_id, channel, payload in rows:
+                self._seen.add(event_id)
+                self._high = max(self._high, event_id)
+                with self._lock:
+                    subs = list(self._subs.get(channel, ()))
+                message = json.loads(payload)
+                for cb in subs:
+                    _deliver(cb, message)
+            if rows:
+                self._seen = {i for i in self._seen if i > self._high - EVENT_ID_OVERLAP}
+
+
+def _deliver(cb: Callback, message: Dict[str, Any]) -> None:
+    try:
+        cb(message)
+    except Exception as e:  # one bad subscriber must not break the others
+        print(f"⚠️ shared-state subscriber error: {e}")
+
+
+def is_own(message: Dict[str, Any]) -> bool:
+    return message.get("_origin") == INSTANCE_ID
+
+
+def _build():
+    if SHARED_STATE_BACKEND == "db":
+        from database import engine
+        return DBState(engine)
+    return MemoryState()
+
+
+state = _build()
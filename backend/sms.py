@@ -1,19 +1,12 @@
-import os
-from dotenv import load_dotenv
+import http_clients
+from settings import settings
 
-load_dotenv()
+ACCOUNT_SID = settings.twilio_account_sid
+AUTH_TOKEN = settings.twilio_auth_token
+FROM_NUMBER = settings.twilio_from_number
+DRY_RUN = settings.dry_run_sms
 
-try:
-    from twilio.rest import Client  # type: ignore
-except Exception:
-    Client = None  # handled below
-
-ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
-AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
-FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER", "")
-DRY_RUN = os.getenv("DRY_RUN_SMS", "true").lower() == "true"
-
-_twilio_client = Client(ACCOUNT_SID, AUTH_TOKEN) if (ACCOUNT_SID and AUTH_TOKEN and Client) else None
+TWILIO_API = "https://api.twilio.com/2010-04-01"
 
 
 def send_sms(to: str, body: str) -> dict:
@@ -21,13 +14,17 @@ def send_sms(to: str, body: str) -> dict:
     Sends an SMS via Twilio (or logs if DRY_RUN=true or no client configured).
     Returns a dict with sid/status/to.
     """
-    if DRY_RUN or not _twilio_client:
+    if DRY_RUN or not (ACCOUNT_SID and AUTH_TOKEN):
         print(f"📤 [DRY RUN] Would send SMS to {to}: {body}")
         return {"sid": "dry_run", "status": "queued", "to": to}
 
-    msg = _twilio_client.messages.create(
-        to=to,
-        from_=FROM_NUMBER,
-        body=body,
+    # plain REST call on the shared keep-alive pool (the twilio SDK opens its own session)
+    r = http_clients.get_sync("twilio").post(
+        f"{TWILIO_API}/Accounts/{ACCOUNT_SID}/Messages.json",
+        data={"To": to, "From": FROM_NUMBER, "Body": body},
+        auth=(ACCOUNT_SID, AUTH_TOKEN),
+        timeout=15,
     )
-    return {"sid": msg.sid, "status": msg.status, "to": msg.to}
+    r.raise_for_status()
+    msg = r.json()
+    return {"sid": msg["sid"], "status": msg["status"], "to": msg["to"]}
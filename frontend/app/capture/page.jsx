@@ -1,7 +1,7 @@
 'use client';
 
 import { useState } from 'react';
-import { Loader2, Mail, Check, Copy, Calendar } from 'lucide-react';
+import { Loader2, Mail, Check, Copy, Calendar, Users } from 'lucide-react';
 
 const API = process.env.NEXT_PUBLIC_API_BASE || 'http://127.0.0.1:8010';
 const CALENDLY = process.env.NEXT_PUBLIC_CALENDLY_URL || 'https://calendly.com/your-handle/intro-call';
@@ -42,6 +42,7 @@ export default function CapturePage() {
   const [status, setStatus] = useState('');
   const [error, setError] = useState('');
   const [copied, setCopied] = useState(null);
+  const [duplicates, setDuplicates] = useState(null); // near matches the backend found (409)
 
   const copy = (text, which) => {
     navigator.clipboard.writeText(text || '');
@@ -49,12 +50,44 @@ export default function CapturePage() {
     setTimeout(() => setCopied(null), 1500);
   };
 
+  // POST /capture; on a near-duplicate (409) shows the matches and returns null
+  async function captureLead(force) {
+    const r = await fetch(`${API}/api/leads/capture${force ? '?force=true' : ''}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ name, email, phone }),
+    });
+    if (r.status === 409) {
+      const data = await r.json().catch(() => ({}));
+      setDuplicates(data?.detail?.duplicates || []);
+      return null;
+    }
+    if (!r.ok) throw new Error(`Capture failed: ${r.status} ${await r.text()}`);
+    return r.json();
+  }
+
+  // Create the lead anyway, then fold it into the existing one
+  async function mergeInto(existingId) {
+    const created = await captureLead(true);
+    setStatus('Merging into the existing lead…');
+    const rm = await fetch(`${API}/api/leads/${existingId}/merge`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ duplicate_ids: [created.id] }),
+    });
+    if (!rm.ok) throw new Error(`Merge failed: ${rm.status} ${await rm.text()}`);
+    const rl = await fetch(`${API}/api/leads/${existingId}`);
+    if (!rl.ok) throw new Error(`Loading lead failed: ${rl.status} ${await rl.text()}`);
+    return rl.json();
+  }
+
   async function runPipeline(e) {
     e.preventDefault();
     setError('');
     setStatus('');
     setMessages(null);
     setLead(null);
+    setDuplicates(null);
 
     const ok = window.confirm(
       `Capture and personalize outreach for:\n\n` +
@@ -70,19 +103,32 @@ export default function CapturePage() {
       `\nProceed?`
     );
     if (!ok) return;
+    await pipeline(() => captureLead(false));
+  }
+
+  // Duplicate panel actions
+  function createAnyway() {
+    setDuplicates(null);
+    return pipeline(() => captureLead(true));
+  }
 
+  function mergeWith(existingId) {
+    setDuplicates(null);
+    return pipeline(() => mergeInto(existingId));
+  }
+
+  async function pipeline(getLead) {
+    setError('');
     try {
       setSubmitting(true);
       setStatus('Capturing lead…');
 
       // 1) Capture (backend only requires name/email/phone)
-      const r1 = await fetch(`${API}/api/leads/capture`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ name, email, phone }),
-      });
-      if (!r1.ok) throw new Error(`Capture failed: ${r1.status} ${await r1.text()}`);
-      const leadObj = await r1.json();
+      const leadObj = await getLead();
+      if (!leadObj) {
+        setStatus('');
+        return; // near duplicates: the user picks merge or create anyway
+      }
       setLead(leadObj);
 
       // 2) Personalize (GPT)
@@ -301,6 +347,49 @@ export default function CapturePage() {
           {error && <p className="text-sm text-red-600">{error}</p>}
         </form>
 
+        {/* Near-duplicate leads: merge into one of them, or create anyway */}
+        {duplicates && (
+          <div className="mt-6 bg-amber-50 dark:bg-gray-800 rounded-lg border border-amber-300 dark:border-amber-700 p-6">
+            <h2 className="text-lg font-semibold text-gray-900 dark:text-white mb-1 inline-flex items-center gap-2">
+              <Users className="h-5 w-5" /> This looks like an existing lead
+            </h2>
+            <p className="text-sm text-gray-600 dark:text-gray-400 mb-4">
+              Merge the new details into one of these, or create a separate lead.
+            </p>
+            <ul className="space-y-2 mb-4">
+              {duplicates.map((d) => (
+                <li key={d.lead_id} className="flex items-center justify-between gap-3 text-sm">
+                  <span className="text-gray-900 dark:text-gray-100">
+                    {d.name} &lt;{d.email}&gt;
+                    <span className="ml-2 text-gray-500">
+                      {Math.round(d.score * 100)}% • {(d.reasons || []).join(', ')}
+                    </span>
+                  </span>
+                  <span className="flex gap-2 shrink-0">
+                    <a href={`/leads/${d.lead_id}`} className="text-blue-600 hover:text-blue-700">Open</a>
+                    <button
+                      type="button"
+                      disabled={submitting}
+                      onClick={() => mergeWith(d.lead_id)}
+                      className="rounded-md bg-blue-600 hover:bg-blue-700 text-white font-semibold px-3 py-1 disabled:opacity-60"
+                    >
+                      Merge
+                    </button>
+                  </span>
+                </li>
+              ))}
+            </ul>
+            <button
+              type="button"
+              disabled={submitting}
+              onClick={createAnyway}
+              className="rounded-lg bg-gray-100 dark:bg-gray-700 text-gray-900 dark:text-gray-100 font-semibold px-4 py-2 disabled:opacity-60"
+            >
+              Create anyway
+            </button>
+          </div>
+        )}
+
         {/* Preview & Actions */}
         {lead && messages && (
           <div className="mt-8 space-y-6">
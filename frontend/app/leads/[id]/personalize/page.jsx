@@ -36,16 +36,55 @@ export default function PersonalizePage() {
   async function generateMessages() {
     setLoading(true);
     try {
-      const res = await fetch(`${API}/api/leads/${leadId}/personalize`, { method: 'POST' });
-      const data = await res.json();
-      setMessages(data.messages);
+      await streamMessages();
     } catch (e) {
-      console.error('Error generating messages:', e);
+      console.error('Streaming failed, falling back:', e);
+      try {
+        const res = await fetch(`${API}/api/leads/${leadId}/personalize`, { method: 'POST' });
+        const data = await res.json();
+        setMessages(data.messages);
+      } catch (err) {
+        console.error('Error generating messages:', err);
+      }
     } finally {
       setLoading(false);
     }
   }
 
+  // Reads the SSE stream: `token` events fill the cards as they arrive, `done` swaps in the final copy.
+  async function streamMessages() {
+    const res = await fetch(`${API}/api/leads/${leadId}/personalize/stream`, { method: 'POST' });
+    if (!res.ok || !res.body) throw new Error(`Stream failed: ${res.status}`);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    const draft = { sms: '', email: '', linkedin: '' };
+    let buffer = '';
+    let finished = false;
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const frames = buffer.split('\n\n');
+      buffer = frames.pop();
+      for (const frame of frames) {
+        const event = frame.match(/^event: (.*)$/m)?.[1];
+        const data = frame.match(/^data: (.*)$/m)?.[1];
+        if (!data) continue;
+        const payload = JSON.parse(data);
+        if (event === 'token') {
+          draft[payload.artifact] += payload.delta;
+          setMessages(previewFromDraft(draft));
+        } else if (event === 'done') {
+          setMessages(payload.messages);
+          finished = true;
+        }
+      }
+    }
+    if (!finished) throw new Error('Stream ended before completion');
+  }
+
   const copyToClipboard = (text, type) => {
     navigator.clipboard.writeText(text);
     setCopied(type);
@@ -194,6 +233,17 @@ export default function PersonalizePage() {
   );
 }
 
+// Raw email tokens arrive as "SUBJECT: ...\n\nBODY:\n..." until the final event
+function previewFromDraft(draft) {
+  const subject = draft.email.match(/SUBJECT:\s*(.*)/)?.[1] || '';
+  const bodyIdx = draft.email.indexOf('BODY:');
+  return {
+    sms: draft.sms,
+    email: { subject, body: bodyIdx >= 0 ? draft.email.slice(bodyIdx + 5).trimStart() : '' },
+    linkedin: draft.linkedin,
+  };
+}
+
 function MessageCard({ title, content, copied, onCopy }) {
   return (
     <div className="bg-white dark:bg-gray-800 rounded-lg shadow-sm border border-gray-200 dark:border-gray-700 p-6">
@@ -29,12 +29,44 @@ export default function LeadsPage() {
     fetchLeads();
   }, []);
 
-  const filteredLeads = leads.filter((lead) =>
+  // Ranked ids from the server-side full-text index (null = not searched / unavailable)
+  const [matchIds, setMatchIds] = useState(null);
+
+  useEffect(() => {
+    const q = searchQuery.trim();
+    if (!q) {
+      setMatchIds(null);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const params = new URLSearchParams({ q, type: 'leads', limit: '100' });
+        const res = await fetch(`${API}/api/search?${params}`, { signal: controller.signal });
+        if (!res.ok) throw new Error(`search failed: ${res.status}`);
+        const data = await res.json();
+        setMatchIds((data.leads?.items || []).map((item) => item.id));
+      } catch (e) {
+        if (e.name !== 'AbortError') setMatchIds(null);
+      }
+    }, 200);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [searchQuery]);
+
+  const localMatches = leads.filter((lead) =>
     (lead.name || '').toLowerCase().includes(searchQuery.toLowerCase()) ||
     (lead.email || '').toLowerCase().includes(searchQuery.toLowerCase()) ||
     (lead.company || '').toLowerCase().includes(searchQuery.toLowerCase())
   );
 
+  const byId = new Map(leads.map((lead) => [lead.id, lead]));
+  const filteredLeads = searchQuery.trim() && matchIds
+    ? matchIds.map((id) => byId.get(id)).filter(Boolean)
+    : localMatches;
+
   const stats = {
     total: leads.length,
     enriched: leads.filter((l) => l.enriched === 'success').length,